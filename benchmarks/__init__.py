@@ -0,0 +1,7 @@
+"""
+Benchmarks for puffy.
+
+``python -m benchmarks`` runs the suite of core operations and the HTTP load
+test and can compare them with a stored baseline; the ``bench_*`` modules
+are focused comparisons, run with ``python -m benchmarks.<name>``.
+"""
@@ -0,0 +1,107 @@
+"""
+Benchmark suite for the image operations and the HTTP routes.
+
+    python -m benchmarks ops [--sizes 640x480,1920x1080] [--dtypes uint8]
+    python -m benchmarks http [--concurrency 8] [--requests 200]
+    python -m benchmarks all --save-baseline benchmarks/baseline.json
+    python -m benchmarks all --compare benchmarks/baseline.json
+
+With ``--compare`` the exit status is 1 if any metric regressed by more than
+``--tolerance``.
+"""
+
+import argparse
+import sys
+from pathlib import Path
+
+from . import baseline, load, suite
+from ._timing import report
+
+
+def _size(value: str) -> tuple[int, int]:
+    width, _, height = value.partition("x")
+    return int(width), int(height)
+
+
+def _sizes(value: str) -> list[tuple[int, int]]:
+    return [_size(v) for v in value.split(",")]
+
+
+def _print_ops(results: dict[str, float]) -> None:
+    report(
+        [(name, f"{seconds * 1e3:.2f}") for name, seconds in results.items()],
+        ("operation", "ms"),
+    )
+
+
+def _print_http(results: dict[str, dict[str, float]]) -> None:
+    rows = []
+    for name, stats in results.items():
+        if name == "process":
+            continue
+        rows.append(
+            (
+                name,
+                str(int(stats["requests"])),
+                str(int(stats["errors"])),
+                f"{stats['throughput']:.1f}",
+                *(f"{stats[p] * 1e3:.1f}" for p in ("p50", "p95", "p99")),
+            )
+        )
+    report(rows, ("route", "requests", "errors", "req/s", "p50 ms", "p95 ms", "p99 ms"))
+    print(f"peak RSS: {results['process']['peak_rss'] / 2**20:.0f} MiB")
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(
+        prog="python -m benchmarks",
+        description=__doc__,
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+    )
+    parser.add_argument("suite", choices=["ops", "http", "all"])
+    parser.add_argument(
+        "--sizes",
+        type=_sizes,
+        default=suite.SIZES,
+        help="image sizes for ops, e.g. 640x480,1920x1080",
+    )
+    parser.add_argument("--dtypes", type=lambda v: v.split(","), default=suite.DTYPES)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--match", default="", help="only run names containing this")
+    parser.add_argument("--http-size", type=_size, default=(1920, 1080))
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--save-baseline", type=Path)
+    parser.add_argument("--compare", type=Path)
+    parser.add_argument("--tolerance", type=float, default=0.2)
+    args = parser.parse_args(argv)
+
+    results: dict = {}
+    if args.suite in ("ops", "all"):
+        results["ops"] = suite.run(args.sizes, args.dtypes, args.repeat, args.match)
+        _print_ops(results["ops"])
+    if args.suite in ("http", "all"):
+        results["http"] = load.run(
+            args.http_size, args.concurrency, args.requests, args.match
+        )
+        _print_http(results["http"])
+
+    if args.save_baseline:
+        baseline.save(results, args.save_baseline)
+        print(f"saved baseline to {args.save_baseline}")
+    if args.compare:
+        changes, regressions = baseline.compare(
+            baseline.load(args.compare), results, args.tolerance
+        )
+        print(f"\ncompared {len(changes)} metrics with {args.compare}")
+        for change in regressions:
+            print(
+                f"REGRESSION {change.metric}: {change.baseline:.4g} -> "
+                f"{change.current:.4g} ({change.ratio:.2f}x worse)"
+            )
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,73 @@
+"""
+Storing benchmark results and comparing new runs against them.
+
+A baseline is a JSON object mapping metric names to numbers. Lower is better
+for every metric except those listed in ``HIGHER_IS_BETTER``.
+"""
+
+from __future__ import annotations
+
+import json
+from dataclasses import dataclass
+from pathlib import Path
+
+HIGHER_IS_BETTER = ("throughput",)
+# Metrics that describe the run rather than its performance.
+IGNORED = ("requests", "errors")
+
+
+def flatten(results: dict, prefix: str = "") -> dict[str, float]:
+    """Turns nested results into ``{"group/metric": value}``."""
+    flat = {}
+    for key, value in results.items():
+        name = f"{prefix}/{key}" if prefix else key
+        if isinstance(value, dict):
+            flat |= flatten(value, name)
+        elif not name.endswith(IGNORED):
+            flat[name] = float(value)
+    return flat
+
+
+def save(results: dict, path: Path) -> None:
+    path.write_text(json.dumps(flatten(results), indent=2, sort_keys=True) + "\n")
+
+
+def load(path: Path) -> dict[str, float]:
+    return json.loads(path.read_text())
+
+
+@dataclass(frozen=True)
+class Change:
+    metric: str
+    baseline: float
+    current: float
+
+    @property
+    def ratio(self) -> float:
+        """How many times worse the current value is; below 1 is an improvement."""
+        if self.metric.endswith(HIGHER_IS_BETTER):
+            return self.baseline / self.current if self.current else float("inf")
+        return self.current / self.baseline if self.baseline else float("inf")
+
+
+def compare(
+    baseline: dict[str, float], results: dict, tolerance: float = 0.2
+) -> tuple[list[Change], list[Change]]:
+    """
+    Compares results with a baseline.
+
+    Args:
+        baseline: A loaded baseline.
+        results: New results, nested or flat.
+        tolerance: Relative slowdown allowed before a metric counts as a
+            regression, e.g. 0.2 for 20%.
+
+    Returns:
+        All changes for metrics present in both, and the subset that regressed.
+    """
+    current = flatten(results)
+    changes = [
+        Change(metric, baseline[metric], current[metric])
+        for metric in sorted(current.keys() & baseline.keys())
+    ]
+    return changes, [c for c in changes if c.ratio > 1 + tolerance]
@@ -0,0 +1,67 @@
+"""
+Times each blur type across kernel sizes against a direct OpenCV call with
+the same kernel, and reports which strategy the engine picked.
+
+    python -m benchmarks.bench_blur
+"""
+
+import cv2
+import numpy as np
+
+from puffy.core import blur
+
+from ._timing import best_of, report
+
+KERNEL_SIZES = [3, 5, 15, 31, 51, 101, 151, 301]
+DIRECT = {
+    "gaussian": lambda image, k: cv2.GaussianBlur(image, (k, k), 0),
+    "average": lambda image, k: cv2.blur(image, (k, k)),
+    "median": lambda image, k: cv2.medianBlur(image, k),
+}
+
+
+def main() -> None:
+    rng = np.random.default_rng(0)
+    image = rng.integers(0, 256, (1080, 1920, 3), dtype=np.uint8)
+    rows = []
+    for blur_type, direct in DIRECT.items():
+        for k in KERNEL_SIZES:
+            reference = direct(image, k)
+            result = blur.blur(image, blur_type, k)
+            error = np.abs(result.astype(np.int16) - reference).mean()
+            repeat = 1 if blur_type == "median" and k > 5 else 5
+            before = best_of(
+                lambda direct=direct, k=k: direct(image, k), repeat=repeat, number=1
+            )
+            after = best_of(
+                lambda blur_type=blur_type, k=k: blur.blur(image, blur_type, k),
+                repeat=repeat,
+                number=1,
+            )
+            rows.append(
+                (
+                    blur_type,
+                    str(k),
+                    blur.choose_strategy(blur_type, k),
+                    f"{before * 1e3:.1f}",
+                    f"{after * 1e3:.1f}",
+                    f"{before / after:.1f}x",
+                    f"{error:.2f}",
+                )
+            )
+    report(
+        rows,
+        (
+            "blur",
+            "kernel",
+            "strategy",
+            "direct ms",
+            "engine ms",
+            "speedup",
+            "mean error",
+        ),
+    )
+
+
+if __name__ == "__main__":
+    main()
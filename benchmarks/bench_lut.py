@@ -0,0 +1,86 @@
+"""
+Compares the lookup-table point operations against the previous per-pixel
+implementation (float math, split, int16 widening, clip and merge).
+
+    python -m benchmarks.bench_lut
+"""
+
+import cv2
+import numpy as np
+
+from puffy.core import adjustments
+from puffy.core.lut import apply_lut, compile_lut
+
+from ._timing import best_of, report
+
+SIZES = [(640, 480), (1920, 1080), (4000, 3000)]
+
+
+def legacy_brightness_contrast(image, brightness=0, contrast=1.0):
+    adjusted = cv2.convertScaleAbs(image, alpha=contrast, beta=brightness)
+    return adjusted.astype(np.uint8)
+
+
+def legacy_color_balance(image, red=0, green=0, blue=0):
+    b, g, r = cv2.split(image)
+    b = np.clip(b.astype(np.int16) + blue, 0, 255).astype(np.uint8)
+    g = np.clip(g.astype(np.int16) + green, 0, 255).astype(np.uint8)
+    r = np.clip(r.astype(np.int16) + red, 0, 255).astype(np.uint8)
+    return cv2.merge([b, g, r]).astype(np.uint8)
+
+
+def main() -> None:
+    rng = np.random.default_rng(0)
+    rows = []
+    for width, height in SIZES:
+        image = rng.integers(0, 256, (height, width, 3), dtype=np.uint8)
+
+        cases = {
+            "brightness_contrast": (
+                lambda image=image: legacy_brightness_contrast(image, 20, 1.3),
+                lambda image=image: adjustments.adjust_brightness_contrast(
+                    image, 20, 1.3
+                ),
+            ),
+            "color_balance": (
+                lambda image=image: legacy_color_balance(image, 10, -5, 30),
+                lambda image=image: adjustments.adjust_color_balance(image, 10, -5, 30),
+            ),
+            "chain_of_both": (
+                lambda image=image: legacy_color_balance(
+                    legacy_brightness_contrast(image, 20, 1.3), 10, -5, 30
+                ),
+                lambda image=image: apply_lut(
+                    image,
+                    compile_lut(
+                        [
+                            (
+                                "adjust_brightness_contrast",
+                                {"brightness": 20, "contrast": 1.3},
+                            ),
+                            (
+                                "adjust_color_balance",
+                                {"red": 10, "green": -5, "blue": 30},
+                            ),
+                        ]
+                    ),
+                ),
+            ),
+        }
+        for name, (legacy, new) in cases.items():
+            assert np.array_equal(legacy(), new())
+            before, after = best_of(legacy), best_of(new)
+            rows.append(
+                (
+                    f"{width}x{height}",
+                    name,
+                    f"{before * 1e3:.2f}",
+                    f"{after * 1e3:.2f}",
+                    f"{before / after:.1f}x",
+                )
+            )
+    report(rows, ("size", "operation", "legacy ms", "lut ms", "speedup"))
+
+
+if __name__ == "__main__":
+    main()
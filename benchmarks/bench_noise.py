@@ -0,0 +1,76 @@
+"""
+Compares the chunked float32 noise engine against the previous whole-frame
+float64 implementation, in time and peak temporary memory.
+
+    python -m benchmarks.bench_noise
+"""
+
+import numpy as np
+
+from puffy.core import noise
+
+from ._timing import best_of, peak_memory, report
+
+SIZES = [(640, 480), (1920, 1080), (4000, 3000)]
+
+
+def legacy_gaussian(image, intensity=0.1, seed=None):
+    rng = np.random.default_rng(seed)
+    sigma = (intensity * 255) ** 0.5
+    gauss = rng.normal(0, sigma, image.shape)
+    return np.clip(image + gauss, 0, 255).astype(np.uint8)
+
+
+def legacy_salt_pepper(image, intensity=0.1, seed=None):
+    rng = np.random.default_rng(seed)
+    noisy = np.copy(image)
+    count = int(np.ceil(intensity * image.size * 0.5))
+    coords = [rng.integers(0, i, count) for i in image.shape]
+    noisy[coords[0], coords[1], :] = 255
+    coords = [rng.integers(0, i, count) for i in image.shape]
+    noisy[coords[0], coords[1], :] = 0
+    return noisy.astype(np.uint8)
+
+
+def main() -> None:
+    rng = np.random.default_rng(0)
+    rows = []
+    for width, height in SIZES:
+        image = rng.integers(0, 256, (height, width, 3), dtype=np.uint8)
+        cases = {
+            "gaussian": lambda image=image: legacy_gaussian(image, 0.1, 1),
+            "salt_pepper": lambda image=image: legacy_salt_pepper(image, 0.1, 1),
+            "poisson": None,
+            "speckle": None,
+        }
+        for name, legacy in cases.items():
+            new = lambda name=name, image=image: noise.add_noise(  # noqa: E731
+                image, name, 0.1, seed=1
+            )
+            after, after_peak = best_of(new), peak_memory(new)
+            if legacy is None:
+                before, before_peak = "-", "-"
+            else:
+                before = f"{best_of(legacy) * 1e3:.1f}"
+                before_peak = f"{peak_memory(legacy) / image.nbytes:.1f}x"
+            rows.append(
+                (
+                    f"{width}x{height}",
+                    name,
+                    before,
+                    f"{after * 1e3:.1f}",
+                    before_peak,
+                    f"{after_peak / image.nbytes:.1f}x",
+                )
+            )
+    report(
+        rows,
+        ("size", "model", "legacy ms", "chunked ms", "legacy peak", "chunked peak"),
+    )
+    print(
+        "peak: memory allocated during the call, including the result, in image sizes"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,136 @@
+"""
+In-process HTTP load test of the image routes.
+
+Concurrent clients drive the FastAPI app through httpx's ASGI transport, so
+the numbers include routing, form parsing, the worker pool and templating
+but no network.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import resource
+import time
+from collections.abc import Awaitable, Callable
+
+import numpy as np
+from httpx import ASGITransport, AsyncClient, Response
+
+from puffy.core import io
+
+Scenario = Callable[[AsyncClient, str], Awaitable[Response]]
+
+
+def _image_id(html: str) -> str:
+    return html.split('value="')[1].split('"')[0]
+
+
+async def _upload(client: AsyncClient, data: bytes) -> str:
+    response = await client.post("/upload", files={"file": ("bench.png", data)})
+    response.raise_for_status()
+    return _image_id(response.text)
+
+
+SCENARIOS: dict[str, Scenario] = {
+    "GET /preview": lambda c, i: c.get(f"/preview/{i}"),
+    "GET /image": lambda c, i: c.get(f"/image/{i}"),
+    "POST /adjust-brightness-contrast (preview)": lambda c, i: c.post(
+        "/adjust-brightness-contrast",
+        data={"image_id": i, "brightness": 10, "contrast": 1.1, "preview": "true"},
+    ),
+    "POST /blur (preview)": lambda c, i: c.post(
+        "/blur", data={"image_id": i, "kernel_size": 15, "preview": "true"}
+    ),
+    "POST /resize": lambda c, i: c.post(
+        "/resize", data={"image_id": i, "width": 800, "height": 600}
+    ),
+    "POST /download": lambda c, i: c.post(
+        "/download", data={"image_id": i, "format": "jpeg", "quality": 90}
+    ),
+}
+
+
+def _percentile(latencies: list[float], q: float) -> float:
+    return float(np.percentile(latencies, q)) if latencies else float("nan")
+
+
+async def _run_scenario(
+    client: AsyncClient,
+    scenario: Scenario,
+    data: bytes,
+    concurrency: int,
+    requests: int,
+) -> dict[str, float]:
+    # Each client edits its own upload so operations that consume their
+    # input image do not interfere.
+    image_ids = [await _upload(client, data) for _ in range(concurrency)]
+    latencies: list[float] = []
+    errors = 0
+    remaining = requests
+
+    async def worker(image_id: str) -> None:
+        nonlocal remaining, errors
+        while remaining > 0:
+            remaining -= 1
+            start = time.perf_counter()
+            response = await scenario(client, image_id)
+            latencies.append(time.perf_counter() - start)
+            if response.status_code >= 400:
+                errors += 1
+            elif response.headers["content-type"].startswith("text/html"):
+                # Edits replace their input, so continue from the new version
+                image_id = _image_id(response.text)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker(image_id) for image_id in image_ids))
+    elapsed = time.perf_counter() - start
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "throughput": len(latencies) / elapsed,
+        "p50": _percentile(latencies, 50),
+        "p95": _percentile(latencies, 95),
+        "p99": _percentile(latencies, 99),
+    }
+
+
+def peak_rss() -> int:
+    """Peak resident set size of this process in bytes."""
+    usage = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return usage * 1024  # kilobytes on Linux
+
+
+async def _run(
+    size: tuple[int, int], concurrency: int, requests: int, match: str
+) -> dict[str, dict[str, float]]:
+    from main import app
+
+    rng = np.random.default_rng(0)
+    image = rng.integers(0, 256, (size[1], size[0], 3), dtype=np.uint8)
+    data = io.encode_image(image, ".png", png_compression=1)
+    results = {}
+    transport = ASGITransport(app=app)
+    async with AsyncClient(transport=transport, base_url="http://bench") as client:
+        for name, scenario in SCENARIOS.items():
+            if match in name:
+                results[name] = await _run_scenario(
+                    client, scenario, data, concurrency, requests
+                )
+    results["process"] = {"peak_rss": peak_rss()}
+    return results
+
+
+def run(
+    size: tuple[int, int] = (1920, 1080),
+    concurrency: int = 8,
+    requests: int = 200,
+    match: str = "",
+) -> dict[str, dict[str, float]]:
+    """
+    Load-tests every route scenario in turn.
+
+    Returns:
+        Per scenario: request and error counts, throughput in requests per
+        second and latency percentiles in seconds; plus the peak RSS.
+    """
+    return asyncio.run(_run(size, concurrency, requests, match))
@@ -0,0 +1,160 @@
+"""
+Timings of every public function in transform, adjustments, effects and io.
+"""
+
+from __future__ import annotations
+
+import tempfile
+from collections.abc import Callable
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any
+
+import numpy as np
+
+from puffy.core import adjustments, effects, io, transform
+
+from ._timing import best_of
+
+SIZES = [(640, 480), (1920, 1080), (4000, 3000)]
+DTYPES = ["uint8", "float32"]
+
+
+@dataclass(frozen=True)
+class Case:
+    name: str
+    run: Callable[[np.ndarray], Any]
+    dtypes: tuple[str, ...] = ("uint8",)  # the point operations are 8-bit only
+
+
+def _io_cases(workdir: Path) -> list[Case]:
+    cases = []
+    for ext in (".jpg", ".png", ".webp"):
+        cases.append(
+            Case(
+                f"io.encode_image{ext}",
+                lambda image, ext=ext: io.encode_image(image, ext),
+            )
+        )
+
+        def decode(image: np.ndarray, ext: str = ext) -> Any:
+            return io.decode_image(_encoded(image, ext))
+
+        cases.append(Case(f"io.decode_image{ext}", decode))
+    for ext in (".png", ".npy"):
+        path = workdir / f"image{ext}"
+        cases.append(
+            Case(
+                f"io.save_image{ext}",
+                lambda image, path=path: io.save_image(image, path),
+            )
+        )
+
+        def load(image: np.ndarray, path: Path = path) -> Any:
+            if not path.exists():
+                io.save_image(image, path)
+            return io.load_image(path)
+
+        cases.append(Case(f"io.load_image{ext}", load))
+    return cases
+
+
+_ENCODED: dict[tuple[int, str], bytes] = {}
+
+
+def _encoded(image: np.ndarray, ext: str) -> bytes:
+    # Encode once per image so decode timings do not include the encoder.
+    key = (id(image), ext)
+    if key not in _ENCODED:
+        _ENCODED[key] = io.encode_image(image, ext)
+    return _ENCODED[key]
+
+
+def cases(workdir: Path) -> list[Case]:
+    both = ("uint8", "float32")
+    return [
+        Case(
+            "transform.resize",
+            lambda im: transform.resize(im, im.shape[1] // 2, im.shape[0] // 2),
+            both,
+        ),
+        Case("transform.rotate", lambda im: transform.rotate(im, 30), both),
+        Case(
+            "transform.crop",
+            lambda im: transform.crop(im, 10, 10, im.shape[1] // 2, im.shape[0] // 2),
+            both,
+        ),
+        Case("transform.flip", lambda im: transform.flip(im, True, True), both),
+        Case(
+            "adjustments.adjust_brightness_contrast",
+            lambda im: adjustments.adjust_brightness_contrast(im, 20, 1.2),
+        ),
+        Case(
+            "adjustments.adjust_color_balance",
+            lambda im: adjustments.adjust_color_balance(im, 10, -5, 30),
+        ),
+        Case("adjustments.adjust_gamma", lambda im: adjustments.adjust_gamma(im, 1.8)),
+        Case(
+            "adjustments.adjust_levels",
+            lambda im: adjustments.adjust_levels(im, 20, 230, 1.2),
+        ),
+        Case(
+            "adjustments.apply_curve",
+            lambda im: adjustments.apply_curve(im, [(0, 0), (128, 160), (255, 255)]),
+        ),
+        *(
+            Case(
+                f"effects.add_noise.{model}",
+                lambda im, model=model: effects.add_noise(im, model, 0.1, seed=1),
+            )
+            for model in ("gaussian", "salt_pepper", "poisson", "speckle")
+        ),
+        *(
+            Case(
+                f"effects.blur.{kind}.{k}",
+                lambda im, kind=kind, k=k: effects.blur(im, kind, k),
+                dtypes,
+            )
+            for kind, dtypes in (
+                ("gaussian", both),
+                ("average", both),
+                ("median", ("uint8",)),
+            )
+            for k in (5, 31)
+        ),
+        *_io_cases(workdir),
+    ]
+
+
+def make_image(width: int, height: int, dtype: str) -> np.ndarray:
+    rng = np.random.default_rng(0)
+    image = rng.integers(0, 256, (height, width, 3), dtype=np.uint8)
+    return image if dtype == "uint8" else image.astype(dtype)
+
+
+def run(
+    sizes: list[tuple[int, int]] = SIZES,
+    dtypes: list[str] = DTYPES,
+    repeat: int = 5,
+    match: str = "",
+) -> dict[str, float]:
+    """
+    Times every case on every size and dtype it supports.
+
+    Returns:
+        Seconds per call keyed by ``"<case>[<width>x<height>,<dtype>]"``.
+    """
+    results = {}
+    with tempfile.TemporaryDirectory() as workdir:
+        all_cases = [c for c in cases(Path(workdir)) if match in c.name]
+        for width, height in sizes:
+            for dtype in dtypes:
+                image = make_image(width, height, dtype)
+                for case in all_cases:
+                    if dtype in case.dtypes:
+                        key = f"{case.name}[{width}x{height},{dtype}]"
+                        results[key] = best_of(
+                            lambda case=case, image=image: case.run(image), repeat, 1
+                        )
+                _ENCODED.clear()
+    return results
@@ -1,12 +1,26 @@
+import asyncio
+from collections.abc import AsyncIterator
+from contextlib import asynccontextmanager
 from pathlib import Path
 
 from fastapi import FastAPI
 from fastapi.staticfiles import StaticFiles
 
 from puffy.config import BASE_DIR, UPLOAD_DIR
-from puffy.routers import image, ui, vector
+from puffy.instrumentation import instrument_request
+from puffy.routers import batch, image, metrics, ui, vector
+from puffy.vector_store import vector_store
 
-app = FastAPI()
+
+@asynccontextmanager
+async def lifespan(app: FastAPI) -> AsyncIterator[None]:
+    yield
+    # Vector edits are journaled in the background; write the last ones.
+    await asyncio.to_thread(vector_store.flush)
+
+
+app = FastAPI(lifespan=lifespan)
+app.middleware("http")(instrument_request)
 
 app.mount("/static", StaticFiles(directory=UPLOAD_DIR), name="static")
 app.mount(
@@ -16,3 +30,5 @@ app.mount(
 app.include_router(ui.router)
 app.include_router(vector.router)
 app.include_router(image.router)
+app.include_router(metrics.router)
+app.include_router(batch.router)
@@ -0,0 +1,85 @@
+import threading
+from collections import OrderedDict
+from typing import Any
+
+from .config import IMAGE_CACHE_BYTES
+from .core.types import ImageArray
+
+
+class ImageCache:
+    """
+    Process-wide LRU cache of decoded images keyed by image id.
+
+    Entries are evicted least recently used first once the total size of the
+    cached arrays exceeds ``max_bytes``. Cached arrays are marked read-only
+    because the same array may be handed to several editors.
+    """
+
+    def __init__(self, max_bytes: int = IMAGE_CACHE_BYTES):
+        self.max_bytes = max_bytes
+        self._entries: OrderedDict[str, ImageArray] = OrderedDict()
+        self._lock = threading.Lock()
+        self._bytes = 0
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+
+    def get(self, image_id: str) -> ImageArray | None:
+        with self._lock:
+            image = self._entries.get(image_id)
+            if image is None:
+                self._misses += 1
+                return None
+            self._entries.move_to_end(image_id)
+            self._hits += 1
+            return image
+
+    def put(self, image_id: str, image: ImageArray) -> None:
+        if image.base is not None:
+            # Views (e.g. crops) would otherwise keep the whole parent alive
+            # while only being charged for their own size.
+            image = image.copy()
+        image.flags.writeable = False
+        if image.nbytes > self.max_bytes:
+            return
+        with self._lock:
+            self._remove(image_id)
+            self._entries[image_id] = image
+            self._bytes += image.nbytes
+            while self._bytes > self.max_bytes:
+                oldest = next(iter(self._entries))
+                self._remove(oldest)
+                self._evictions += 1
+
+    def discard(self, image_id: str) -> None:
+        with self._lock:
+            self._remove(image_id)
+
+    def _remove(self, image_id: str) -> None:
+        image = self._entries.pop(image_id, None)
+        if image is not None:
+            self._bytes -= image.nbytes
+
+    def __contains__(self, image_id: str) -> bool:
+        with self._lock:
+            return image_id in self._entries
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._entries)
+
+    def stats(self) -> dict[str, Any]:
+        with self._lock:
+            lookups = self._hits + self._misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self._hits,
+                "misses": self._misses,
+                "evictions": self._evictions,
+                "hit_rate": self._hits / lookups if lookups else 0.0,
+            }
+
+
+image_cache = ImageCache()
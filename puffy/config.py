@@ -1,5 +1,105 @@
+import os
 from pathlib import Path
 
 BASE_DIR = Path(__file__).resolve().parent.parent
 UPLOAD_DIR = Path(BASE_DIR, "uploads")
 UPLOAD_DIR.mkdir(exist_ok=True)
+
+ALLOWED_EXTENSIONS = {".jpg", ".jpeg", ".png", ".gif", ".tiff"}
+
+# Image operations are dispatched to a bounded pool of worker threads so that
+# decoding, OpenCV work and encoding never block the event loop.
+WORKER_THREADS = int(os.environ.get("PUFFY_WORKER_THREADS", os.cpu_count() or 4))
+# Number of operations allowed to wait for a free worker before new requests
+# are rejected with 503.
+MAX_QUEUE_DEPTH = int(os.environ.get("PUFFY_MAX_QUEUE_DEPTH", 32))
+# Where the pixel work of full-resolution edits runs: "thread" on the worker
+# threads themselves, "process" on COMPUTE_PROCESSES worker processes that
+# receive and return images in shared memory.
+COMPUTE_BACKEND = os.environ.get("PUFFY_COMPUTE_BACKEND", "thread")
+COMPUTE_PROCESSES = int(os.environ.get("PUFFY_COMPUTE_PROCESSES", os.cpu_count() or 4))
+
+# Byte budget for decoded images kept in memory between requests.
+IMAGE_CACHE_BYTES = int(os.environ.get("PUFFY_IMAGE_CACHE_BYTES", 512 * 1024 * 1024))
+
+# Worker threads used by a single batch job.
+BATCH_WORKERS = int(os.environ.get("PUFFY_BATCH_WORKERS", os.cpu_count() or 4))
+
+# Interactive edits run on a pyramid level no larger than this many pixels on
+# its longer side; full resolution is only computed on commit or download.
+PREVIEW_MAX_SIDE = int(os.environ.get("PUFFY_PREVIEW_MAX_SIDE", 1024))
+# Bytes of pyramids and uncommitted preview versions kept in memory. Evicted
+# preview versions are replayed from the edit history when used again.
+PREVIEW_MAX_BYTES = int(os.environ.get("PUFFY_PREVIEW_MAX_BYTES", 256 * 1024 * 1024))
+
+# Content-addressed cache of operation results, keyed by source bytes,
+# operation and arguments.
+RESULT_CACHE_DIR = Path(BASE_DIR, "cache", "results")
+RESULT_CACHE_DIR.mkdir(parents=True, exist_ok=True)
+RESULT_CACHE_BYTES = int(os.environ.get("PUFFY_RESULT_CACHE_BYTES", 1024 * 1024 * 1024))
+
+# Where image versions live: "filesystem" encodes every version into
+# UPLOAD_DIR, where it survives restarts; "memory" keeps decoded pixels in RAM
+# and spills the least recently used ones to SPILL_DIR past IMAGE_STORE_BYTES,
+# which skips the codec between edits but loses every image on restart.
+IMAGE_STORE = os.environ.get("PUFFY_IMAGE_STORE", "filesystem")
+IMAGE_STORE_BYTES = int(os.environ.get("PUFFY_IMAGE_STORE_BYTES", 1024 * 1024 * 1024))
+SPILL_DIR = Path(BASE_DIR, "cache", "spill")
+SPILL_DIR.mkdir(parents=True, exist_ok=True)
+
+# Scratch space for batch jobs; on the same filesystem as the caches so files
+# can be hard-linked instead of copied.
+TMP_DIR = Path(BASE_DIR, "cache", "tmp")
+TMP_DIR.mkdir(parents=True, exist_ok=True)
+
+# Undo/redo history: full-resolution pixels are kept every
+# HISTORY_KEYFRAME_INTERVAL steps and other versions are replayed from them.
+# Older history is dropped once a session exceeds either budget.
+HISTORY_KEYFRAME_INTERVAL = int(os.environ.get("PUFFY_HISTORY_KEYFRAME_INTERVAL", 16))
+HISTORY_MAX_VERSIONS = int(os.environ.get("PUFFY_HISTORY_MAX_VERSIONS", 500))
+HISTORY_SESSION_BYTES = int(
+    os.environ.get("PUFFY_HISTORY_SESSION_BYTES", 256 * 1024 * 1024)
+)
+# Number of sessions whose history is kept.
+HISTORY_MAX_SESSIONS = int(os.environ.get("PUFFY_HISTORY_MAX_SESSIONS", 64))
+
+# Uploads are read in chunks of UPLOAD_CHUNK_BYTES and rejected as soon as
+# they exceed the byte limit or their header declares too many pixels.
+MAX_UPLOAD_BYTES = int(os.environ.get("PUFFY_MAX_UPLOAD_BYTES", 200 * 1024 * 1024))
+MAX_UPLOAD_PIXELS = int(os.environ.get("PUFFY_MAX_UPLOAD_PIXELS", 100_000_000))
+UPLOAD_CHUNK_BYTES = int(os.environ.get("PUFFY_UPLOAD_CHUNK_BYTES", 1024 * 1024))
+# Batch archives may hold at most this many entries and extract to at most
+# this many bytes in total; each image is also held to MAX_UPLOAD_BYTES.
+BATCH_MAX_FILES = int(os.environ.get("PUFFY_BATCH_MAX_FILES", 1000))
+BATCH_MAX_BYTES = int(os.environ.get("PUFFY_BATCH_MAX_BYTES", 5 * MAX_UPLOAD_BYTES))
+# Build the preview pyramid while handling the upload rather than on the
+# first interactive edit.
+UPLOAD_PREVIEWS = os.environ.get("PUFFY_UPLOAD_PREVIEWS", "1") == "1"
+
+# Byte budget for encoded responses (downloads, previews), keyed by image
+# version, format and encoder options.
+ENCODE_CACHE_BYTES = int(os.environ.get("PUFFY_ENCODE_CACHE_BYTES", 256 * 1024 * 1024))
+
+# Sampling profiler: while enabled, thread stacks are sampled every
+# PROFILE_INTERVAL_MS and requests slower than PROFILE_SLOW_MS are dumped to
+# PROFILE_DIR as collapsed stacks for flamegraph tools. Can also be toggled
+# at runtime through /metrics/profiler.
+PROFILE_ENABLED = os.environ.get("PUFFY_PROFILE", "0") == "1"
+PROFILE_SLOW_MS = int(os.environ.get("PUFFY_PROFILE_SLOW_MS", 500))
+PROFILE_INTERVAL_MS = int(os.environ.get("PUFFY_PROFILE_INTERVAL_MS", 5))
+PROFILE_DIR = Path(BASE_DIR, "cache", "profiles")
+
+# Vector documents stay parsed in memory. Edits are appended to a journal
+# next to the document in UPLOAD_DIR, synced in batches at most every
+# VECTOR_FLUSH_INTERVAL_MS, and the least recently used documents are dropped
+# once all of them together hold more than VECTOR_MAX_ELEMENTS SVG elements.
+VECTOR_FLUSH_INTERVAL_MS = int(os.environ.get("PUFFY_VECTOR_FLUSH_INTERVAL_MS", 500))
+VECTOR_MAX_ELEMENTS = int(os.environ.get("PUFFY_VECTOR_MAX_ELEMENTS", 1_000_000))
+# A journal is folded into a new snapshot of its document once it is larger
+# than both VECTOR_JOURNAL_BYTES and the previous snapshot.
+VECTOR_JOURNAL_BYTES = int(os.environ.get("PUFFY_VECTOR_JOURNAL_BYTES", 1024 * 1024))
+
+# Vector documents are rasterized in square tiles of RASTER_TILE_SIZE pixels,
+# cached up to RASTER_CACHE_BYTES and updated in place when shapes are added.
+RASTER_TILE_SIZE = int(os.environ.get("PUFFY_RASTER_TILE_SIZE", 256))
+RASTER_CACHE_BYTES = int(os.environ.get("PUFFY_RASTER_CACHE_BYTES", 128 * 1024 * 1024))
@@ -2,7 +2,9 @@
 Implementations for image editing
 """
 
+from .batch import parse_recipe, run_batch
 from .editor import ImageEditor
+from .pipeline import Step
 from .types import ImageArray
 
-__all__ = ["ImageEditor", "ImageArray"]
+__all__ = ["ImageEditor", "ImageArray", "Step", "parse_recipe", "run_batch"]
@@ -1,28 +1,109 @@
+from __future__ import annotations
+
+from collections.abc import Sequence
+
 import cv2
-import numpy as np
 
+from . import lut
+from .region import Mask, apply_filter
 from .types import ImageArray
 
+# Every adjustment takes keyword-only ``roi``, ``mask`` and ``out`` arguments
+# to limit it to part of the image; see ``region.apply_filter``. Adjustments
+# work pixel by pixel, so ``out`` may be the image itself.
+
 
 def adjust_brightness_contrast(
-    image: ImageArray, brightness: int = 0, contrast: float = 1.0
+    image: ImageArray,
+    brightness: int = 0,
+    contrast: float = 1.0,
+    *,
+    roi: Sequence[int] | None = None,
+    mask: Mask | None = None,
+    out: ImageArray | None = None,
 ) -> ImageArray:
     """Adjusts the brightness and contrast of an image."""
     # The formula is new_image = alpha * original_image + beta
-    # alpha (contrast) and beta (brightness)
-    adjusted = cv2.convertScaleAbs(image, alpha=contrast, beta=brightness)
-    return adjusted.astype(np.uint8)
+    # alpha (contrast) and beta (brightness). On its own this is already a
+    # single vectorized pass; chains of point ops are fused through lut.
+    return apply_filter(
+        image,
+        lambda src, dst: cv2.convertScaleAbs(
+            src, dst=dst, alpha=contrast, beta=brightness
+        ),
+        roi=roi,
+        mask=mask,
+        out=out,
+    )
+
+
+def _apply_table(
+    image: ImageArray,
+    op: str,
+    params: dict,
+    roi: Sequence[int] | None,
+    mask: Mask | None,
+    out: ImageArray | None,
+) -> ImageArray:
+    table = lut.compile_lut([(op, params)])
+    return apply_filter(
+        image,
+        lambda src, dst: lut.apply_lut(src, table, dst),
+        roi=roi,
+        mask=mask,
+        out=out,
+    )
 
 
 def adjust_color_balance(
-    image: ImageArray, red: int = 0, green: int = 0, blue: int = 0
+    image: ImageArray,
+    red: int = 0,
+    green: int = 0,
+    blue: int = 0,
+    *,
+    roi: Sequence[int] | None = None,
+    mask: Mask | None = None,
+    out: ImageArray | None = None,
 ) -> ImageArray:
     """Adjusts the color balance of an image."""
-    b, g, r = cv2.split(image)
+    params = {"red": red, "green": green, "blue": blue}
+    return _apply_table(image, "adjust_color_balance", params, roi, mask, out)
 
-    # Add the value and clip to the 0-255 range
-    b = np.clip(b.astype(np.int16) + blue, 0, 255).astype(np.uint8)
-    g = np.clip(g.astype(np.int16) + green, 0, 255).astype(np.uint8)
-    r = np.clip(r.astype(np.int16) + red, 0, 255).astype(np.uint8)
 
-    return cv2.merge([b, g, r]).astype(np.uint8)
+def adjust_gamma(
+    image: ImageArray,
+    gamma: float = 1.0,
+    *,
+    roi: Sequence[int] | None = None,
+    mask: Mask | None = None,
+    out: ImageArray | None = None,
+) -> ImageArray:
+    """Applies gamma correction to an image."""
+    return _apply_table(image, "adjust_gamma", {"gamma": gamma}, roi, mask, out)
+
+
+def adjust_levels(
+    image: ImageArray,
+    black: int = 0,
+    white: int = 255,
+    gamma: float = 1.0,
+    *,
+    roi: Sequence[int] | None = None,
+    mask: Mask | None = None,
+    out: ImageArray | None = None,
+) -> ImageArray:
+    """Stretches the input range [black, white] to the full output range."""
+    params = {"black": black, "white": white, "gamma": gamma}
+    return _apply_table(image, "adjust_levels", params, roi, mask, out)
+
+
+def apply_curve(
+    image: ImageArray,
+    points: list[tuple[int, int]],
+    *,
+    roi: Sequence[int] | None = None,
+    mask: Mask | None = None,
+    out: ImageArray | None = None,
+) -> ImageArray:
+    """Maps values through a tone curve given by (input, output) control points."""
+    return _apply_table(image, "apply_curve", {"points": points}, roi, mask, out)
@@ -0,0 +1,223 @@
+"""
+Applying one recipe of ImageEditor operations to many images.
+"""
+
+from __future__ import annotations
+
+import inspect
+import math
+import os
+import time
+import types
+import typing
+import uuid
+from collections.abc import Iterable, Iterator, Sequence
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any
+
+import cv2
+
+from . import io, tiling
+from .editor import ImageEditor
+from .pipeline import OPERATIONS, Step
+
+# Images with at least this many pixels are filtered tile by tile, so that
+# only the decoded source (if it cannot be memory-mapped) is held in memory
+TILED_MIN_PIXELS = 32_000_000
+
+
+def _coerce(value: Any, hint: Any, name: str) -> Any:
+    """Converts a JSON value to the type an ImageEditor argument is annotated with."""
+    origin, args = typing.get_origin(hint), typing.get_args(hint)
+    if origin in (typing.Union, types.UnionType):
+        if value is None and type(None) in args:
+            return None
+        (hint,) = [arg for arg in args if arg is not type(None)]
+        return _coerce(value, hint, name)
+    if origin in (tuple, list, Sequence):
+        if not isinstance(value, (list, tuple)):
+            raise ValueError(f"{name} must be a list")
+        if origin is tuple and len(value) != len(args):
+            raise ValueError(f"{name} must have {len(args)} items")
+        items = [
+            _coerce(item, args[i] if origin is tuple else args[0], name)
+            for i, item in enumerate(value)
+        ]
+        return items if origin is list else tuple(items)
+    if hint is bool:
+        if not isinstance(value, bool):
+            raise ValueError(f"{name} must be true or false")
+        return value
+    if hint is str:
+        if not isinstance(value, str):
+            raise ValueError(f"{name} must be a string")
+        return value
+    if hint in (int, float):
+        kind = "an integer" if hint is int else "a finite number"
+        if (
+            isinstance(value, bool)
+            or not isinstance(value, (int, float))
+            or not math.isfinite(value)
+            or (hint is int and value != int(value))
+        ):
+            raise ValueError(f"{name} must be {kind}")
+        return hint(value)
+    return value
+
+
+def parse_recipe(data: Any) -> list[Step]:
+    """
+    Validates a JSON recipe.
+
+    A recipe is a list of ``{"op": <ImageEditor method>, <kwarg>: <value>, ...}``
+    objects; the kwargs may also be nested under an ``"args"`` key.
+
+    Values are checked against, and converted to, the types the
+    ImageEditor method is annotated with.
+
+    Raises:
+        ValueError: If the recipe is malformed, names an unknown operation
+            or argument, or gives an argument a value of the wrong type.
+    """
+    if not isinstance(data, list) or not data:
+        raise ValueError("Recipe must be a non-empty list of steps")
+    steps = []
+    for i, entry in enumerate(data):
+        if not isinstance(entry, dict) or not isinstance(entry.get("op"), str):
+            raise ValueError(f"Step {i} must be an object with an 'op' name")
+        kwargs = dict(entry.get("args", {}))
+        kwargs.update({k: v for k, v in entry.items() if k not in ("op", "args")})
+        op = entry["op"]
+        if op not in OPERATIONS:
+            raise ValueError(f"Step {i}: unknown operation '{op}'")
+        if kwargs.get("mask") is not None:
+            raise ValueError(f"Step {i} ({op}): masks cannot be given in a recipe")
+        method = getattr(ImageEditor, op)
+        try:
+            inspect.signature(method).bind(None, **kwargs)
+        except TypeError as e:
+            raise ValueError(f"Step {i} ({op}): {e}") from e
+        hints = typing.get_type_hints(method)
+        try:
+            kwargs = {k: _coerce(v, hints[k], k) for k, v in kwargs.items()}
+        except ValueError as e:
+            raise ValueError(f"Step {i} ({op}): {e}") from e
+        steps.append(Step(op, kwargs))
+    return steps
+
+
+def apply_recipe(editor: ImageEditor, recipe: Iterable[Step]) -> ImageEditor:
+    """Applies every step of a recipe to an editor in deferred mode."""
+    editor.defer()
+    for step in recipe:
+        getattr(editor, step.op)(**step.kwargs)
+    return editor.materialize()
+
+
+@dataclass
+class BatchItemResult:
+    index: int
+    source: Path
+    output: Path | None = None
+    error: str | None = None
+    seconds: float = 0.0
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
+
+
+def pixel_count(source: Path) -> int:
+    """Reads the number of pixels of an image file from its header; 0 if unknown."""
+    suffix = source.suffix.lower()
+    if suffix in (".npy", ".tif", ".tiff"):
+        image = tiling.open_source(source) if suffix == ".npy" else io.open_tiff(source)
+        if image is not None:
+            return image.shape[0] * image.shape[1]
+    with open(source, "rb") as f:
+        header = f.read(1 << 16)
+    try:
+        sniffed = io.sniff_image(header)
+    except ValueError:
+        return 0
+    return 0 if sniffed is None else sniffed[1] * sniffed[2]
+
+
+def process_one(
+    index: int,
+    recipe: list[Step],
+    source: Path,
+    output_dir: Path,
+    quality: int = 95,
+) -> BatchItemResult:
+    """
+    Loads, edits and saves a single image, capturing any error.
+
+    Large images are processed with ``tiling.process_file_tiled`` if the
+    recipe allows it.
+    """
+    start = time.perf_counter()
+    result = BatchItemResult(index=index, source=source)
+    try:
+        output = output_dir / f"{uuid.uuid4()}{source.suffix}"
+        if tiling.is_tileable(recipe) and pixel_count(source) >= TILED_MIN_PIXELS:
+            tiling.process_file_tiled(source, output, recipe, quality=quality)
+        else:
+            editor = apply_recipe(ImageEditor.open(source), recipe)
+            editor.save(output, quality=quality)
+        result.output = output
+    except (OSError, ValueError, TypeError, cv2.error) as e:
+        result.error = str(e)
+    result.seconds = time.perf_counter() - start
+    return result
+
+
+def run_batch(
+    recipe: list[Step],
+    sources: Iterable[Path],
+    output_dir: Path,
+    max_workers: int | None = None,
+    quality: int = 95,
+) -> Iterator[BatchItemResult]:
+    """
+    Applies a recipe to many images in parallel.
+
+    Images are processed on a thread pool (OpenCV releases the GIL), and
+    results are yielded in completion order as soon as each one is done. At
+    most two images per worker are in flight, so memory use does not grow
+    with the number of sources.
+    """
+    max_workers = max_workers or os.cpu_count() or 4
+    pending: set[Future[BatchItemResult]] = set()
+    with ThreadPoolExecutor(
+        max_workers=max_workers, thread_name_prefix="puffy-batch"
+    ) as pool:
+        for index, source in enumerate(sources):
+            if len(pending) >= 2 * max_workers:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    yield future.result()
+            pending.add(
+                pool.submit(process_one, index, recipe, source, output_dir, quality)
+            )
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                yield future.result()
+
+
+def summarize(results: list[BatchItemResult], seconds: float) -> dict[str, Any]:
+    """Aggregates per-item results into throughput figures."""
+    succeeded = sum(1 for r in results if r.ok)
+    busy = sum(r.seconds for r in results)
+    return {
+        "total": len(results),
+        "succeeded": succeeded,
+        "failed": len(results) - succeeded,
+        "seconds": seconds,
+        "images_per_second": len(results) / seconds if seconds > 0 else 0.0,
+        "mean_item_seconds": busy / len(results) if results else 0.0,
+        "parallelism": busy / seconds if seconds > 0 else 0.0,
+    }
@@ -0,0 +1,138 @@
+"""
+Blur engine that picks an algorithm by filter type and kernel size.
+
+* ``separable``: ``cv2.GaussianBlur``, exact, cost grows with the kernel;
+* ``box_cascade``: three box filters whose combined variance matches the
+  Gaussian. Box filters use running sums, so the cost does not depend on
+  the kernel size and large kernels stay within a couple of levels of the
+  exact result;
+* ``box``: a single box filter for the average blur;
+* ``sorting_network``: OpenCV's small-kernel median;
+* ``histogram``: OpenCV's constant-time (Perreault-Hebert) histogram median,
+  which is what ``cv2.medianBlur`` uses for 8-bit images and larger kernels.
+
+The strategy chosen for each call is counted; see ``strategy_counts``.
+"""
+
+from __future__ import annotations
+
+import math
+import threading
+from collections import Counter
+from collections.abc import Callable
+
+import cv2
+
+from .types import ImageArray
+
+# Largest Gaussian kernel that is still run exactly; above it the box
+# cascade is faster and visually indistinguishable.
+SEPARABLE_MAX_KERNEL = 25
+# Largest median kernel handled by the sorting network.
+SORTING_MAX_KERNEL = 5
+
+_counts: Counter[str] = Counter()
+_lock = threading.Lock()
+
+
+def gaussian_sigma(kernel_size: int) -> float:
+    """The sigma ``cv2.GaussianBlur`` derives from a kernel size."""
+    return 0.3 * ((kernel_size - 1) * 0.5 - 1) + 0.8
+
+
+def box_sizes(sigma: float, passes: int = 3) -> list[int]:
+    """
+    Odd box widths whose cascade has the variance of a Gaussian with ``sigma``.
+
+    Uses the two closest odd widths, as in Kovesi, "Fast almost-Gaussian
+    filtering" (2010).
+    """
+    ideal = math.sqrt(12 * sigma * sigma / passes + 1)
+    lower = int(ideal)
+    if lower % 2 == 0:
+        lower -= 1
+    lower = max(lower, 1)
+    upper = lower + 2
+    m = round(
+        (12 * sigma * sigma - passes * lower * lower - 4 * passes * lower - 3 * passes)
+        / (-4 * lower - 4)
+    )
+    return [lower if i < m else upper for i in range(passes)]
+
+
+def _separable(
+    image: ImageArray, kernel_size: int, out: ImageArray | None
+) -> ImageArray:
+    return cv2.GaussianBlur(image, (kernel_size, kernel_size), 0, dst=out)
+
+
+def _box_cascade(
+    image: ImageArray, kernel_size: int, out: ImageArray | None
+) -> ImageArray:
+    for size in box_sizes(gaussian_sigma(kernel_size)):
+        # After the first pass the cascade runs in place in ``out``.
+        image = out = cv2.blur(image, (size, size), dst=out)
+    return image
+
+
+def _box(image: ImageArray, kernel_size: int, out: ImageArray | None) -> ImageArray:
+    return cv2.blur(image, (kernel_size, kernel_size), dst=out)
+
+
+def _median(image: ImageArray, kernel_size: int, out: ImageArray | None) -> ImageArray:
+    return cv2.medianBlur(image, kernel_size, dst=out)
+
+
+STRATEGIES: dict[str, Callable[[ImageArray, int, ImageArray | None], ImageArray]] = {
+    "separable": _separable,
+    "box_cascade": _box_cascade,
+    "box": _box,
+    "sorting_network": _median,
+    "histogram": _median,
+}
+
+
+def choose_strategy(blur_type: str, kernel_size: int) -> str | None:
+    """Returns the strategy used for a blur, or None for unknown blur types."""
+    if blur_type == "gaussian":
+        return "separable" if kernel_size <= SEPARABLE_MAX_KERNEL else "box_cascade"
+    if blur_type == "average":
+        return "box"
+    if blur_type == "median":
+        return "sorting_network" if kernel_size <= SORTING_MAX_KERNEL else "histogram"
+    return None
+
+
+def halo(blur_type: str, kernel_size: int) -> int:
+    """Number of neighbouring pixels a blurred pixel depends on."""
+    kernel_size |= 1
+    if choose_strategy(blur_type, kernel_size) == "box_cascade":
+        return sum(size // 2 for size in box_sizes(gaussian_sigma(kernel_size)))
+    return kernel_size // 2
+
+
+def blur(
+    image: ImageArray,
+    blur_type: str = "gaussian",
+    kernel_size: int = 5,
+    out: ImageArray | None = None,
+) -> ImageArray:
+    """
+    Blurs an image with the fastest suitable strategy; even kernels are rounded up.
+
+    The result is written to ``out`` if given, which must not be ``image``.
+    Unknown blur types return ``image`` unchanged.
+    """
+    kernel_size |= 1
+    strategy = choose_strategy(blur_type, kernel_size)
+    if strategy is None:
+        return image
+    with _lock:
+        _counts[strategy] += 1
+    return STRATEGIES[strategy](image, kernel_size, out)
+
+
+def strategy_counts() -> dict[str, int]:
+    """Number of blurs run with each strategy since the process started."""
+    with _lock:
+        return dict(_counts)
@@ -0,0 +1,114 @@
+"""
+Per-thread pool of scratch image buffers.
+
+Editors in ``inplace`` mode write the results of operations that cannot run
+over their own input, such as a blur or a rotation, into a second frame of
+the same shape. That frame is taken from this pool and handed back once the
+editor is done with it, so a worker thread running one edit after another
+keeps reusing the same few buffers instead of allocating a frame per step.
+
+Buffers are kept per thread, so taking and giving them back needs no lock,
+and a buffer taken is owned by the caller until it is given back. Arrays
+the pool did not create are never taken in.
+"""
+
+from __future__ import annotations
+
+import threading
+import weakref
+from collections import OrderedDict
+from typing import Any
+
+import numpy as np
+
+from .types import ImageArray
+
+# Bytes of idle buffers kept per thread; the least recently used go first
+MAX_IDLE_BYTES = 256 * 1024 * 1024
+# Idle buffers kept per shape and dtype
+MAX_IDLE_PER_SHAPE = 2
+
+Key = tuple[tuple[int, ...], str]
+
+
+class ScratchPool:
+    """Idle buffers by shape and dtype, one set per thread."""
+
+    def __init__(
+        self,
+        max_idle_bytes: int = MAX_IDLE_BYTES,
+        max_idle_per_shape: int = MAX_IDLE_PER_SHAPE,
+    ):
+        self.max_idle_bytes = max_idle_bytes
+        self.max_idle_per_shape = max_idle_per_shape
+        self._local = threading.local()
+        self._created: weakref.WeakValueDictionary[int, ImageArray] = (
+            weakref.WeakValueDictionary()
+        )
+        self._lock = threading.Lock()
+        self._counts = {"allocated": 0, "reused": 0, "returned": 0, "dropped": 0}
+
+    def _idle(self) -> OrderedDict[Key, list[ImageArray]]:
+        idle = getattr(self._local, "idle", None)
+        if idle is None:
+            idle = self._local.idle = OrderedDict()
+            self._local.bytes = 0
+        return idle
+
+    def take(self, shape: tuple[int, ...], dtype: Any = np.uint8) -> ImageArray:
+        """Returns an uninitialized C-contiguous buffer, reusing an idle one."""
+        key = (tuple(shape), np.dtype(dtype).str)
+        idle = self._idle()
+        buffers = idle.get(key)
+        if buffers:
+            buffer = buffers.pop()
+            if not buffers:
+                del idle[key]
+            self._local.bytes -= buffer.nbytes
+            self._count("reused")
+            return buffer
+        self._count("allocated")
+        buffer = np.empty(shape, dtype)
+        with self._lock:
+            self._created[id(buffer)] = buffer
+        return buffer
+
+    def give(self, buffer: ImageArray) -> None:
+        """Hands a buffer back; the caller must not use it afterwards."""
+        with self._lock:
+            if self._created.get(id(buffer)) is not buffer:
+                return
+        if buffer.nbytes > self.max_idle_bytes:
+            return
+        key = (buffer.shape, buffer.dtype.str)
+        idle = self._idle()
+        buffers = idle.setdefault(key, [])
+        idle.move_to_end(key)
+        if len(buffers) >= self.max_idle_per_shape:
+            self._count("dropped")
+            return
+        buffers.append(buffer)
+        self._local.bytes += buffer.nbytes
+        self._count("returned")
+        while self._local.bytes > self.max_idle_bytes:
+            oldest_key, oldest = next(iter(idle.items()))
+            self._local.bytes -= oldest.pop(0).nbytes
+            if not oldest:
+                del idle[oldest_key]
+            self._count("dropped")
+
+    def clear(self) -> None:
+        """Drops the idle buffers of the calling thread."""
+        self._local.idle = OrderedDict()
+        self._local.bytes = 0
+
+    def _count(self, name: str) -> None:
+        with self._lock:
+            self._counts[name] += 1
+
+    def stats(self) -> dict[str, Any]:
+        with self._lock:
+            return dict(self._counts)
+
+
+scratch = ScratchPool()
@@ -1,74 +1,346 @@
 from __future__ import annotations
 
-import copy
+from collections.abc import Callable, Sequence
 from dataclasses import dataclass, field
 from pathlib import Path
+from typing import Any
 
-from . import adjustments, effects, io, transform
+import numpy as np
+
+from . import adjustments, buffers, effects, io, tiling, transform
+from .pipeline import Pipeline, Step
+from .region import Mask
 from .types import ImageArray
 
 
+def _region(roi: Sequence[int] | None, mask: Mask | None) -> dict[str, Any]:
+    # Only passed on when given, so that recorded steps stay unchanged.
+    region: dict[str, Any] = {}
+    if roi is not None:
+        region["roi"] = tuple(roi)
+    if mask is not None:
+        region["mask"] = mask
+    return region
+
+
 @dataclass
 class ImageEditor:
+    """
+    Applies operations to an image, immediately or deferred.
+
+    The filters (adjustments, noise and blur) accept a ``roi`` rectangle
+    ``(x, y, width, height)`` and/or an ``(H, W)`` ``mask`` to only change
+    part of the image; see ``region.apply_filter``.
+
+    With ``inplace=True`` the caller hands the image over: the editor may
+    overwrite it, and every array it returned before, with later results.
+    Immediate operations then allocate no new frames. Pixel-wise filters
+    write over the current image, and other operations write into a spare
+    frame of the same shape: the previous image, or a buffer from the
+    thread's ``buffers.scratch`` pool. ``release`` hands that pooled buffer
+    back once the editor is done.
+    """
+
     _image: ImageArray | None = field(default=None, repr=False)
+    _pipeline: Pipeline | None = field(default=None, repr=False)
+    inplace: bool = False
+    # Whether nobody else holds the current image, which can then be
+    # written in place
+    _owned: bool = field(default=False, repr=False)
+    # The previous frame of an inplace editor, to write the next one to
+    _spare: ImageArray | None = field(default=None, repr=False)
+
+    def __post_init__(self) -> None:
+        if self.inplace and self._image is not None:
+            self._owned = self._image.flags.writeable
 
     @property
     def image(self) -> ImageArray:
+        pixels = self._pixels()
+        if not self.inplace:
+            self._owned = False  # the caller may keep it
+        return pixels
+
+    def _pixels(self) -> ImageArray:
         if self._image is None:
             raise ValueError("No image loaded")
+        self._flush()
         return self._image
 
+    def _update(self, result: ImageArray) -> ImageEditor:
+        previous = self._image
+        if previous is None or not np.may_share_memory(result, previous):
+            if self.inplace and self._owned and previous is not None:
+                self._retire(previous)
+            self._owned = True
+        self._image = result
+        return self
+
+    def _retire(self, previous: ImageArray) -> None:
+        if not previous.flags.c_contiguous:
+            return
+        if self._spare is not None:
+            buffers.scratch.give(self._spare)
+        self._spare = previous
+
+    def _target(self, shape: tuple[int, ...], dtype: Any) -> ImageArray | None:
+        """The array an inplace editor writes its next frame to; None otherwise."""
+        if not self.inplace:
+            return None
+        spare, self._spare = self._spare, None
+        if spare is not None and spare.shape == shape and spare.dtype == dtype:
+            return spare
+        if spare is not None:
+            buffers.scratch.give(spare)
+        return buffers.scratch.take(shape, dtype)
+
+    def _filter(
+        self,
+        fn: Callable[..., ImageArray],
+        *args: Any,
+        roi: Sequence[int] | None,
+        mask: Mask | None,
+        pixelwise: bool = True,
+    ) -> ImageEditor:
+        image = self._pixels()
+        region = _region(roi, mask)
+        # A region is written back into the editor's own image rather than
+        # into a copy of the whole frame.
+        writeable = self._owned and image.flags.writeable
+        if writeable and (region or (self.inplace and pixelwise)):
+            out = image
+        else:
+            out = self._target(image.shape, image.dtype)
+        return self._update(fn(image, *args, **region, out=out))
+
+    def release(self) -> ImageEditor:
+        """Hands the spare frame of an inplace editor back to the scratch pool."""
+        if self._spare is not None:
+            buffers.scratch.give(self._spare)
+            self._spare = None
+        return self
+
+    @property
+    def deferred(self) -> bool:
+        return self._pipeline is not None
+
     @classmethod
-    def open(cls, path: str | Path) -> ImageEditor:
-        return cls(_image=io.load_image(path))
+    def open(cls, path: str | Path, deferred: bool = False) -> ImageEditor:
+        editor = cls(_image=io.load_image(path))
+        return editor.defer() if deferred else editor
+
+    def defer(self) -> ImageEditor:
+        """
+        Switches to deferred mode.
+
+        Subsequent operations are only recorded and run as one optimized pass
+        when the image is next accessed, e.g. by ``save`` or ``materialize``.
+        """
+        if self._pipeline is None:
+            height, width = self._pixels().shape[:2]
+            self._pipeline = Pipeline((width, height))
+        return self
+
+    def materialize(self) -> ImageEditor:
+        """Runs any recorded operations and returns to immediate mode."""
+        self._flush()
+        self._pipeline = None
+        return self
+
+    def _flush(self) -> None:
+        if (
+            self._image is not None
+            and self._pipeline is not None
+            and len(self._pipeline)
+        ):
+            self._update(self._pipeline.run(self._image))
+
+    def _record(self, name: str, **kwargs: Any) -> ImageEditor:
+        assert self._pipeline is not None
+        self._pipeline.record(name, **kwargs)
+        return self
 
     def save(self, path: str | Path, quality: int = 95) -> ImageEditor:
-        io.save_image(self.image, path, quality=quality)
+        io.save_image(self._pixels(), path, quality=quality)
         return self
 
     def resize(
         self, width: int, height: int, interpolation: str = "bicubic"
     ) -> ImageEditor:
-        self._image = transform.resize(self.image, width, height, interpolation)
-        return self
+        if self.deferred:
+            return self._record(
+                "resize", width=width, height=height, interpolation=interpolation
+            )
+        image = self._pixels()
+        out = self._target((height, width, *image.shape[2:]), image.dtype)
+        return self._update(
+            transform.resize(image, width, height, interpolation, out=out)
+        )
 
     def rotate(
         self, angle: float, center: tuple[int, int] | None = None
     ) -> ImageEditor:
-        self._image = transform.rotate(self.image, angle, center)
-        return self
+        if self.deferred:
+            return self._record("rotate", angle=angle, center=center)
+        image = self._pixels()
+        out = self._target(image.shape, image.dtype)
+        return self._update(transform.rotate(image, angle, center, out=out))
 
     def crop(self, x: int, y: int, width: int, height: int) -> ImageEditor:
-        self._image = transform.crop(self.image, x, y, width, height)
-        return self
+        if self.deferred:
+            return self._record("crop", x=x, y=y, width=width, height=height)
+        return self._update(transform.crop(self._pixels(), x, y, width, height))
 
     def flip(self, horizontal: bool = True, vertical: bool = False) -> ImageEditor:
-        self._image = transform.flip(self.image, horizontal, vertical)
-        return self
+        if not horizontal and not vertical:
+            return self
+        if self.deferred:
+            return self._record("flip", horizontal=horizontal, vertical=vertical)
+        image = self._pixels()
+        out = self._target(image.shape, image.dtype)
+        return self._update(transform.flip(image, horizontal, vertical, out=out))
 
     def adjust_brightness_contrast(
-        self, brightness: int = 0, contrast: float = 1.0
+        self,
+        brightness: int = 0,
+        contrast: float = 1.0,
+        *,
+        roi: Sequence[int] | None = None,
+        mask: Mask | None = None,
     ) -> ImageEditor:
-        self._image = adjustments.adjust_brightness_contrast(
-            self.image, brightness, contrast
+        if self.deferred:
+            return self._record(
+                "adjust_brightness_contrast",
+                brightness=brightness,
+                contrast=contrast,
+                **_region(roi, mask),
+            )
+        return self._filter(
+            adjustments.adjust_brightness_contrast,
+            brightness,
+            contrast,
+            roi=roi,
+            mask=mask,
         )
-        return self
 
     def adjust_color_balance(
-        self, red: int = 0, green: int = 0, blue: int = 0
+        self,
+        red: int = 0,
+        green: int = 0,
+        blue: int = 0,
+        *,
+        roi: Sequence[int] | None = None,
+        mask: Mask | None = None,
     ) -> ImageEditor:
-        self._image = adjustments.adjust_color_balance(self.image, red, green, blue)
-        return self
+        if self.deferred:
+            return self._record(
+                "adjust_color_balance",
+                red=red,
+                green=green,
+                blue=blue,
+                **_region(roi, mask),
+            )
+        return self._filter(
+            adjustments.adjust_color_balance, red, green, blue, roi=roi, mask=mask
+        )
+
+    def adjust_gamma(
+        self,
+        gamma: float = 1.0,
+        *,
+        roi: Sequence[int] | None = None,
+        mask: Mask | None = None,
+    ) -> ImageEditor:
+        if self.deferred:
+            return self._record("adjust_gamma", gamma=gamma, **_region(roi, mask))
+        return self._filter(adjustments.adjust_gamma, gamma, roi=roi, mask=mask)
+
+    def adjust_levels(
+        self,
+        black: int = 0,
+        white: int = 255,
+        gamma: float = 1.0,
+        *,
+        roi: Sequence[int] | None = None,
+        mask: Mask | None = None,
+    ) -> ImageEditor:
+        if self.deferred:
+            return self._record(
+                "adjust_levels",
+                black=black,
+                white=white,
+                gamma=gamma,
+                **_region(roi, mask),
+            )
+        return self._filter(
+            adjustments.adjust_levels, black, white, gamma, roi=roi, mask=mask
+        )
+
+    def apply_curve(
+        self,
+        points: list[tuple[int, int]],
+        *,
+        roi: Sequence[int] | None = None,
+        mask: Mask | None = None,
+    ) -> ImageEditor:
+        if self.deferred:
+            return self._record("apply_curve", points=points, **_region(roi, mask))
+        return self._filter(adjustments.apply_curve, points, roi=roi, mask=mask)
 
     def add_noise(
-        self, noise_type: str = "gaussian", intensity: float = 0.1
+        self,
+        noise_type: str = "gaussian",
+        intensity: float = 0.1,
+        seed: int | None = None,
+        *,
+        roi: Sequence[int] | None = None,
+        mask: Mask | None = None,
     ) -> ImageEditor:
-        self._image = effects.add_noise(self.image, noise_type, intensity)
-        return self
+        if self.deferred:
+            return self._record(
+                "add_noise",
+                noise_type=noise_type,
+                intensity=intensity,
+                seed=seed,
+                **_region(roi, mask),
+            )
+        return self._filter(
+            effects.add_noise, noise_type, intensity, seed, roi=roi, mask=mask
+        )
 
-    def blur(self, blur_type: str = "gaussian", kernel_size: int = 5) -> ImageEditor:
-        self._image = effects.blur(self.image, blur_type, kernel_size)
-        return self
+    def blur(
+        self,
+        blur_type: str = "gaussian",
+        kernel_size: int = 5,
+        *,
+        roi: Sequence[int] | None = None,
+        mask: Mask | None = None,
+    ) -> ImageEditor:
+        if self.deferred:
+            return self._record(
+                "blur",
+                blur_type=blur_type,
+                kernel_size=kernel_size,
+                **_region(roi, mask),
+            )
+        return self._filter(
+            effects.blur, blur_type, kernel_size, roi=roi, mask=mask, pixelwise=False
+        )
+
+    def apply_tiled(
+        self,
+        recipe: list[Step],
+        tile_size: int = 1024,
+        max_workers: int | None = None,
+    ) -> ImageEditor:
+        """Applies a recipe of filters tile by tile across worker threads."""
+        return self._update(
+            tiling.run_tiled(
+                self._pixels(), recipe, tile_size=tile_size, max_workers=max_workers
+            )
+        )
 
     def clone(self) -> ImageEditor:
-        return ImageEditor(_image=copy.deepcopy(self._image))
+        """A new editor with its own copy of the current image."""
+        image = self._pixels().copy() if self._image is not None else None
+        return ImageEditor(_image=image, inplace=self.inplace, _owned=True)
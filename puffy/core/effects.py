@@ -1,53 +1,61 @@
-import cv2
-import numpy as np
+from __future__ import annotations
 
+from collections.abc import Sequence
+
+from . import blur as _blur
+from . import noise
+from .region import Mask, apply_filter
 from .types import ImageArray
 
 
 def add_noise(
-    image: ImageArray, noise_type: str = "gaussian", intensity: float = 0.1
+    image: ImageArray,
+    noise_type: str = "gaussian",
+    intensity: float = 0.1,
+    seed: int | None = None,
+    *,
+    roi: Sequence[int] | None = None,
+    mask: Mask | None = None,
+    out: ImageArray | None = None,
 ) -> ImageArray:
-    """Adds noise to an image."""
-    h, w, c = image.shape
-    if noise_type == "gaussian":
-        mean = 0
-        var = intensity * 255
-        sigma = var**0.5
-        gauss = np.random.normal(mean, sigma, (h, w, c))
-        noisy = np.clip(image + gauss, 0, 255)
-        return noisy.astype(np.uint8)
-    elif noise_type == "salt_pepper":
-        noisy = np.copy(image)
-        # Salt
-        num_salt = np.ceil(intensity * image.size * 0.5)
-        coords = [
-            np.random.randint(0, i, int(num_salt)) for i in image.shape
-        ]
-        noisy[coords[0], coords[1], :] = 255
-        # Pepper
-        num_pepper = np.ceil(intensity * image.size * 0.5)
-        coords = [
-            np.random.randint(0, i, int(num_pepper)) for i in image.shape
-        ]
-        noisy[coords[0], coords[1], :] = 0
-        return noisy.astype(np.uint8)
-    return image
+    """
+    Adds noise to an image. A fixed ``seed`` makes the result reproducible.
+
+    See ``noise.NOISE_MODELS`` for the supported types, and
+    ``region.apply_filter`` for ``roi``, ``mask`` and ``out``, which may be
+    ``image`` itself.
+    """
+    return apply_filter(
+        image,
+        lambda src, dst: noise.add_noise(src, noise_type, intensity, seed, out=dst),
+        roi=roi,
+        mask=mask,
+        out=out,
+    )
 
 
 def blur(
-    image: ImageArray, blur_type: str = "gaussian", kernel_size: int = 5
+    image: ImageArray,
+    blur_type: str = "gaussian",
+    kernel_size: int = 5,
+    *,
+    roi: Sequence[int] | None = None,
+    mask: Mask | None = None,
+    out: ImageArray | None = None,
 ) -> ImageArray:
-    """Applies a blur to an image."""
-    # Kernel size must be odd
-    if kernel_size % 2 == 0:
-        kernel_size += 1
-
-    if blur_type == "average":
-        return cv2.blur(image, (kernel_size, kernel_size)).astype(np.uint8)
-    elif blur_type == "gaussian":
-        return cv2.GaussianBlur(image, (kernel_size, kernel_size), 0).astype(
-            np.uint8
-        )
-    elif blur_type == "median":
-        return cv2.medianBlur(image, kernel_size).astype(np.uint8)
-    return image
+    """
+    Applies a blur to an image.
+
+    The algorithm is picked by ``blur.choose_strategy``, so large kernels do
+    not get slower. Limited to a ``roi`` or ``mask``, the blur still reads
+    the pixels within half a kernel around the region. ``out`` must not be
+    ``image`` unless a region is given.
+    """
+    return apply_filter(
+        image,
+        lambda src, dst: _blur.blur(src, blur_type, kernel_size, dst),
+        roi=roi,
+        mask=mask,
+        halo=_blur.halo(blur_type, kernel_size),
+        out=out,
+    )
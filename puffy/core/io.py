@@ -1,26 +1,386 @@
+import functools
+import struct
 from pathlib import Path
+from typing import Any
 
 import cv2
 import numpy as np
 
+from .timing import timed
 from .types import ImageArray
 
 
+@timed("io.load")
 def load_image(path: str | Path) -> ImageArray:
     """Loads an image from the specified path."""
+    if Path(path).suffix.lower() == ".npy":
+        return np.load(str(path))
     image = cv2.imread(str(path))
     if image is None:
         raise FileNotFoundError(f"Image not found at {path}")
-    return image.astype(np.uint8)
+    return image
 
 
-def save_image(image: ImageArray, path: str | Path, quality: int = 95) -> None:
-    """Saves an image to the specified path."""
-    ext = Path(path).suffix.lower()
-    if ext == ".jpeg" or ext == ".jpg":
-        params = [cv2.IMWRITE_JPEG_QUALITY, quality]
-        if not cv2.imwrite(str(path), image, params):
-            raise OSError(f"Could not save JPEG image to {path}")
+@timed("decode")
+def decode_image(data: bytes | memoryview) -> ImageArray:
+    """Decodes an encoded image held in memory."""
+    image = cv2.imdecode(np.frombuffer(data, dtype=np.uint8), cv2.IMREAD_COLOR)
+    if image is None:
+        raise ValueError("Could not decode image data")
+    return image
+
+
+def _sniff_jpeg(data: bytes | memoryview) -> tuple[int, int] | None:
+    i = 2
+    while i + 4 <= len(data):
+        if data[i] != 0xFF:
+            raise ValueError("Corrupt JPEG marker")
+        marker = data[i + 1]
+        if marker == 0xFF:  # fill byte
+            i += 1
+        elif marker == 0x01 or 0xD0 <= marker <= 0xD8:  # no payload
+            i += 2
+        elif 0xC0 <= marker <= 0xCF and marker not in (0xC4, 0xC8, 0xCC):
+            if i + 9 > len(data):
+                return None
+            height, width = struct.unpack_from(">HH", data, i + 5)
+            return width, height
+        elif marker == 0xDA:
+            raise ValueError("JPEG has no frame header")
+        else:
+            i += 2 + struct.unpack_from(">H", data, i + 2)[0]
+    return None
+
+
+def _sniff_tiff(data: bytes | memoryview) -> tuple[int, int] | None:
+    order = "<" if data[:2] == b"II" else ">"
+    (offset,) = struct.unpack_from(order + "I", data, 4)
+    if offset + 2 > len(data):
+        return None
+    (count,) = struct.unpack_from(order + "H", data, offset)
+    if offset + 2 + 12 * count > len(data):
+        return None
+    size = {}
+    for entry in range(count):
+        tag, kind, _, value = struct.unpack_from(
+            order + "HHI4s", data, offset + 2 + 12 * entry
+        )
+        if tag in (256, 257):  # ImageWidth, ImageLength
+            size[tag] = struct.unpack_from(order + ("H" if kind == 3 else "I"), value)[
+                0
+            ]
+    if len(size) != 2:
+        raise ValueError("TIFF has no image dimensions")
+    return size[256], size[257]
+
+
+def sniff_image(header: bytes | memoryview) -> tuple[str, int, int] | None:
+    """
+    Reads the format and dimensions from the first bytes of an encoded image.
+
+    Only the header is parsed, so oversized images can be rejected before
+    the rest of the file has arrived.
+
+    Args:
+        header: The start of a PNG, JPEG, GIF or TIFF file.
+
+    Returns:
+        ``(extension, width, height)``, or None if more bytes are needed.
+
+    Raises:
+        ValueError: If the data is not one of the supported formats.
+    """
+    if len(header) < 8:
+        return None
+    signature = bytes(header[:8])
+    size: tuple[int, int] | None
+    if signature == b"\x89PNG\r\n\x1a\n":
+        ext = ".png"
+        size = struct.unpack_from(">II", header, 16) if len(header) >= 24 else None
+    elif signature[:6] in (b"GIF87a", b"GIF89a"):
+        ext = ".gif"
+        size = struct.unpack_from("<HH", header, 6) if len(header) >= 10 else None
+    elif signature[:2] == b"\xff\xd8":
+        ext = ".jpg"
+        size = _sniff_jpeg(header)
+    elif signature[:4] in (b"II*\x00", b"MM\x00*"):
+        ext = ".tiff"
+        size = _sniff_tiff(header)
     else:
-        if not cv2.imwrite(str(path), image):
-            raise OSError(f"Could not save image to {path}")
+        raise ValueError("Not a PNG, JPEG, GIF or TIFF image")
+    return None if size is None else (ext, *size)
+
+
+MEDIA_TYPES = {
+    ".jpg": "image/jpeg",
+    ".jpeg": "image/jpeg",
+    ".png": "image/png",
+    ".gif": "image/gif",
+    ".tiff": "image/tiff",
+    ".webp": "image/webp",
+    ".avif": "image/avif",
+}
+
+
+@functools.cache
+def can_encode(ext: str) -> bool:
+    """Whether this OpenCV build has an encoder for a file extension."""
+    return ext.lower() in MEDIA_TYPES and cv2.haveImageWriter(f"x{ext.lower()}")
+
+
+def encode_params(
+    ext: str,
+    quality: int = 95,
+    *,
+    png_compression: int = 3,
+    progressive: bool = False,
+    optimize: bool = False,
+) -> list[int]:
+    """
+    Translates encoder options into OpenCV ``imwrite`` flags.
+
+    Args:
+        ext: Target file extension.
+        quality: 0-100 for JPEG, WebP and AVIF; WebP above 100 is lossless.
+        png_compression: zlib level 0-9; higher is smaller but slower.
+        progressive: Write a progressive JPEG.
+        optimize: Optimize JPEG Huffman tables.
+    """
+    ext = ext.lower()
+    if ext in (".jpg", ".jpeg"):
+        return [
+            *(cv2.IMWRITE_JPEG_QUALITY, quality),
+            *(cv2.IMWRITE_JPEG_PROGRESSIVE, int(progressive)),
+            *(cv2.IMWRITE_JPEG_OPTIMIZE, int(optimize)),
+        ]
+    if ext == ".png":
+        return [cv2.IMWRITE_PNG_COMPRESSION, png_compression]
+    if ext == ".webp":
+        return [cv2.IMWRITE_WEBP_QUALITY, quality]
+    if ext == ".avif":
+        return [cv2.IMWRITE_AVIF_QUALITY, quality]
+    return []
+
+
+@timed("encode")
+def encode_image(
+    image: ImageArray, ext: str, quality: int = 95, **options: Any
+) -> bytes:
+    """
+    Encodes an image into the format given by a file extension.
+
+    Keyword options are those of ``encode_params``.
+    """
+    ok, buffer = cv2.imencode(
+        ext.lower(), image, encode_params(ext, quality, **options)
+    )
+    if not ok:
+        raise OSError(f"Could not encode image as {ext}")
+    return buffer.tobytes()
+
+
+@timed("io.save")
+def save_image(
+    image: ImageArray, path: str | Path, quality: int = 95, **options: Any
+) -> None:
+    """Saves an image to the specified path; options are those of ``encode_params``."""
+    ext = Path(path).suffix.lower()
+    if ext == ".npy":
+        # Raw arrays skip the codec entirely, e.g. for spilling to disk
+        np.save(str(path), image)
+    elif not cv2.imwrite(str(path), image, encode_params(ext, quality, **options)):
+        raise OSError(f"Could not save image to {path}")
+
+
+def negotiate_format(accept: str | None, candidates: list[str]) -> str:
+    """
+    Picks the first of ``candidates`` (file extensions) that an ``Accept``
+    header allows, preferring higher q-values; falls back to the last one.
+    """
+    if not accept:
+        return candidates[-1]
+    weights = {}
+    for part in accept.split(","):
+        media_type, *params = (p.strip() for p in part.split(";"))
+        q = 1.0
+        for param in params:
+            name, _, value = param.partition("=")
+            if name.strip() == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        weights[media_type.lower()] = q
+
+    def weight(ext: str) -> float:
+        media_type = MEDIA_TYPES[ext]
+        for key in (media_type, media_type.split("/")[0] + "/*", "*/*"):
+            if key in weights:
+                return weights[key]
+        return 0.0
+
+    best = max(candidates, key=lambda ext: (weight(ext), -candidates.index(ext)))
+    return best if weight(best) > 0 else candidates[-1]
+
+
+def open_raw(path: str | Path) -> ImageArray:
+    """
+    Memory-maps an image stored as a raw ``.npy`` array without reading it.
+
+    Pixels are paged in from disk only when a region is accessed, so very
+    large images can be processed tile by tile.
+    """
+    image = np.load(str(path), mmap_mode="r")
+    if image.dtype != np.uint8 or image.ndim != 3:
+        raise ValueError(f"{path} is not an (H, W, C) uint8 image")
+    return image
+
+
+def create_raw(path: str | Path, shape: tuple[int, ...]) -> ImageArray:
+    """Creates a writable, disk-backed ``.npy`` image of the given shape."""
+    return np.lib.format.open_memmap(str(path), mode="w+", dtype=np.uint8, shape=shape)
+
+
+# TIFF tags read and written by open_tiff and create_tiff
+_TIFF_SIZES = {3: 2, 4: 4}  # SHORT, LONG
+_TIFF_TAGS = {
+    "width": 256,
+    "height": 257,
+    "bits": 258,
+    "compression": 259,
+    "photometric": 262,
+    "strip_offsets": 273,
+    "samples": 277,
+    "rows_per_strip": 278,
+    "strip_byte_counts": 279,
+    "planar": 284,
+}
+# Rows are grouped into strips of about this many bytes when writing
+TIFF_STRIP_BYTES = 1 << 16
+
+
+def _read_tiff_tags(f: Any) -> tuple[str, dict[int, list[int]]]:
+    header = f.read(8)
+    if header[:4] not in (b"II*\x00", b"MM\x00*"):
+        raise ValueError("Not a TIFF file")
+    order = "<" if header[:2] == b"II" else ">"
+    f.seek(struct.unpack_from(order + "I", header, 4)[0])
+    (count,) = struct.unpack(order + "H", f.read(2))
+    entries = f.read(12 * count)
+    tags = {}
+    for i in range(count):
+        tag, kind, n, value = struct.unpack_from(order + "HHI4s", entries, 12 * i)
+        if kind not in _TIFF_SIZES:
+            continue
+        code = order + ("H" if kind == 3 else "I") * n
+        if _TIFF_SIZES[kind] * n > 4:
+            position = f.tell()
+            f.seek(struct.unpack(order + "I", value)[0])
+            tags[tag] = list(struct.unpack(code, f.read(_TIFF_SIZES[kind] * n)))
+            f.seek(position)
+        else:
+            tags[tag] = list(struct.unpack_from(code, value))
+    return order, tags
+
+
+def open_tiff(path: str | Path) -> ImageArray | None:
+    """
+    Memory-maps an uncompressed 8-bit TIFF as a read-only BGR image.
+
+    Like ``open_raw``, pixels are only paged in when a region is accessed.
+    Returns None for TIFFs whose pixels are not stored as one run of
+    uncompressed RGB or grayscale bytes, which must be decoded instead.
+    """
+    with open(path, "rb") as f:
+        try:
+            _, tags = _read_tiff_tags(f)
+        except struct.error:
+            return None  # truncated; left to the decoder to report
+    t = {name: tags.get(tag) for name, tag in _TIFF_TAGS.items()}
+    if not (
+        t["width"] and t["height"] and t["strip_offsets"] and t["strip_byte_counts"]
+    ):
+        return None
+    width, height = t["width"][0], t["height"][0]
+    samples = (t["samples"] or [1])[0]
+    offsets, counts = t["strip_offsets"], t["strip_byte_counts"]
+    if (
+        (t["compression"] or [1])[0] != 1
+        or (t["planar"] or [1])[0] != 1
+        or (samples, (t["photometric"] or [None])[0]) not in ((1, 1), (3, 2))
+        or (t["bits"] or [1]) != [8] * samples
+        or len(offsets) != len(counts)
+        or any(
+            a + n != b for a, n, b in zip(offsets, counts, offsets[1:], strict=False)
+        )
+        or sum(counts) != width * height * samples
+    ):
+        return None
+    pixels = np.memmap(str(path), np.uint8, "r", offsets[0], (height, width, samples))
+    if samples == 1:
+        return np.broadcast_to(pixels, (height, width, 3))
+    return pixels[..., ::-1]
+
+
+def create_tiff(path: str | Path, shape: tuple[int, ...]) -> ImageArray:
+    """
+    Creates an uncompressed RGB TIFF and memory-maps its pixels for writing.
+
+    The returned array is a writable BGR view, so results can be written
+    into it tile by tile; the file is complete once the view is flushed.
+
+    Raises:
+        ValueError: If the image does not fit in a classic (32-bit) TIFF.
+    """
+    height, width, channels = shape
+    if channels != 3:
+        raise ValueError("Only 3-channel images can be written as TIFF")
+    row_bytes = width * 3
+    if height * row_bytes >= 1 << 32:
+        raise ValueError("Image is too large for a TIFF without BigTIFF support")
+    rows_per_strip = max(1, TIFF_STRIP_BYTES // row_bytes)
+    strips = -(-height // rows_per_strip)
+
+    entry_count = len(_TIFF_TAGS)
+    bits_at = 8 + 2 + 12 * entry_count + 4
+    offsets_at = bits_at + 6
+    counts_at = offsets_at + 4 * strips
+    data_at = counts_at + 4 * strips
+    strip_offsets = [data_at + i * rows_per_strip * row_bytes for i in range(strips)]
+    strip_counts = [
+        min(rows_per_strip, height - i * rows_per_strip) * row_bytes
+        for i in range(strips)
+    ]
+
+    def entry(tag: int, kind: int, values: list[int], at: int | None = None) -> bytes:
+        if at is not None:
+            return struct.pack("<HHII", tag, kind, len(values), at)
+        code = "H" if kind == 3 else "I"
+        value = struct.pack(f"<{len(values)}{code}", *values).ljust(4, b"\x00")
+        return struct.pack("<HHI", tag, kind, len(values)) + value
+
+    def array(tag: int, values: list[int], at: int) -> bytes:
+        return entry(tag, 4, values, at if len(values) > 1 else None)
+
+    entries = [
+        entry(256, 4, [width]),
+        entry(257, 4, [height]),
+        entry(258, 3, [8, 8, 8], bits_at),
+        entry(259, 3, [1]),
+        entry(262, 3, [2]),
+        array(273, strip_offsets, offsets_at),
+        entry(277, 3, [3]),
+        entry(278, 4, [rows_per_strip]),
+        array(279, strip_counts, counts_at),
+        entry(284, 3, [1]),
+    ]
+    header = b"II*\x00" + struct.pack("<I", 8)
+    header += struct.pack("<H", entry_count) + b"".join(entries) + b"\x00" * 4
+    header += struct.pack("<3H", 8, 8, 8)
+    header += struct.pack(f"<{strips}I", *strip_offsets)
+    header += struct.pack(f"<{strips}I", *strip_counts)
+    with open(path, "wb") as f:
+        f.write(header)
+        f.truncate(data_at + height * row_bytes)
+    pixels = np.memmap(str(path), np.uint8, "r+", data_at, (height, width, 3))
+    return pixels[..., ::-1]
@@ -0,0 +1,136 @@
+"""
+Lookup-table engine for per-pixel point operations.
+
+For 8-bit images every point operation is a function of a single channel
+value, so it is fully described by a (256, 3) table. Any chain of point
+operations composes into one such table, which is applied with a single
+``cv2.LUT`` pass. Tables are cached by their parameters, so repeated slider
+values cost nothing to compile.
+"""
+
+from __future__ import annotations
+
+import functools
+from collections.abc import Callable, Iterable
+from typing import Any
+
+import cv2
+import numpy as np
+from numpy.typing import NDArray
+
+from .types import ImageArray
+
+_RAMP = np.arange(256, dtype=np.uint8)
+
+
+def _per_channel(table: NDArray[Any]) -> NDArray[np.uint8]:
+    table = np.clip(np.rint(table), 0, 255).astype(np.uint8)
+    return np.repeat(table.reshape(256, 1), 3, axis=1)
+
+
+def brightness_contrast(
+    brightness: int = 0, contrast: float = 1.0
+) -> NDArray[np.uint8]:
+    """Table for ``|contrast * v + brightness|`` saturated to 0-255."""
+    # Running the ramp through the same OpenCV call keeps rounding identical
+    # to cv2.convertScaleAbs on a full image.
+    table = cv2.convertScaleAbs(_RAMP, alpha=contrast, beta=brightness)
+    return np.repeat(table.reshape(256, 1), 3, axis=1)
+
+
+def color_balance(red: int = 0, green: int = 0, blue: int = 0) -> NDArray[np.uint8]:
+    """Table adding a per-channel offset (BGR order), clipped to 0-255."""
+    ramp = _RAMP.astype(np.int16)
+    channels = [np.clip(ramp + offset, 0, 255) for offset in (blue, green, red)]
+    return np.stack(channels, axis=1).astype(np.uint8)
+
+
+def gamma(gamma: float = 1.0) -> NDArray[np.uint8]:
+    """Table for gamma correction; values above 1 brighten the midtones."""
+    if gamma <= 0:
+        raise ValueError("Gamma must be positive")
+    return _per_channel(255.0 * (_RAMP / 255.0) ** (1.0 / gamma))
+
+
+def levels(black: int = 0, white: int = 255, gamma: float = 1.0) -> NDArray[np.uint8]:
+    """Table stretching ``[black, white]`` to the full range with midtone gamma."""
+    if not 0 <= black < white <= 255:
+        raise ValueError("Levels require 0 <= black < white <= 255")
+    if gamma <= 0:
+        raise ValueError("Gamma must be positive")
+    normalized = np.clip((_RAMP.astype(np.float64) - black) / (white - black), 0, 1)
+    return _per_channel(255.0 * normalized ** (1.0 / gamma))
+
+
+def curve(points: Iterable[tuple[int, int]]) -> NDArray[np.uint8]:
+    """Table interpolating linearly between ``(input, output)`` control points."""
+    xs, ys = zip(*sorted(points), strict=True)
+    return _per_channel(np.interp(_RAMP, xs, ys))
+
+
+POINT_OPS: dict[str, Callable[..., NDArray[np.uint8]]] = {
+    "adjust_brightness_contrast": brightness_contrast,
+    "adjust_color_balance": color_balance,
+    "adjust_gamma": gamma,
+    "adjust_levels": levels,
+    "apply_curve": curve,
+}
+
+
+def _freeze(value: Any) -> Any:
+    if isinstance(value, list | tuple):
+        return tuple(_freeze(v) for v in value)
+    return value
+
+
+def _key(op: str, kwargs: dict[str, Any]) -> tuple[str, tuple[tuple[str, Any], ...]]:
+    if op not in POINT_OPS:
+        raise ValueError(f"{op} is not a point operation")
+    return (op, tuple(sorted((k, _freeze(v)) for k, v in kwargs.items())))
+
+
+@functools.lru_cache(maxsize=512)
+def _compile(
+    chain: tuple[tuple[str, tuple[tuple[str, Any], ...]], ...],
+) -> NDArray[np.uint8]:
+    lut = color_balance()
+    for op, params in chain:
+        step = POINT_OPS[op](**dict(params))
+        # step[lut[v, c], c] for every value v and channel c
+        lut = np.take_along_axis(step, lut.astype(np.intp), axis=0)
+    lut.flags.writeable = False
+    return lut
+
+
+def compile_lut(chain: Iterable[tuple[str, dict[str, Any]]]) -> NDArray[np.uint8]:
+    """
+    Composes a chain of point operations into one (256, 3) table.
+
+    Args:
+        chain: ``(operation name, kwargs)`` pairs in application order, using
+            the names of the ImageEditor methods, e.g.
+            ``[("adjust_brightness_contrast", {"brightness": 10})]``.
+
+    Returns:
+        A read-only table shared between callers with the same parameters.
+    """
+    return _compile(tuple(_key(op, kwargs) for op, kwargs in chain))
+
+
+def apply_lut(
+    image: ImageArray, lut: NDArray[np.uint8], out: ImageArray | None = None
+) -> ImageArray:
+    """
+    Maps every pixel through a (256, 3) per-channel table in one pass.
+
+    ``out`` may be ``image`` itself.
+    """
+    if image.ndim == 2 or (lut == lut[:, :1]).all():
+        # A single-channel table is applied to every channel and takes a
+        # much faster path in OpenCV than a three-channel one.
+        return cv2.LUT(image, np.ascontiguousarray(lut[:, 0]), dst=out)
+    return cv2.LUT(image, lut.reshape(256, 1, 3), dst=out)
+
+
+def cache_info() -> functools._CacheInfo:
+    return _compile.cache_info()
@@ -0,0 +1,115 @@
+"""
+Memory-bounded noise generation.
+
+Noise is drawn from a ``numpy.random.Generator`` in float32 blocks of a few
+rows at a time and written straight into the uint8 output, so the temporary
+memory is bounded by ``chunk_size`` elements instead of several float64
+copies of the whole image. Blocks consume the generator's stream in order,
+so the same seed gives the same result whatever the chunk size.
+"""
+
+from __future__ import annotations
+
+from collections.abc import Callable
+
+import numpy as np
+from numpy.typing import NDArray
+
+from .types import ImageArray
+
+# Elements (rows x columns x channels) generated per block; 1M float32 is 4 MB.
+CHUNK_SIZE = 1 << 20
+
+Block = NDArray[np.float32]
+
+
+def _gaussian(
+    rng: np.random.Generator, block: ImageArray, intensity: float, work: Block
+) -> None:
+    # ``intensity`` scales the variance, as a fraction of the full 0-255 range
+    rng.standard_normal(dtype=np.float32, out=work)
+    work *= np.float32((intensity * 255) ** 0.5)
+    work += block
+
+
+def _speckle(
+    rng: np.random.Generator, block: ImageArray, intensity: float, work: Block
+) -> None:
+    # Multiplicative noise with variance ``intensity``: v * (1 + n)
+    rng.standard_normal(dtype=np.float32, out=work)
+    work *= np.float32(intensity**0.5)
+    work += 1
+    work *= block
+
+
+def _poisson(
+    rng: np.random.Generator, block: ImageArray, intensity: float, work: Block
+) -> None:
+    # Shot noise: each value counts photons, ``1 / intensity`` per level
+    scale = 1.0 / max(intensity, 1e-6)
+    np.multiply(block, np.float32(scale), out=work)
+    work[...] = rng.poisson(work)
+    work *= np.float32(1.0 / scale)
+
+
+def _salt_pepper(
+    rng: np.random.Generator, block: ImageArray, intensity: float, work: Block
+) -> None:
+    # Whole pixels (all channels) turn white or black with probability
+    # intensity / 2 each.
+    draw = rng.random(block.shape[:2], dtype=np.float32)
+    work[...] = block
+    work[draw < intensity / 2] = 255
+    work[draw > 1 - intensity / 2] = 0
+
+
+NOISE_MODELS: dict[
+    str, Callable[[np.random.Generator, ImageArray, float, Block], None]
+] = {
+    "gaussian": _gaussian,
+    "salt_pepper": _salt_pepper,
+    "poisson": _poisson,
+    "speckle": _speckle,
+}
+
+
+def add_noise(
+    image: ImageArray,
+    noise_type: str = "gaussian",
+    intensity: float = 0.1,
+    seed: int | None = None,
+    *,
+    chunk_size: int = CHUNK_SIZE,
+    out: ImageArray | None = None,
+) -> ImageArray:
+    """
+    Adds noise to a uint8 image, a block of rows at a time.
+
+    Args:
+        image: The (H, W) or (H, W, C) image.
+        noise_type: One of ``NOISE_MODELS``.
+        intensity: Strength of the noise; its meaning depends on the model.
+        seed: Seed for the generator; None draws fresh entropy.
+        chunk_size: Upper bound on the elements generated per block.
+        out: Array to write the result to; may be ``image`` itself.
+
+    Returns:
+        ``out``, or a new array if it was not given.
+    """
+    model = NOISE_MODELS.get(noise_type)
+    if model is None:
+        return image
+    if out is None:
+        out = np.empty_like(image)
+    rng = np.random.default_rng(seed)
+    row_size = image[:1].size
+    rows = max(1, chunk_size // max(row_size, 1))
+    buffer = np.empty(rows * row_size, dtype=np.float32)
+    for y in range(0, image.shape[0], rows):
+        block = image[y : y + rows]
+        work = buffer[: block.size].reshape(block.shape)
+        model(rng, block, intensity, work)
+        np.clip(work, 0, 255, out=work)
+        np.rint(work, out=work)
+        out[y : y + rows] = work
+    return out
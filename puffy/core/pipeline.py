@@ -0,0 +1,299 @@
+"""
+Deferred execution of ImageEditor operations.
+
+Operations are recorded instead of being applied and only run when the image
+is materialized. Before running, the recorded chain is rewritten so that it
+touches as few pixels as possible:
+
+* crops are moved ahead of filters (blur, noise, point operations), widened
+  by the filter halo so the visible result is unchanged;
+* runs of geometric operations (resize, rotate, flip, crop) are composed into
+  a single affine matrix and executed as one ``cv2.warpAffine``;
+* runs of point operations (brightness/contrast, color balance, gamma, levels,
+  curves) are composed into a single lookup table and executed as one
+  ``cv2.LUT``.
+
+Filters limited to a ``roi`` or ``mask`` run on their own.
+"""
+
+from __future__ import annotations
+
+from collections.abc import Callable
+from dataclasses import dataclass, field
+from typing import Any
+
+import cv2
+import numpy as np
+from numpy.typing import NDArray
+
+from . import adjustments, blur, effects, lut, transform
+from .types import ImageArray
+
+Size = tuple[int, int]  # (width, height)
+
+GEOMETRIC_OPS = frozenset({"resize", "rotate", "flip", "crop"})
+POINT_OPS = frozenset(lut.POINT_OPS)
+FILTER_OPS = POINT_OPS | {"blur", "add_noise"}
+# Noise is drawn for the whole frame, so a crop moved ahead of it would
+# change which samples land on which pixel.
+CROP_BARRIERS = frozenset({"add_noise"})
+
+OPERATIONS: dict[str, Callable[..., ImageArray]] = {
+    "resize": transform.resize,
+    "rotate": transform.rotate,
+    "crop": transform.crop,
+    "flip": transform.flip,
+    "adjust_brightness_contrast": adjustments.adjust_brightness_contrast,
+    "adjust_color_balance": adjustments.adjust_color_balance,
+    "adjust_gamma": adjustments.adjust_gamma,
+    "adjust_levels": adjustments.adjust_levels,
+    "apply_curve": adjustments.apply_curve,
+    "add_noise": effects.add_noise,
+    "blur": effects.blur,
+}
+
+_INTERPOLATION = {
+    "nearest": cv2.INTER_NEAREST,
+    "bilinear": cv2.INTER_LINEAR,
+    "bicubic": cv2.INTER_CUBIC,
+}
+
+
+@dataclass(frozen=True)
+class Step:
+    """One ImageEditor method call, e.g. ``Step("blur", {"kernel_size": 7})``."""
+
+    op: str
+    kwargs: dict[str, Any] = field(default_factory=dict)
+
+
+def is_deterministic(step: Step) -> bool:
+    """Whether running a step twice on the same input gives the same output."""
+    return step.op != "add_noise" or step.kwargs.get("seed") is not None
+
+
+@dataclass(frozen=True)
+class Operation:
+    """A recorded call of an ImageEditor method."""
+
+    name: str
+    kwargs: dict[str, Any]
+    size: Size  # input size of the operation
+
+    @property
+    def output_size(self) -> Size:
+        if self.name in ("resize", "crop"):
+            return (self.kwargs["width"], self.kwargs["height"])
+        return self.size
+
+    def halo(self) -> int:
+        """Number of neighbouring pixels an output pixel depends on."""
+        if self.name == "blur":
+            return blur.halo(
+                self.kwargs.get("blur_type", "gaussian"),
+                self.kwargs.get("kernel_size", 5),
+            )
+        return 0
+
+    @property
+    def regional(self) -> bool:
+        """Whether the operation is limited to a roi or mask."""
+        return self.kwargs.get("roi") is not None or self.kwargs.get("mask") is not None
+
+
+@dataclass
+class Stage:
+    """One step of an optimized plan."""
+
+    kind: str
+    run: Callable[[ImageArray], ImageArray] = field(repr=False)
+
+    def __call__(self, image: ImageArray) -> ImageArray:
+        return self.run(image)
+
+
+def _crop(x: int, y: int, width: int, height: int, size: Size) -> Operation:
+    return Operation("crop", {"x": x, "y": y, "width": width, "height": height}, size)
+
+
+def push_crops_down(operations: list[Operation]) -> list[Operation]:
+    """Moves every crop ahead of the filters that directly precede it.
+
+    Crops stop at filters in ``CROP_BARRIERS`` and at regional filters.
+    """
+    result = list(operations)
+    i = 0
+    while i < len(result):
+        op = result[i]
+        start = i
+        # Filters limited to a region are placed in the coordinates of
+        # their input, so crops are not moved across them.
+        while (
+            start > 0
+            and result[start - 1].name in FILTER_OPS
+            and result[start - 1].name not in CROP_BARRIERS
+            and not result[start - 1].regional
+        ):
+            start -= 1
+        if op.name != "crop" or start == i:
+            i += 1
+            continue
+
+        filters = result[start:i]
+        halo = sum(f.halo() for f in filters)
+        width, height = op.size
+        x0 = max(op.kwargs["x"] - halo, 0)
+        y0 = max(op.kwargs["y"] - halo, 0)
+        x1 = min(op.kwargs["x"] + op.kwargs["width"] + halo, width)
+        y1 = min(op.kwargs["y"] + op.kwargs["height"] + halo, height)
+        region = (x1 - x0, y1 - y0)
+
+        rewritten = [_crop(x0, y0, *region, op.size)]
+        rewritten += [Operation(f.name, f.kwargs, region) for f in filters]
+        if (x0, y0, region) != (op.kwargs["x"], op.kwargs["y"], op.output_size):
+            rewritten.append(
+                _crop(
+                    op.kwargs["x"] - x0,
+                    op.kwargs["y"] - y0,
+                    op.kwargs["width"],
+                    op.kwargs["height"],
+                    region,
+                )
+            )
+        result[start : i + 1] = rewritten
+        i = start + len(rewritten)
+    return result
+
+
+def affine_matrix(op: Operation) -> NDArray[np.float64]:
+    """Returns the 3x3 matrix mapping input to output pixel coordinates."""
+    width, height = op.size
+    matrix = np.eye(3)
+    if op.name == "resize":
+        sx = op.kwargs["width"] / width
+        sy = op.kwargs["height"] / height
+        # cv2.resize aligns pixel centres, not pixel corners
+        matrix[0] = (sx, 0, 0.5 * sx - 0.5)
+        matrix[1] = (0, sy, 0.5 * sy - 0.5)
+    elif op.name == "rotate":
+        center = op.kwargs.get("center") or (width // 2, height // 2)
+        matrix[:2] = cv2.getRotationMatrix2D(center, op.kwargs["angle"], 1.0)
+    elif op.name == "flip":
+        if op.kwargs.get("horizontal", True):
+            matrix[0] = (-1, 0, width - 1)
+        if op.kwargs.get("vertical", False):
+            matrix[1] = (0, -1, height - 1)
+    elif op.name == "crop":
+        matrix[0, 2] = -op.kwargs["x"]
+        matrix[1, 2] = -op.kwargs["y"]
+    else:
+        raise ValueError(f"{op.name} is not a geometric operation")
+    return matrix
+
+
+def _affine_stage(run: list[Operation]) -> Stage:
+    matrix = np.eye(3)
+    for op in run:
+        matrix = affine_matrix(op) @ matrix
+    size = run[-1].output_size
+
+    names = {op.name for op in run}
+    resizes = [op for op in run if op.name == "resize"]
+    if resizes:
+        interpolation = _INTERPOLATION.get(
+            resizes[-1].kwargs.get("interpolation", "bicubic"), cv2.INTER_CUBIC
+        )
+    elif "rotate" in names:
+        interpolation = cv2.INTER_LINEAR
+    else:
+        # flips and crops only move whole pixels
+        interpolation = cv2.INTER_NEAREST
+    # rotate fills uncovered corners with black; resize replicates the edge
+    border = cv2.BORDER_CONSTANT if "rotate" in names else cv2.BORDER_REPLICATE
+
+    def warp(image: ImageArray) -> ImageArray:
+        return cv2.warpAffine(
+            image, matrix[:2], size, flags=interpolation, borderMode=border
+        )
+
+    return Stage("affine", warp)
+
+
+def _lut_stage(run: list[Operation]) -> Stage:
+    table = lut.compile_lut((op.name, op.kwargs) for op in run)
+    return Stage("lut", lambda image: lut.apply_lut(image, table))
+
+
+def _single_stage(op: Operation) -> Stage:
+    function = OPERATIONS[op.name]
+    kind = op.name
+    if op.name == "blur":
+        strategy = blur.choose_strategy(
+            op.kwargs.get("blur_type", "gaussian"), op.kwargs.get("kernel_size", 5) | 1
+        )
+        kind = f"blur:{strategy}"
+    return Stage(kind, lambda image: function(image, **op.kwargs))
+
+
+def plan(operations: list[Operation]) -> list[Stage]:
+    """Rewrites a recorded chain into the stages that will actually run."""
+    stages: list[Stage] = []
+    operations = push_crops_down(operations)
+    i = 0
+    while i < len(operations):
+        op = operations[i]
+        group = GEOMETRIC_OPS if op.name in GEOMETRIC_OPS else POINT_OPS
+        j = i + 1
+        if op.name in group and not op.regional:
+            while (
+                j < len(operations)
+                and operations[j].name in group
+                and not operations[j].regional
+            ):
+                j += 1
+        run = operations[i:j]
+        if len(run) == 1:
+            stages.append(_single_stage(op))
+        elif group is GEOMETRIC_OPS:
+            stages.append(_affine_stage(run))
+        else:
+            stages.append(_lut_stage(run))
+        i = j
+    return stages
+
+
+class Pipeline:
+    """Records operations for an image of a known size and runs them later."""
+
+    def __init__(self, size: Size):
+        self.size = size
+        self.operations: list[Operation] = []
+
+    def record(self, name: str, **kwargs: Any) -> None:
+        if name not in OPERATIONS:
+            raise ValueError(f"Unknown operation: {name}")
+        op = Operation(name, kwargs, self.size)
+        if name == "crop":
+            width, height = self.size
+            x, y = kwargs["x"], kwargs["y"]
+            if (
+                x < 0
+                or y < 0
+                or x + kwargs["width"] > width
+                or y + kwargs["height"] > height
+            ):
+                raise ValueError("Crop coordinates are out of bounds")
+        self.operations.append(op)
+        self.size = op.output_size
+
+    def plan(self) -> list[Stage]:
+        return plan(self.operations)
+
+    def run(self, image: ImageArray) -> ImageArray:
+        for stage in self.plan():
+            image = stage(image)
+        self.operations.clear()
+        return image
+
+    def __len__(self) -> int:
+        return len(self.operations)
@@ -0,0 +1,88 @@
+"""
+Multi-resolution image pyramids for fast interactive previews.
+
+Operations on a preview level are given in full-resolution coordinates and
+rescaled with ``scale_step`` so that the preview stays geometrically
+consistent with the result of running the same steps at full resolution.
+"""
+
+from __future__ import annotations
+
+import cv2
+import numpy as np
+
+from .pipeline import Size, Step
+from .types import ImageArray
+
+
+def build_pyramid(image: ImageArray, min_side: int = 128) -> list[ImageArray]:
+    """
+    Returns ``[image, image/2, image/4, ...]`` down to ``min_side`` pixels.
+
+    Each level is produced by ``cv2.pyrDown`` from the previous one, which
+    low-pass filters before decimating so previews do not alias.
+    """
+    levels = [image]
+    while min(levels[-1].shape[:2]) // 2 >= min_side:
+        levels.append(cv2.pyrDown(levels[-1]))
+    return levels
+
+
+def select_level(pyramid: list[ImageArray], max_side: int) -> ImageArray:
+    """Returns the largest level whose longer side fits within ``max_side``."""
+    for level in pyramid:
+        if max(level.shape[:2]) <= max_side:
+            return level
+    return pyramid[-1]
+
+
+def _scaled(value: float, scale: float) -> int:
+    return max(1, round(value * scale))
+
+
+def scale_step(step: Step, preview: ImageArray, size: Size) -> Step:
+    """
+    Rescales a full-resolution step so it can run on a preview image.
+
+    Args:
+        step: The step with full-resolution arguments.
+        preview: The preview image the step will be applied to.
+        size: The full-resolution (width, height) the step applies to.
+
+    Returns:
+        The step with coordinates, sizes and kernel sizes scaled to the preview.
+    """
+    preview_height, preview_width = preview.shape[:2]
+    sx = preview_width / size[0]
+    sy = preview_height / size[1]
+    kwargs = dict(step.kwargs)
+
+    if step.op == "resize":
+        kwargs["width"] = _scaled(kwargs["width"], sx)
+        kwargs["height"] = _scaled(kwargs["height"], sy)
+    elif step.op == "crop":
+        x = min(round(kwargs["x"] * sx), preview_width - 1)
+        y = min(round(kwargs["y"] * sy), preview_height - 1)
+        kwargs["x"], kwargs["y"] = x, y
+        kwargs["width"] = min(_scaled(kwargs["width"], sx), preview_width - x)
+        kwargs["height"] = min(_scaled(kwargs["height"], sy), preview_height - y)
+    elif step.op == "rotate" and kwargs.get("center") is not None:
+        cx, cy = kwargs["center"]
+        kwargs["center"] = (round(cx * sx), round(cy * sy))
+    elif step.op == "blur":
+        kwargs["kernel_size"] = _scaled(kwargs.get("kernel_size", 5), (sx + sy) / 2)
+    if kwargs.get("roi") is not None:
+        x, y, width, height = kwargs["roi"]
+        kwargs["roi"] = (
+            round(x * sx),
+            round(y * sy),
+            _scaled(width, sx),
+            _scaled(height, sy),
+        )
+    if kwargs.get("mask") is not None:
+        kwargs["mask"] = cv2.resize(
+            np.asarray(kwargs["mask"], dtype=np.uint8),
+            (preview_width, preview_height),
+            interpolation=cv2.INTER_NEAREST,
+        )
+    return Step(step.op, kwargs)
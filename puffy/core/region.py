@@ -0,0 +1,119 @@
+"""
+Filters restricted to part of an image.
+
+A filter can be limited to a rectangle (``roi``), to the pixels selected by
+a mask, or to both. It then only runs on a view of the bounding box of that
+region, grown by the filter's halo so that pixels near the edge of the
+region see the same neighbours as when the whole image is filtered, and
+only the selected pixels are written. The cost of the filter grows with the
+region instead of the image.
+"""
+
+from __future__ import annotations
+
+from collections.abc import Callable, Sequence
+
+import cv2
+import numpy as np
+from numpy.typing import NDArray
+
+from .types import ImageArray
+
+Roi = tuple[int, int, int, int]  # (x, y, width, height)
+Mask = NDArray[np.bool_] | NDArray[np.uint8]  # (H, W), nonzero where selected
+
+
+def region_bounds(
+    shape: tuple[int, ...], roi: Sequence[int] | None, mask: Mask | None
+) -> Roi | None:
+    """
+    The box enclosing the selected pixels, clipped to the image.
+
+    Returns:
+        ``(x, y, width, height)``, or None if nothing is selected.
+
+    Raises:
+        ValueError: If the roi has no area or the mask is not ``(H, W)``.
+    """
+    height, width = shape[:2]
+    x0, y0, x1, y1 = 0, 0, width, height
+    if roi is not None:
+        x, y, w, h = (int(v) for v in roi)
+        if w <= 0 or h <= 0:
+            raise ValueError("Region width and height must be positive")
+        x0, y0, x1, y1 = max(x, 0), max(y, 0), min(x + w, width), min(y + h, height)
+    if mask is not None:
+        if mask.shape != (height, width):
+            raise ValueError(f"Mask must have shape {(height, width)}")
+        if x0 >= x1 or y0 >= y1:
+            return None
+        mx, my, mw, mh = cv2.boundingRect(
+            np.ascontiguousarray(mask[y0:y1, x0:x1], dtype=np.uint8)
+        )
+        x0, y0, x1, y1 = x0 + mx, y0 + my, x0 + mx + mw, y0 + my + mh
+    if x0 >= x1 or y0 >= y1:
+        return None
+    return (x0, y0, x1 - x0, y1 - y0)
+
+
+def apply_filter(
+    image: ImageArray,
+    fn: Callable[[ImageArray, ImageArray | None], ImageArray],
+    *,
+    roi: Sequence[int] | None = None,
+    mask: Mask | None = None,
+    halo: int = 0,
+    out: ImageArray | None = None,
+) -> ImageArray:
+    """
+    Runs a filter on the region of an image selected by ``roi`` and ``mask``.
+
+    Args:
+        image: The image to filter.
+        fn: The filter, called with its source and an array to write to, or
+            None; it returns its result. The source is a view of the
+            region's bounding box plus ``halo`` pixels.
+        roi: ``(x, y, width, height)`` of the rectangle to filter; clipped
+            to the image.
+        mask: ``(H, W)`` array that is nonzero where the filter applies.
+        halo: Number of neighbouring pixels an output pixel depends on.
+        out: Array to write the result to, holding the pixels of ``image``
+            outside the region; may be ``image`` itself if ``fn`` can write
+            over its source.
+
+    Returns:
+        ``out``, or a new array if it was not given. Without a roi or mask
+        this is the result of ``fn`` on the whole image.
+
+    Raises:
+        ValueError: See ``region_bounds``.
+    """
+    if roi is None and mask is None:
+        result = fn(image, out)
+        if out is None or result is out:
+            return result
+        out[...] = result
+        return out
+
+    bounds = region_bounds(image.shape, roi, mask)
+    if out is None:
+        out = image.copy()
+    elif out is not image:
+        out[...] = image
+    if bounds is None:
+        return out
+    x, y, w, h = bounds
+    height, width = image.shape[:2]
+    x0, y0 = max(x - halo, 0), max(y - halo, 0)
+    x1, y1 = min(x + w + halo, width), min(y + h + halo, height)
+
+    filtered = fn(image[y0:y1, x0:x1], None)[y - y0 : y - y0 + h, x - x0 : x - x0 + w]
+    target = out[y : y + h, x : x + w]
+    if mask is None:
+        target[...] = filtered
+    else:
+        selected = mask[y : y + h, x : x + w] != 0
+        if target.ndim == 3:
+            selected = selected[..., None]
+        np.copyto(target, filtered, where=selected)
+    return out
@@ -0,0 +1,163 @@
+"""
+Lightweight timing instrumentation.
+
+``timed(stage)`` measures a block (or, used as a decorator, a function) and
+records the duration in a per-stage histogram. Inside ``collect()`` the
+duration is also appended to the timings of the current request, which
+follow the request onto worker threads as long as the work is started with
+a copy of its context.
+"""
+
+from __future__ import annotations
+
+import bisect
+import threading
+import time
+from collections.abc import Iterator
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+# Upper bounds in seconds, as in the Prometheus client defaults.
+BUCKETS = (
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.075,
+    0.1,
+    0.25,
+    0.5,
+    0.75,
+    1.0,
+    2.5,
+    5.0,
+    7.5,
+    10.0,
+)
+
+Labels = tuple[tuple[str, str], ...]
+Timings = list[tuple[str, float]]
+
+
+class Histogram:
+    """Cumulative-bucket histogram of durations."""
+
+    def __init__(self, buckets: tuple[float, ...] = BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # the last bucket is +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, seconds: float) -> None:
+        self.counts[bisect.bisect_left(self.buckets, seconds)] += 1
+        self.sum += seconds
+        self.count += 1
+
+
+class Registry:
+    """Histograms keyed by metric name and labels."""
+
+    def __init__(self) -> None:
+        self._histograms: dict[tuple[str, Labels], Histogram] = {}
+        self._help: dict[str, str] = {}
+        self._lock = threading.Lock()
+
+    def describe(self, metric: str, help_text: str) -> None:
+        self._help[metric] = help_text
+
+    def observe(self, metric: str, labels: dict[str, str], seconds: float) -> None:
+        key = (metric, tuple(sorted(labels.items())))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = Histogram()
+            histogram.observe(seconds)
+
+    def render(self) -> str:
+        """Returns all histograms in the Prometheus text exposition format."""
+        lines = []
+        with self._lock:
+            items = sorted(self._histograms.items())
+            seen = set()
+            for (metric, labels), histogram in items:
+                if metric not in seen:
+                    seen.add(metric)
+                    if metric in self._help:
+                        lines.append(f"# HELP {metric} {self._help[metric]}")
+                    lines.append(f"# TYPE {metric} histogram")
+                cumulative = 0
+                bounds = [*(str(b) for b in histogram.buckets), "+Inf"]
+                for bound, count in zip(bounds, histogram.counts, strict=True):
+                    cumulative += count
+                    lines.append(
+                        f"{metric}_bucket{_labels((*labels, ('le', bound)))} {cumulative}"
+                    )
+                lines.append(f"{metric}_sum{_labels(labels)} {histogram.sum}")
+                lines.append(f"{metric}_count{_labels(labels)} {histogram.count}")
+        return "\n".join(lines) + "\n"
+
+
+def _labels(labels: Labels) -> str:
+    if not labels:
+        return ""
+    escaped = (
+        (k, v.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n"))
+        for k, v in labels
+    )
+    return "{" + ",".join(f'{k}="{v}"' for k, v in escaped) + "}"
+
+
+registry = Registry()
+registry.describe("puffy_stage_seconds", "Time spent in each processing stage.")
+registry.describe(
+    "puffy_operation_seconds", "Time spent computing each ImageEditor operation."
+)
+
+_timings: ContextVar[Timings | None] = ContextVar("timings", default=None)
+
+
+@contextmanager
+def collect() -> Iterator[Timings]:
+    """Collects the stage timings recorded in this context until exit."""
+    timings: Timings = []
+    token = _timings.set(timings)
+    try:
+        yield timings
+    finally:
+        _timings.reset(token)
+
+
+def record(stage: str, seconds: float) -> None:
+    registry.observe("puffy_stage_seconds", {"stage": stage}, seconds)
+    timings = _timings.get()
+    if timings is not None:
+        timings.append((stage, seconds))
+
+
+@contextmanager
+def timed(stage: str, operation: str | None = None) -> Iterator[None]:
+    """Times a block as ``stage``, and also per ``operation`` if one is given."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        record(stage, elapsed)
+        if operation is not None:
+            registry.observe(
+                "puffy_operation_seconds", {"operation": operation}, elapsed
+            )
+
+
+def server_timing(timings: Timings) -> str:
+    """
+    Formats timings as a ``Server-Timing`` header value.
+
+    Repeated stages are summed, e.g. two decodes appear as one entry.
+    """
+    totals: dict[str, float] = {}
+    for stage, seconds in timings:
+        totals[stage] = totals.get(stage, 0.0) + seconds
+    return ", ".join(
+        f"{stage};dur={seconds * 1e3:.2f}" for stage, seconds in totals.items()
+    )
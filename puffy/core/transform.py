@@ -1,12 +1,18 @@
 
+from __future__ import annotations
+
 import cv2
-import numpy as np
 
 from .types import ImageArray
 
 
 def resize(
-    image: ImageArray, width: int, height: int, interpolation: str = "bicubic"
+    image: ImageArray,
+    width: int,
+    height: int,
+    interpolation: str = "bicubic",
+    *,
+    out: ImageArray | None = None,
 ) -> ImageArray:
     """Resizes an image with a specified interpolation method."""
     inter_map = {
@@ -15,9 +21,7 @@ def resize(
         "bicubic": cv2.INTER_CUBIC,
     }
     interpolation_flag = inter_map.get(interpolation, cv2.INTER_CUBIC)
-    return cv2.resize(image, (width, height), interpolation=interpolation_flag).astype(
-        np.uint8
-    )
+    return cv2.resize(image, (width, height), dst=out, interpolation=interpolation_flag)
 
 
 def crop(image: ImageArray, x: int, y: int, width: int, height: int) -> ImageArray:
@@ -28,7 +32,11 @@ def crop(image: ImageArray, x: int, y: int, width: int, height: int) -> ImageArr
 
 
 def flip(
-    image: ImageArray, horizontal: bool = True, vertical: bool = False
+    image: ImageArray,
+    horizontal: bool = True,
+    vertical: bool = False,
+    *,
+    out: ImageArray | None = None,
 ) -> ImageArray:
     """Flips an image horizontally, vertically, or both."""
     if horizontal and vertical:
@@ -39,11 +47,15 @@ def flip(
         flip_code = 0
     else:
         return image
-    return cv2.flip(image, flip_code).astype(np.uint8)
+    return cv2.flip(image, flip_code, dst=out)
 
 
 def rotate(
-    image: ImageArray, angle: float, center: tuple[int, int] | None = None
+    image: ImageArray,
+    angle: float,
+    center: tuple[int, int] | None = None,
+    *,
+    out: ImageArray | None = None,
 ) -> ImageArray:
     """Rotates an image by a specified angle and center."""
     (h, w) = image.shape[:2]
@@ -51,4 +63,4 @@ def rotate(
         center = (w // 2, h // 2)
 
     M = cv2.getRotationMatrix2D(center, angle, 1.0)
-    return cv2.warpAffine(image, M, (w, h)).astype(np.uint8)
+    return cv2.warpAffine(image, M, (w, h), dst=out)
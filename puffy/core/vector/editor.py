@@ -6,18 +6,29 @@ ET.register_namespace("xlink", "http://www.w3.org/1999/xlink")
 
 
 class VectorEditor:
-    def __init__(self, filepath: Path):
+    def __init__(self, filepath: Path, tree: ET.ElementTree | None = None):
         self.filepath = filepath
-        try:
-            self.tree = ET.parse(filepath)
-            self.root = self.tree.getroot()
-        except (FileNotFoundError, ET.ParseError):
-            self.root = ET.Element("svg")
-            self.tree = ET.ElementTree(self.root)
+        if tree is None:
+            try:
+                tree = ET.parse(filepath)
+            except (FileNotFoundError, ET.ParseError):
+                tree = ET.ElementTree(ET.Element("svg"))
+        self.tree = tree
+        self.root = tree.getroot()
+        # Kept up to date by the add_* methods so callers can bound memory
+        # without walking the tree.
+        self.elements = sum(1 for _ in self.root.iter())
 
     @classmethod
-    def create_canvas(cls, filepath: Path, width: int, height: int, units: str = "px"):
-        editor = cls(filepath)
+    def create_canvas(
+        cls,
+        filepath: Path,
+        width: int,
+        height: int,
+        units: str = "px",
+        save: bool = True,
+    ):
+        editor = cls(filepath, ET.ElementTree(ET.Element("svg")))
         editor.root.set("width", f"{width}{units}")
         editor.root.set("height", f"{height}{units}")
         editor.root.set("xmlns", "http://www.w3.org/2000/svg")
@@ -32,11 +43,31 @@ class VectorEditor:
             "fill": "white",
         }
         ET.SubElement(editor.root, "rect", rect_attrs)
+        editor.elements += 1
 
-        editor.save()
+        if save:
+            editor.save()
         return editor
 
-    def add_rect(self, x, y, width, height, fill, stroke, stroke_width):
+    def _add(self, tag, attrs, element_id=None, parent=None):
+        if element_id is not None:
+            attrs["id"] = element_id
+        self.elements += 1
+        return ET.SubElement(self.root if parent is None else parent, tag, attrs)
+
+    def add_rect(
+        self,
+        x,
+        y,
+        width,
+        height,
+        fill="none",
+        stroke="black",
+        stroke_width=1,
+        *,
+        element_id=None,
+        parent=None,
+    ):
         rect_attrs = {
             "x": str(x),
             "y": str(y),
@@ -46,7 +77,78 @@ class VectorEditor:
             "stroke": stroke,
             "stroke-width": str(stroke_width),
         }
-        ET.SubElement(self.root, "rect", rect_attrs)
+        return self._add("rect", rect_attrs, element_id, parent)
+
+    def add_ellipse(
+        self,
+        cx,
+        cy,
+        rx,
+        ry,
+        fill="none",
+        stroke="black",
+        stroke_width=1,
+        *,
+        element_id=None,
+        parent=None,
+    ):
+        ellipse_attrs = {
+            "cx": str(cx),
+            "cy": str(cy),
+            "rx": str(rx),
+            "ry": str(ry),
+            "fill": fill,
+            "stroke": stroke,
+            "stroke-width": str(stroke_width),
+        }
+        return self._add("ellipse", ellipse_attrs, element_id, parent)
+
+    def add_line(
+        self,
+        x1,
+        y1,
+        x2,
+        y2,
+        stroke="black",
+        stroke_width=1,
+        *,
+        element_id=None,
+        parent=None,
+    ):
+        line_attrs = {
+            "x1": str(x1),
+            "y1": str(y1),
+            "x2": str(x2),
+            "y2": str(y2),
+            "stroke": stroke,
+            "stroke-width": str(stroke_width),
+        }
+        return self._add("line", line_attrs, element_id, parent)
+
+    def add_path(
+        self,
+        d,
+        fill="none",
+        stroke="black",
+        stroke_width=1,
+        *,
+        element_id=None,
+        parent=None,
+    ):
+        path_attrs = {
+            "d": d,
+            "fill": fill,
+            "stroke": stroke,
+            "stroke-width": str(stroke_width),
+        }
+        return self._add("path", path_attrs, element_id, parent)
+
+    def add_group(self, transform=None, *, element_id=None, parent=None):
+        group_attrs = {} if transform is None else {"transform": transform}
+        return self._add("g", group_attrs, element_id, parent)
+
+    def to_bytes(self) -> bytes:
+        return ET.tostring(self.root, encoding="utf-8", xml_declaration=True)
 
     def save(self):
         self.tree.write(self.filepath, encoding="utf-8", xml_declaration=True)
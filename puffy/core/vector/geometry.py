@@ -0,0 +1,327 @@
+"""
+Geometry of the SVG subset written by ``VectorEditor``.
+
+Every shape is flattened into polylines in canvas pixels: rects, ellipses,
+lines and paths (``M L H V C S Q T Z``; arcs are drawn as straight lines),
+optionally nested in groups with ``translate``, ``scale``, ``rotate`` and
+``matrix`` transforms. Lengths may be given in px, mm, cm, in or pt, or as
+percentages of the canvas.
+"""
+
+from __future__ import annotations
+
+import math
+import re
+import xml.etree.ElementTree as ET
+from collections.abc import Iterator
+from dataclasses import dataclass
+from functools import cached_property
+
+import numpy as np
+from numpy.typing import NDArray
+
+Points = NDArray[np.float64]  # (N, 2)
+Box = tuple[float, float, float, float]  # (x0, y0, x1, y1)
+
+# Pixels per unit, at the CSS resolution of 96 dpi.
+UNITS = {"px": 1.0, "mm": 96 / 25.4, "cm": 96 / 2.54, "in": 96.0, "pt": 96 / 72}
+
+_NUMBER = r"[-+]?(?:\d*\.\d+|\d+\.?)(?:[eE][-+]?\d+)?"
+_LENGTH = re.compile(rf"\s*({_NUMBER})\s*(px|mm|cm|in|pt|%)?\s*$")
+_PATH_TOKEN = re.compile(rf"[MmLlHhVvCcSsQqTtAaZz]|{_NUMBER}")
+_TRANSFORM = re.compile(r"(matrix|translate|scale|rotate)\s*\(([^)]*)\)")
+
+
+def local_name(element: ET.Element) -> str:
+    """The tag without its namespace: files read back from disk are namespaced."""
+    return element.tag.rpartition("}")[2]
+
+
+def parse_length(
+    value: str | None, reference: float = 0.0, default: float = 0.0
+) -> float:
+    """Converts an SVG length to pixels; percentages are of ``reference``."""
+    if value is None:
+        return default
+    try:
+        return float(value)  # plain user units, by far the most common
+    except ValueError:
+        pass
+    match = _LENGTH.match(value)
+    if match is None:
+        return default
+    number, unit = float(match[1]), match[2]
+    if unit == "%":
+        return number * reference / 100
+    return number * UNITS.get(unit or "px", 1.0)
+
+
+def numbers(value: str | None) -> list[float]:
+    """Every number in a transform list or path data."""
+    return [float(v) for v in re.findall(_NUMBER, value or "")]
+
+
+def parse_transform(value: str | None) -> NDArray[np.float64]:
+    """Parses a transform list into a 3x3 affine matrix."""
+    matrix = np.eye(3)
+    for name, args in _TRANSFORM.findall(value or ""):
+        a = [float(v) for v in re.findall(_NUMBER, args)]
+        step = np.eye(3)
+        if name == "matrix" and len(a) == 6:
+            step[:2] = [[a[0], a[2], a[4]], [a[1], a[3], a[5]]]
+        elif name == "translate" and a:
+            step[:2, 2] = [a[0], a[1] if len(a) > 1 else 0.0]
+        elif name == "scale" and a:
+            step[0, 0], step[1, 1] = a[0], a[1] if len(a) > 1 else a[0]
+        elif name == "rotate" and a:
+            angle = math.radians(a[0])
+            cx, cy = (a[1], a[2]) if len(a) == 3 else (0.0, 0.0)
+            c, s = math.cos(angle), math.sin(angle)
+            step[:2] = [[c, -s, cx - c * cx + s * cy], [s, c, cy - s * cx - c * cy]]
+        matrix = matrix @ step
+    return matrix
+
+
+def canvas_size(root: ET.Element) -> tuple[float, float]:
+    """Width and height of a document in pixels."""
+    return (
+        parse_length(root.get("width"), default=300.0),
+        parse_length(root.get("height"), default=150.0),
+    )
+
+
+def canvas_transform(root: ET.Element) -> NDArray[np.float64]:
+    """Maps user units to canvas pixels through the root's ``viewBox``, if any."""
+    numbers = [float(v) for v in re.findall(_NUMBER, root.get("viewBox") or "")]
+    if len(numbers) != 4 or numbers[2] <= 0 or numbers[3] <= 0:
+        return np.eye(3)
+    width, height = canvas_size(root)
+    x, y, w, h = numbers
+    sx, sy = width / w, height / h
+    return np.array([[sx, 0, -x * sx], [0, sy, -y * sy], [0, 0, 1]])
+
+
+def _ellipse(cx: float, cy: float, rx: float, ry: float) -> Points:
+    # About one vertex per two pixels of perimeter
+    n = int(min(max(math.pi * (rx + ry) / 2, 16), 512))
+    t = np.linspace(0, 2 * math.pi, n, endpoint=False)
+    return np.column_stack([cx + rx * np.cos(t), cy + ry * np.sin(t)])
+
+
+def _bezier(points: list[tuple[float, float]]) -> list[tuple[float, float]]:
+    """Flattens a quadratic or cubic curve, excluding its start point."""
+    p = np.array(points)
+    length = float(np.sum(np.hypot(*np.diff(p, axis=0).T)))
+    t = np.linspace(0, 1, int(min(max(length / 2, 4), 64)) + 1)[1:, None]
+    if len(p) == 3:
+        curve = (1 - t) ** 2 * p[0] + 2 * (1 - t) * t * p[1] + t**2 * p[2]
+    else:
+        curve = (
+            (1 - t) ** 3 * p[0]
+            + 3 * (1 - t) ** 2 * t * p[1]
+            + 3 * (1 - t) * t**2 * p[2]
+            + t**3 * p[3]
+        )
+    return [tuple(q) for q in curve]
+
+
+def parse_path(d: str) -> list[Points]:
+    """Flattens path data into subpaths; closed ones end at their start point."""
+    tokens = _PATH_TOKEN.findall(d or "")
+    subpaths: list[list[tuple[float, float]]] = []
+    current: list[tuple[float, float]] = []
+    x = y = 0.0
+    start = (0.0, 0.0)
+    control: tuple[float, float] | None = None  # reflected by S and T
+    command = ""
+    i = 0
+
+    def take(n: int) -> list[float]:
+        nonlocal i
+        values = [float(v) for v in tokens[i : i + n]]
+        if len(values) < n:
+            raise ValueError("Truncated path data")
+        i += n
+        return values
+
+    try:
+        while i < len(tokens):
+            if tokens[i].isalpha():
+                command = tokens[i]
+                i += 1
+                if command in "Zz":
+                    if current:
+                        x, y = start
+                        subpaths.append([*current, start])
+                        current = []
+                    continue
+            elif not command:
+                break
+            relative = command.islower()
+            ox, oy = (x, y) if relative else (0.0, 0.0)
+            upper = command.upper()
+            if upper == "M":
+                if current:
+                    subpaths.append(current)
+                mx, my = take(2)
+                x, y = ox + mx, oy + my
+                start = (x, y)
+                current = [start]
+                # Further coordinate pairs are implicit line-tos
+                command = "l" if relative else "L"
+                control = None
+                continue
+            if not current:
+                current = [(x, y)]
+            if upper == "L":
+                lx, ly = take(2)
+                x, y = ox + lx, oy + ly
+                current.append((x, y))
+                control = None
+            elif upper == "H":
+                (hx,) = take(1)
+                x = ox + hx
+                current.append((x, y))
+                control = None
+            elif upper == "V":
+                (vy,) = take(1)
+                y = oy + vy
+                current.append((x, y))
+                control = None
+            elif upper in "CS":
+                if upper == "C":
+                    x1, y1, x2, y2, ex, ey = take(6)
+                    c1 = (ox + x1, oy + y1)
+                else:
+                    x2, y2, ex, ey = take(4)
+                    c1 = (2 * x - control[0], 2 * y - control[1]) if control else (x, y)
+                c2 = (ox + x2, oy + y2)
+                end = (ox + ex, oy + ey)
+                current += _bezier([(x, y), c1, c2, end])
+                control = c2
+                x, y = end
+            elif upper in "QT":
+                if upper == "Q":
+                    x1, y1, ex, ey = take(4)
+                    c1 = (ox + x1, oy + y1)
+                else:
+                    ex, ey = take(2)
+                    c1 = (2 * x - control[0], 2 * y - control[1]) if control else (x, y)
+                end = (ox + ex, oy + ey)
+                current += _bezier([(x, y), c1, end])
+                control = c1
+                x, y = end
+            elif upper == "A":
+                *_, ex, ey = take(7)
+                x, y = ox + ex, oy + ey
+                current.append((x, y))
+                control = None
+            else:
+                break  # numbers after Z
+    except ValueError:
+        pass  # as in browsers, render the path up to the first error
+    if current:
+        subpaths.append(current)
+    return [np.array(s, dtype=np.float64) for s in subpaths if len(s) > 1]
+
+
+@dataclass
+class Outline:
+    """A shape flattened into polylines in canvas pixels."""
+
+    polylines: list[Points]
+    closed: bool
+    fill: str | None
+    stroke: str | None
+    stroke_width: float  # in canvas pixels
+
+    @cached_property
+    def bbox(self) -> Box:
+        """Bounds including half the stroke width."""
+        points = (
+            self.polylines[0]
+            if len(self.polylines) == 1
+            else np.concatenate(self.polylines)
+        )
+        pad = self.stroke_width / 2 if self.stroke else 0.0
+        x0, y0 = points.min(axis=0) - pad
+        x1, y1 = points.max(axis=0) + pad
+        return (float(x0), float(y0), float(x1), float(y1))
+
+
+def _paint(element: ET.Element, name: str, default: str | None) -> str | None:
+    value = element.get(name, default)
+    return None if value in (None, "none", "transparent") else value
+
+
+def shape_outline(
+    element: ET.Element, transform: NDArray[np.float64], size: tuple[float, float]
+) -> Outline | None:
+    """Flattens a rect, ellipse, line or path; None for other or empty elements."""
+    width, height = size
+    diagonal = math.hypot(width, height) / math.sqrt(2)
+    tag = local_name(element)
+
+    def length(name: str, reference: float) -> float:
+        return parse_length(element.get(name), reference)
+
+    closed = True
+    if tag == "rect":
+        x, y = length("x", width), length("y", height)
+        w, h = length("width", width), length("height", height)
+        polylines = [np.array([[x, y], [x + w, y], [x + w, y + h], [x, y + h]])]
+    elif tag == "ellipse" or tag == "circle":
+        r = length("r", diagonal)
+        rx = length("rx", width) if tag == "ellipse" else r
+        ry = length("ry", height) if tag == "ellipse" else r
+        polylines = [_ellipse(length("cx", width), length("cy", height), rx, ry)]
+    elif tag == "line":
+        polylines = [
+            np.array(
+                [
+                    [length("x1", width), length("y1", height)],
+                    [length("x2", width), length("y2", height)],
+                ]
+            )
+        ]
+        closed = False
+    elif tag == "path":
+        polylines = parse_path(element.get("d", ""))
+        closed = False  # closed subpaths already end at their start
+        if not polylines:
+            return None
+    else:
+        return None
+
+    # Transforms scale strokes by the square root of their area change.
+    (a, c, e), (b, d, f) = transform[:2].tolist()
+    scale = math.sqrt(abs(a * d - b * c))
+    if (a, b, c, d, e, f) != (1, 0, 0, 1, 0, 0):
+        polylines = [p @ transform[:2, :2].T + transform[:2, 2] for p in polylines]
+    return Outline(
+        polylines=polylines,
+        closed=closed,
+        fill=None if tag == "line" else _paint(element, "fill", "black"),
+        stroke=_paint(element, "stroke", None),
+        stroke_width=parse_length(element.get("stroke-width"), diagonal, 1.0) * scale,
+    )
+
+
+def iter_outlines(
+    elements: list[ET.Element],
+    size: tuple[float, float],
+    transform: NDArray[np.float64] | None = None,
+) -> Iterator[Outline]:
+    """Flattens elements in drawing order, descending into groups."""
+    if transform is None:
+        transform = np.eye(3)
+    for element in elements:
+        local = transform
+        if element.get("transform") is not None:
+            local = transform @ parse_transform(element.get("transform"))
+        if local_name(element) == "g":
+            yield from iter_outlines(list(element), size, local)
+        else:
+            outline = shape_outline(element, local, size)
+            if outline is not None:
+                yield outline
@@ -0,0 +1,127 @@
+"""
+Batches of shape operations for the vector editor.
+
+A batch is a JSON list of ``{"shape": <kind>, <attribute>: <value>, ...}``
+objects whose attributes are the arguments of the matching
+``VectorEditor.add_<kind>`` method. Groups hold their members in a
+``"children"`` list. Every shape gets an ``"id"`` so that clients can refer
+to what they, or others, have drawn.
+"""
+
+from __future__ import annotations
+
+import inspect
+import math
+import uuid
+from typing import Any
+
+from .editor import VectorEditor
+from .geometry import numbers, parse_length
+
+SHAPES = {
+    "rect": VectorEditor.add_rect,
+    "ellipse": VectorEditor.add_ellipse,
+    "line": VectorEditor.add_line,
+    "path": VectorEditor.add_path,
+    "group": VectorEditor.add_group,
+}
+
+# Upper bound on the shapes, including group members, in one batch.
+MAX_BATCH_SHAPES = 10_000
+# Largest magnitude of a coordinate, length or transform value
+MAX_COORDINATE = 1e9
+# Widest stroke a shape may have; wider ones only fill the canvas
+MAX_STROKE_WIDTH = 10_000
+# Attributes that are not numbers, or hold a list of them
+PAINT_ATTRIBUTES = ("fill", "stroke")
+NUMBER_LISTS = ("d", "transform")
+
+ShapeOp = dict[str, Any]
+
+
+def _check_values(kwargs: dict[str, Any], label: str) -> None:
+    """Rejects numbers the geometry code cannot work with, such as ``1e999``."""
+    for name, value in kwargs.items():
+        if name in PAINT_ATTRIBUTES or value is None:
+            continue
+        if name in NUMBER_LISTS:
+            if not isinstance(value, str):
+                raise ValueError(f"Shape {label}: '{name}' must be a string")
+            values = numbers(value)
+        elif isinstance(value, bool):
+            values = [math.nan]
+        else:
+            values = [parse_length(str(value), default=math.nan)]
+        for number in values:
+            if not math.isfinite(number) or abs(number) > MAX_COORDINATE:
+                raise ValueError(f"Shape {label}: '{name}' is not a valid number")
+            if name == "stroke_width" and not 0 <= number <= MAX_STROKE_WIDTH:
+                raise ValueError(
+                    f"Shape {label}: 'stroke_width' must be between 0 and "
+                    f"{MAX_STROKE_WIDTH}"
+                )
+
+
+def parse_shape_ops(data: Any, max_shapes: int = MAX_BATCH_SHAPES) -> list[ShapeOp]:
+    """
+    Validates a batch of shape operations and assigns missing ids.
+
+    Raises:
+        ValueError: If the batch is malformed, too large, names an unknown
+            shape or attribute, has a number that is not finite or larger
+            than ``MAX_COORDINATE``, or a stroke wider than
+            ``MAX_STROKE_WIDTH``.
+    """
+    if not isinstance(data, list):
+        raise ValueError("Shape operations must be a list")
+    count = 0
+
+    def parse(entries: list[Any], where: str) -> list[ShapeOp]:
+        nonlocal count
+        ops = []
+        for i, entry in enumerate(entries):
+            label = f"{where}{i}"
+            if not isinstance(entry, dict) or entry.get("shape") not in SHAPES:
+                raise ValueError(
+                    f"Shape {label} must be an object with a known 'shape'"
+                )
+            count += 1
+            if count > max_shapes:
+                raise ValueError(f"At most {max_shapes} shapes can be sent at once")
+            op = dict(entry)
+            op["id"] = str(op.get("id") or uuid.uuid4().hex[:12])
+            children = op.pop("children", None)
+            kwargs = {k: v for k, v in op.items() if k not in ("shape", "id")}
+            if any(isinstance(v, (dict, list)) for v in kwargs.values()):
+                raise ValueError(
+                    f"Shape {label}: attributes must be strings or numbers"
+                )
+            if {"element_id", "parent"} & kwargs.keys():
+                raise ValueError(
+                    f"Shape {label}: 'element_id' and 'parent' are reserved"
+                )
+            try:
+                inspect.signature(SHAPES[op["shape"]]).bind(None, **kwargs)
+            except TypeError as e:
+                raise ValueError(f"Shape {label} ({op['shape']}): {e}") from e
+            _check_values(kwargs, label)
+            if op["shape"] == "group":
+                if not isinstance(children or [], list):
+                    raise ValueError(f"Shape {label}: 'children' must be a list")
+                op["children"] = parse(children or [], f"{label}.")
+            elif children is not None:
+                raise ValueError(f"Shape {label}: only groups have children")
+            ops.append(op)
+        return ops
+
+    return parse(data, "")
+
+
+def apply_shape_ops(editor: VectorEditor, ops: list[ShapeOp], parent=None) -> None:
+    """Appends parsed shapes, in order, to the document or to ``parent``."""
+    for op in ops:
+        kwargs = {k: v for k, v in op.items() if k not in ("shape", "id", "children")}
+        add = SHAPES[op["shape"]]
+        element = add(editor, **kwargs, element_id=op["id"], parent=parent)
+        if op["shape"] == "group":
+            apply_shape_ops(editor, op["children"], element)
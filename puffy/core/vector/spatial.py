@@ -0,0 +1,182 @@
+"""
+Uniform-grid spatial index over the shapes of a vector document.
+
+Each top-level element of the document (a shape or a whole group) is one
+entry, numbered in drawing order. Entries are registered in every grid cell
+their bounding box touches, so finding the shapes in a region only looks at
+the cells it covers rather than at every shape. Entries spanning more than
+``MAX_CELLS`` cells, such as backgrounds, are kept in a separate list that
+every query checks.
+"""
+
+from __future__ import annotations
+
+import math
+import threading
+import xml.etree.ElementTree as ET
+from collections import defaultdict
+from collections.abc import Iterable
+
+import cv2
+import numpy as np
+from numpy.typing import NDArray
+
+from .geometry import Box, Outline, Points, iter_outlines
+
+# Cell size in canvas pixels.
+CELL_SIZE = 64
+MAX_CELLS = 256
+
+
+def _union(boxes: Iterable[Box]) -> Box | None:
+    boxes = list(boxes)
+    if len(boxes) < 2:
+        return boxes[0] if boxes else None
+    return (
+        min(b[0] for b in boxes),
+        min(b[1] for b in boxes),
+        max(b[2] for b in boxes),
+        max(b[3] for b in boxes),
+    )
+
+
+def _intersects(a: Box, b: Box) -> bool:
+    return a[0] <= b[2] and b[0] <= a[2] and a[1] <= b[3] and b[1] <= a[3]
+
+
+def _contains(outer: Box, inner: Box) -> bool:
+    return (
+        outer[0] <= inner[0]
+        and outer[1] <= inner[1]
+        and inner[2] <= outer[2]
+        and inner[3] <= outer[3]
+    )
+
+
+def _segment_distance(points: Points, x: float, y: float) -> float:
+    """Distance from a point to the nearest segment of a polyline."""
+    a, b = points[:-1], points[1:]
+    ab = b - a
+    ap = np.array([x, y]) - a
+    lengths = np.einsum("ij,ij->i", ab, ab)
+    t = np.clip(np.einsum("ij,ij->i", ap, ab) / np.maximum(lengths, 1e-12), 0, 1)
+    nearest = a + t[:, None] * ab
+    return float(np.min(np.hypot(*(nearest - [x, y]).T)))
+
+
+def _hits(outline: Outline, x: float, y: float, tolerance: float) -> bool:
+    for points in outline.polylines:
+        if outline.fill is not None and len(points) > 2:
+            contour = points.astype(np.float32).reshape(-1, 1, 2)
+            if cv2.pointPolygonTest(contour, (x, y), False) >= 0:
+                return True
+        if outline.stroke is not None or outline.fill is None:
+            polyline = np.vstack([points, points[:1]]) if outline.closed else points
+            reach = (outline.stroke_width if outline.stroke else 0) / 2 + tolerance
+            if len(polyline) > 1 and _segment_distance(polyline, x, y) <= reach:
+                return True
+    return False
+
+
+class ShapeIndex:
+    """
+    Flattened outlines and a grid index of a document's top-level elements.
+
+    The index only grows: ``extend`` adds elements appended to the document.
+    Methods are safe to call from several threads.
+    """
+
+    def __init__(
+        self,
+        size: tuple[float, float],
+        transform: NDArray[np.float64],
+        cell_size: float = CELL_SIZE,
+    ):
+        self.size = size
+        self.transform = transform
+        self.cell_size = cell_size
+        self.elements: list[ET.Element] = []
+        self.outlines: list[list[Outline]] = []
+        self.boxes: list[Box | None] = []
+        self._cells: defaultdict[tuple[int, int], list[int]] = defaultdict(list)
+        self._large: list[int] = []
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self.elements)
+
+    def _cell_range(self, box: Box) -> tuple[range, range]:
+        c = self.cell_size
+        return (
+            range(math.floor(box[0] / c), math.floor(box[2] / c) + 1),
+            range(math.floor(box[1] / c), math.floor(box[3] / c) + 1),
+        )
+
+    def extend(self, elements: Iterable[ET.Element]) -> None:
+        """
+        Flattens and indexes elements appended to the document.
+
+        Either all elements are added or, if one cannot be indexed, none is.
+        """
+        entries = []
+        for element in elements:
+            outlines = list(iter_outlines([element], self.size, self.transform))
+            box = _union(o.bbox for o in outlines)
+            cells = self._cell_range(box) if box is not None else None
+            entries.append((element, outlines, box, cells))
+        with self._lock:
+            for element, outlines, box, cells in entries:
+                i = len(self.elements)
+                self.elements.append(element)
+                self.outlines.append(outlines)
+                self.boxes.append(box)
+                if cells is None:
+                    continue
+                xs, ys = cells
+                if len(xs) * len(ys) > MAX_CELLS:
+                    self._large.append(i)
+                    continue
+                for cx in xs:
+                    for cy in ys:
+                        self._cells[cx, cy].append(i)
+
+    def query(self, box: Box, start: int = 0, stop: int | None = None) -> list[int]:
+        """Entries in ``[start, stop)`` overlapping a box, in drawing order."""
+        xs, ys = self._cell_range(box)
+        with self._lock:
+            stop = len(self.elements) if stop is None else stop
+            found = {i for i in self._large if start <= i < stop}
+            if len(xs) * len(ys) > len(self._cells):
+                cells = [
+                    v for (cx, cy), v in self._cells.items() if cx in xs and cy in ys
+                ]
+            else:
+                cells = [self._cells.get((cx, cy), ()) for cx in xs for cy in ys]
+            for cell in cells:
+                found.update(i for i in cell if start <= i < stop)
+            return sorted(i for i in found if _intersects(self.boxes[i], box))
+
+    def contained(self, box: Box) -> list[int]:
+        """Entries whose bounds lie entirely inside a box, in drawing order."""
+        return [i for i in self.query(box) if _contains(box, self.boxes[i])]
+
+    def hit_test(self, x: float, y: float, tolerance: float = 0.0) -> int | None:
+        """
+        The topmost entry painted at a point.
+
+        A point hits the inside of filled shapes and strokes widened by
+        ``tolerance`` pixels on each side.
+        """
+        box = (x - tolerance, y - tolerance, x + tolerance, y + tolerance)
+        for i in reversed(self.query(box)):
+            if any(_hits(o, x, y, tolerance) for o in self.outlines[i]):
+                return i
+        return None
+
+    def outlines_of(self, indices: Iterable[int]) -> list[Outline]:
+        return [o for i in indices for o in self.outlines[i]]
+
+
+def element_ids(index: ShapeIndex, indices: Iterable[int]) -> list[str]:
+    """The ``id`` attributes of entries that have one."""
+    return [i for i in (index.elements[j].get("id") for j in indices) if i]
@@ -1,38 +1,112 @@
-import os
 import uuid
+from collections.abc import Iterator
 from pathlib import Path
+from typing import Any
 
 from fastapi import Form, HTTPException
 
+from .core.batch import apply_recipe
 from .core.editor import ImageEditor
+from .core.timing import timed
+from .history import history_store
+from .inflight import source_readers
+from .previews import preview_store
+from .store import is_safe_path, store
 
-BASE_DIR = Path(__file__).resolve().parent.parent
-UPLOAD_DIR = Path(BASE_DIR, "uploads")
+__all__ = ["ImageFileHandler", "is_safe_path", "open_image_file", "region_form"]
 
 
-def is_safe_path(basedir, path, follow_symlinks=True):
-    if follow_symlinks:
-        return os.path.realpath(path).startswith(str(basedir))
-    return os.path.abspath(path).startswith(str(basedir))
+def _rebuild(image_id: str) -> None:
+    """Stores a version evicted from the preview store, replayed from its history."""
+    try:
+        image = history_store.rebuild(image_id)
+    except KeyError:
+        return  # no longer part of a live history
+    store.put(image_id, image)
+    preview_store.discard(image_id)
 
 
 class ImageFileHandler:
     def __init__(self, image_id: str = Form(...)):
-        self.image_id = image_id
-        self.original_path = UPLOAD_DIR / self.image_id
-        if (
-            not is_safe_path(UPLOAD_DIR, self.original_path)
-            or not self.original_path.is_file()
-        ):
-            raise HTTPException(status_code=404, detail="Image not found.")
+        with timed("handler"):
+            self.image_id = image_id
+            # Preview edits are not stored yet; they refer to a stored base
+            # image plus the steps still to be applied at full resolution.
+            self.pending = preview_store.get(image_id)
+            if self.pending is None and preview_store.was_evicted(image_id):
+                _rebuild(image_id)
+            self.source_id = self.pending.base_id if self.pending else image_id
+            # Registered as a reader first, so that the source cannot be
+            # deleted by a concurrent operation between the check and its use.
+            source_readers.acquire(self.source_id)
+            if self.source_id not in store:
+                source_readers.release(self.source_id)
+                raise HTTPException(status_code=404, detail="Image not found.")
+            self.ext = Path(self.source_id).suffix.lower()
 
-        self.editor = ImageEditor.open(self.original_path)
+        self._editor: ImageEditor | None = None
+        self._closed = False
 
-    def get_new_path(self) -> Path:
-        ext = self.original_path.suffix
-        new_image_id = f"{uuid.uuid4()}{ext}"
-        return UPLOAD_DIR / new_image_id
+    def __enter__(self) -> "ImageFileHandler":
+        return self
+
+    def __exit__(self, *exc_info: object) -> None:
+        self.close()
+
+    def close(self) -> None:
+        """Stops reading the source, deleting it now if ``cleanup`` asked for it."""
+        if not self._closed:
+            self._closed = True
+            source_readers.release(self.source_id)
+
+    def load_source(self) -> ImageEditor:
+        """Returns an editor for the stored image, without pending steps."""
+        return ImageEditor(_image=store.get(self.source_id))
+
+    @property
+    def editor(self) -> ImageEditor:
+        # Decoding is deferred until the editor is first used so that it
+        # happens on the worker pool rather than while resolving the dependency.
+        if self._editor is None:
+            self._editor = self.load_source()
+            if self.pending is not None:
+                apply_recipe(self._editor, self.pending.steps)
+        return self._editor
+
+    def new_image_id(self) -> str:
+        return f"{uuid.uuid4()}{self.ext}"
 
     def cleanup(self):
-        if self.original_path.exists():
-            os.remove(self.original_path)
+        # Pending versions stay in the preview store for undo; the stored
+        # source can be rebuilt from the edit history. Other requests still
+        # reading the source keep it until they are done.
+        source_id = self.source_id
+
+        def delete() -> None:
+            preview_store.discard(source_id)
+            store.delete(source_id)
+
+        source_readers.delete(source_id, delete)
+
+
+def open_image_file(image_id: str = Form(...)) -> Iterator[ImageFileHandler]:
+    """Dependency yielding a handler that is closed once the request is done."""
+    with ImageFileHandler(image_id) as handler:
+        yield handler
+
+
+def region_form(
+    roi_x: int | None = Form(None, ge=0),
+    roi_y: int | None = Form(None, ge=0),
+    roi_width: int | None = Form(None, gt=0),
+    roi_height: int | None = Form(None, gt=0),
+) -> dict[str, Any]:
+    """Dependency with the ``roi`` argument of a filter limited to a rectangle."""
+    fields = (roi_x, roi_y, roi_width, roi_height)
+    if all(value is None for value in fields):
+        return {}
+    if any(value is None for value in fields):
+        raise HTTPException(
+            status_code=422, detail="Region needs x, y, width and height."
+        )
+    return {"roi": fields}
@@ -0,0 +1,71 @@
+import hashlib
+import threading
+from collections import OrderedDict
+from collections.abc import Hashable
+from dataclasses import dataclass
+from typing import Any
+
+from .config import ENCODE_CACHE_BYTES
+
+
+@dataclass(frozen=True)
+class Encoded:
+    data: bytes
+    media_type: str
+    etag: str
+
+
+class EncodeCache:
+    """
+    LRU cache of encoded image bytes, bounded by total size.
+
+    Keys start with the image id; since ids are never reused, an entry stays
+    valid for as long as it is cached and its ETag can be derived from the key.
+    """
+
+    def __init__(self, max_bytes: int = ENCODE_CACHE_BYTES):
+        self.max_bytes = max_bytes
+        self._entries: OrderedDict[Hashable, Encoded] = OrderedDict()
+        self._lock = threading.Lock()
+        self._bytes = 0
+        self._hits = 0
+        self._misses = 0
+
+    def get(self, key: Hashable) -> Encoded | None:
+        with self._lock:
+            encoded = self._entries.get(key)
+            if encoded is None:
+                self._misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self._hits += 1
+            return encoded
+
+    def put(self, key: Hashable, data: bytes, media_type: str) -> Encoded:
+        etag = '"' + hashlib.sha1(repr(key).encode()).hexdigest() + '"'
+        encoded = Encoded(data, media_type, etag)
+        if len(data) > self.max_bytes:
+            return encoded
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._bytes -= len(previous.data)
+            self._entries[key] = encoded
+            self._bytes += len(data)
+            while self._bytes > self.max_bytes:
+                _, oldest = self._entries.popitem(last=False)
+                self._bytes -= len(oldest.data)
+        return encoded
+
+    def stats(self) -> dict[str, Any]:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self._hits,
+                "misses": self._misses,
+            }
+
+
+encode_cache = EncodeCache()
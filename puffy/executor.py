@@ -0,0 +1,257 @@
+import asyncio
+import contextvars
+import functools
+import multiprocessing
+import threading
+import time
+import traceback
+from collections.abc import Callable
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing import shared_memory
+from typing import Any, TypeVar
+
+import numpy as np
+
+from . import shm
+from .config import COMPUTE_BACKEND, COMPUTE_PROCESSES, MAX_QUEUE_DEPTH, WORKER_THREADS
+from .core import timing
+from .core.editor import ImageEditor
+from .core.types import ImageArray
+from .shm import ImageHandle, shared_images
+
+T = TypeVar("T")
+
+BACKENDS = ("thread", "process")
+
+
+class ExecutorBusyError(RuntimeError):
+    """Raised when the executor has no room left for another task."""
+
+
+class WorkerCrashedError(RuntimeError):
+    """Raised when a compute process dies while running an operation."""
+
+
+def _apply(
+    segment: shared_memory.SharedMemory,
+    source: ImageHandle,
+    result_name: str,
+    operation: str,
+    kwargs: dict[str, Any],
+) -> ImageHandle:
+    image = np.ndarray(source.shape, source.dtype, buffer=segment.buf)
+    image.flags.writeable = False
+    editor = ImageEditor(_image=image)
+    getattr(editor, operation)(**kwargs)
+    return shm.write(result_name, editor.image)
+
+
+def _compute(
+    source: ImageHandle, result_name: str, operation: str, kwargs: dict[str, Any]
+) -> ImageHandle:
+    """Runs in a compute process: applies an editor operation to a shared image."""
+    segment = shm.open_segment(source.name)
+    try:
+        return _apply(segment, source, result_name, operation, kwargs)
+    except BaseException as e:
+        # The traceback's frames still reference the mapped image
+        traceback.clear_frames(e.__traceback__)
+        raise
+    finally:
+        segment.close()
+
+
+class ImageExecutor:
+    """
+    Runs blocking image work on a bounded pool of worker threads.
+
+    OpenCV releases the GIL inside its kernels, so a thread pool gives real
+    parallelism for decode, compute and encode without copying pixel data
+    between processes. At most ``max_workers`` tasks run at once and at most
+    ``max_queue_depth`` more may wait; anything beyond that is rejected with
+    ``ExecutorBusyError`` instead of piling up behind a slow operation.
+
+    Operations that hold the GIL for long, such as noise generation, can
+    instead be sent to ``processes`` worker processes with the ``"process"``
+    backend; see ``compute``.
+    """
+
+    def __init__(
+        self,
+        max_workers: int = WORKER_THREADS,
+        max_queue_depth: int = MAX_QUEUE_DEPTH,
+        backend: str = COMPUTE_BACKEND,
+        processes: int = COMPUTE_PROCESSES,
+    ):
+        if backend not in BACKENDS:
+            raise ValueError(f"Unknown compute backend: {backend}")
+        self.max_workers = max_workers
+        self.max_queue_depth = max_queue_depth
+        self.backend = backend
+        self.processes = processes
+        self._pool = ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix="puffy-worker"
+        )
+        # Started on first use; spawning the interpreters takes a while.
+        self._process_pool: ProcessPoolExecutor | None = None
+        self._crashes = 0
+        self._lock = threading.Lock()
+        self._pending = 0
+        self._running = 0
+        self._submitted = 0
+        self._completed = 0
+        self._failed = 0
+        self._rejected = 0
+        self._busy_seconds = 0.0
+        self._active_seconds = 0.0
+        self._active_since: float | None = None
+
+    async def run(self, fn: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+        """Runs ``fn(*args, **kwargs)`` on a worker thread and awaits the result."""
+        with self._lock:
+            if self._pending >= self.max_workers + self.max_queue_depth:
+                self._rejected += 1
+                raise ExecutorBusyError("Too many image operations in progress")
+            self._pending += 1
+            self._submitted += 1
+
+        loop = asyncio.get_running_loop()
+        # Run in a copy of the caller's context so per-request state such as
+        # stage timings follows the work onto the worker thread.
+        context = contextvars.copy_context()
+        call = functools.partial(
+            context.run, self._call, time.perf_counter(), fn, *args, **kwargs
+        )
+        try:
+            return await loop.run_in_executor(self._pool, call)
+        finally:
+            with self._lock:
+                self._pending -= 1
+
+    def _call(
+        self, queued_at: float, fn: Callable[..., T], *args: Any, **kwargs: Any
+    ) -> T:
+        start = time.perf_counter()
+        timing.record("queue", start - queued_at)
+        with self._lock:
+            if self._running == 0:
+                self._active_since = start
+            self._running += 1
+        failed = False
+        try:
+            return fn(*args, **kwargs)
+        except BaseException:
+            failed = True
+            raise
+        finally:
+            end = time.perf_counter()
+            with self._lock:
+                self._running -= 1
+                self._busy_seconds += end - start
+                if failed:
+                    self._failed += 1
+                else:
+                    self._completed += 1
+                if self._running == 0 and self._active_since is not None:
+                    self._active_seconds += end - self._active_since
+                    self._active_since = None
+
+    def compute(
+        self, image: ImageArray, operation: str, kwargs: dict[str, Any]
+    ) -> ImageArray:
+        """
+        Applies the ``ImageEditor`` method ``operation`` to an image.
+
+        Called from a worker thread. With the thread backend the operation
+        runs right there. With the process backend the image is shared with
+        a compute process, without a copy if it already lives in shared
+        memory, and the result comes back as a read-only array in a segment
+        the process wrote.
+
+        Raises:
+            WorkerCrashedError: If the compute process died; the pool is
+                replaced, so the operation can be retried.
+        """
+        if self.backend == "thread":
+            editor = ImageEditor(_image=image)
+            getattr(editor, operation)(**kwargs)
+            return editor.image
+        return self._in_process(_compute, image, operation, kwargs)
+
+    def _in_process(
+        self, fn: Callable[..., ImageHandle], image: ImageArray, *args: Any
+    ) -> ImageArray:
+        """Calls ``fn(source_handle, result_name, *args)`` in a compute process."""
+        source = shared_images.share(image)
+        handle = shared_images.handle(source)
+        result_name = shm.new_name()
+        pool = self._processes()
+        try:
+            result = pool.submit(fn, handle, result_name, *args).result()
+        except BrokenProcessPool as e:
+            shared_images.discard(result_name)
+            self._replace_processes(pool)
+            raise WorkerCrashedError("A compute process crashed") from e
+        except BaseException:
+            shared_images.discard(result_name)
+            raise
+        return shared_images.adopt(result)
+
+    def _processes(self) -> ProcessPoolExecutor:
+        with self._lock:
+            if self._process_pool is None:
+                # Forking a process with running threads is unsafe.
+                self._process_pool = ProcessPoolExecutor(
+                    max_workers=self.processes,
+                    mp_context=multiprocessing.get_context("spawn"),
+                )
+            return self._process_pool
+
+    def _replace_processes(self, broken: ProcessPoolExecutor) -> None:
+        with self._lock:
+            if self._process_pool is broken:
+                self._process_pool = None
+                self._crashes += 1
+        broken.shutdown(wait=False)
+
+    def stats(self) -> dict[str, Any]:
+        """
+        Returns counters describing the pool.
+
+        ``speedup`` is the total time spent inside tasks divided by the wall
+        time during which at least one task was running. It is 1.0 for
+        strictly sequential load and approaches ``max_workers`` when the pool
+        is saturated with work that runs in parallel.
+        """
+        with self._lock:
+            active = self._active_seconds
+            if self._active_since is not None:
+                active += time.perf_counter() - self._active_since
+            return {
+                "backend": self.backend,
+                "processes": self.processes if self.backend == "process" else 0,
+                "process_crashes": self._crashes,
+                "shared_memory": shared_images.stats(),
+                "max_workers": self.max_workers,
+                "max_queue_depth": self.max_queue_depth,
+                "running": self._running,
+                "queued": self._pending - self._running,
+                "submitted": self._submitted,
+                "completed": self._completed,
+                "failed": self._failed,
+                "rejected": self._rejected,
+                "busy_seconds": self._busy_seconds,
+                "active_seconds": active,
+                "speedup": self._busy_seconds / active if active > 0 else 0.0,
+            }
+
+    def shutdown(self, wait: bool = True) -> None:
+        self._pool.shutdown(wait=wait)
+        with self._lock:
+            processes, self._process_pool = self._process_pool, None
+        if processes is not None:
+            processes.shutdown(wait=wait)
+
+
+executor = ImageExecutor()
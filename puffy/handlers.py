@@ -1,28 +1,397 @@
+import json
+import uuid
 from collections.abc import Callable
 from pathlib import Path
 from typing import Any
 
+from fastapi import HTTPException, UploadFile
+
+from .config import (
+    MAX_UPLOAD_BYTES,
+    MAX_UPLOAD_PIXELS,
+    UPLOAD_CHUNK_BYTES,
+    UPLOAD_PREVIEWS,
+)
+from .core import io
+from .core.editor import ImageEditor
+from .core.pipeline import Pipeline, Step
+from .core.pyramid import scale_step
+from .core.timing import timed
+from .core.types import ImageArray
 from .dependencies import ImageFileHandler
+from .encode_cache import Encoded, encode_cache
+from .executor import ExecutorBusyError, WorkerCrashedError, executor
+from .history import history_store
+from .inflight import single_flight, source_readers
+from .previews import PendingVersion, preview_store
+from .result_cache import result_cache
+from .store import store
+from .tile_cache import tile_cache
+
+
+def _apply_and_save(
+    handler: ImageFileHandler, operation: Callable[..., Any], kwargs: dict[str, Any]
+) -> str:
+    new_id = handler.new_image_id()
+    key = cached = None
+    if handler.pending is None:
+        with timed("cache"):
+            key = result_cache.key(
+                store.digest(handler.source_id),
+                store.file_suffix(handler.source_id),
+                Step(operation.__name__, kwargs),
+            )
+            if key is None:
+                cached = None
+            elif store.caches_files:
+                cached = result_cache.lookup(key)
+            else:
+                cached = result_cache.recall(key)
+    if cached is not None:
+        with timed("store"):
+            if isinstance(cached, Path):
+                store.put_file(new_id, cached)
+            else:
+                store.put(new_id, cached)
+    else:
+        with timed("load"):
+            editor = handler.editor
+        with timed("compute", operation.__name__):
+            if operation is ImageEditor.materialize:
+                image = editor.image
+            else:
+                image = executor.compute(editor.image, operation.__name__, kwargs)
+        with timed("store"):
+            store.put(new_id, image)
+        if key is not None:
+            with timed("cache"):
+                if store.caches_files:
+                    store.write_file(new_id, result_cache.path(key))
+                    result_cache.commit(key)
+                else:
+                    result_cache.remember(key, store.get(new_id))
+
+    steps = (
+        ()
+        if operation is ImageEditor.materialize
+        else (Step(operation.__name__, kwargs),)
+    )
+    with timed("history"):
+        _record_history(handler.image_id, new_id, steps, lambda: store.get(new_id))
+        handler.cleanup()
+    return new_id
+
+
+def _record_history(
+    parent_id: str,
+    image_id: str,
+    steps: tuple[Step, ...],
+    load: Callable[[], ImageArray] | None = None,
+) -> None:
+    for dropped_id in history_store.record(parent_id, image_id, steps, load):
+        preview_store.discard(dropped_id)
+        store.delete(dropped_id)
+
+
+def _apply_preview(
+    handler: ImageFileHandler, operation: Callable[..., Any], kwargs: dict[str, Any]
+) -> str:
+    step = Step(operation.__name__, kwargs)
+    if handler.pending is not None:
+        steps, size, preview = (
+            handler.pending.steps,
+            handler.pending.size,
+            handler.pending.preview,
+        )
+    else:
+        with timed("load"):
+            image = handler.load_source().image
+            preview = preview_store.preview_of(handler.source_id, image)
+        steps, size = (), (image.shape[1], image.shape[0])
+
+    # Validate against the full-resolution geometry so the commit cannot fail
+    pipeline = Pipeline(size)
+    pipeline.record(step.op, **step.kwargs)
+
+    scaled = scale_step(step, preview, size)
+    editor = ImageEditor(_image=preview)
+    with timed("preview", operation.__name__):
+        operation(editor, **scaled.kwargs)
+
+    new_id = handler.new_image_id()
+    preview_store.put(
+        new_id,
+        PendingVersion(handler.source_id, (*steps, step), pipeline.size, editor.image),
+    )
+    # The previous pending version stays in the preview store so that undo
+    # can return to it without a full-resolution replay.
+    _record_history(handler.image_id, new_id, (step,))
+    return new_id
+
+
+def _restore(image_id: str) -> None:
+    """Makes a version from the history resolvable by ImageFileHandler again."""
+    pending = preview_store.get(image_id)
+    if pending is not None:
+        _restore(pending.base_id)
+    elif image_id not in store:
+        store.put(image_id, history_store.rebuild(image_id))
+
+
+def _move_in_history(handler: ImageFileHandler, offset: int) -> str:
+    target_id = history_store.move(handler.image_id, offset)
+    _restore(target_id)
+    if handler.pending is None:
+        # The version can be rebuilt from the history if it is needed again.
+        source_id = handler.source_id
+        source_readers.delete(source_id, lambda: store.delete(source_id))
+    return target_id
+
+
+async def undo(handler: ImageFileHandler) -> str:
+    """
+    Returns the id of the version before the handler's image.
+
+    Raises:
+        KeyError: If the image has no history.
+        IndexError: If there is nothing to undo.
+    """
+    return await run_in_executor(_move_in_history, handler, -1)
+
+
+async def redo(handler: ImageFileHandler) -> str:
+    """Like ``undo``, but returns the id of the next version."""
+    return await run_in_executor(_move_in_history, handler, 1)
 
 
-def process_image_and_save(
+async def run_in_executor(fn: Callable[..., Any], *args: Any, **kwargs: Any) -> Any:
+    """
+    Runs blocking image work on the worker pool.
+
+    A full queue and a crashed compute process are mapped to 503, since
+    the request can be retried.
+    """
+    try:
+        return await executor.run(fn, *args, **kwargs)
+    except (ExecutorBusyError, WorkerCrashedError) as e:
+        raise HTTPException(status_code=503, detail=str(e)) from e
+
+
+async def process_image_and_save(
     handler: ImageFileHandler,
     operation: Callable[..., Any],
+    *,
+    preview: bool = False,
     **kwargs,
-) -> Path:
+) -> str:
     """
     Applies an operation to an image, saves the result, and cleans up.
 
+    The decode, the operation and the encode all run on the worker pool so
+    the event loop stays free while OpenCV is busy. Concurrent requests for
+    the same operation on the same image, e.g. from a double click, share
+    one computation and get the same new version.
+
     Args:
         handler: The ImageFileHandler dependency with an initialized ImageEditor.
         operation: A method from the ImageEditor class (e.g., editor.resize).
+        preview: Only render the operation on a screen-sized pyramid level and
+            record it; the full-resolution image is computed on the next
+            non-preview operation, commit or download.
         **kwargs: The arguments for the operation method.
 
     Returns:
-        The path of the new image file.
+        The id of the new image version.
+
+    Raises:
+        HTTPException: 503 if the worker pool queue is full.
+    """
+    apply = _apply_preview if preview else _apply_and_save
+    key = json.dumps(
+        [handler.image_id, operation.__name__, preview, kwargs],
+        sort_keys=True,
+        default=str,
+    )
+
+    return await single_flight.run(
+        key, lambda: run_in_executor(apply, handler, operation, kwargs)
+    )
+
+
+def _export(
+    handler: ImageFileHandler, ext: str, quality: int, options: dict[str, Any]
+) -> bytes:
+    return io.encode_image(handler.editor.image, ext, quality, **options)
+
+
+async def export_image(
+    handler: ImageFileHandler, ext: str, quality: int = 95, **options: Any
+) -> Encoded:
+    """
+    Encodes the handler's full-resolution image on the worker pool.
+
+    Results are cached per version, format and encoder options, so repeated
+    downloads skip both the pending steps and the encoder.
+
+    Args:
+        handler: The image to encode.
+        ext: Target file extension.
+        quality: Encoder quality, see ``io.encode_params``.
+        **options: Other ``io.encode_params`` options.
+    """
+    key = (handler.image_id, ext, quality, *sorted(options.items()))
+    encoded = encode_cache.get(key)
+    if encoded is None:
+        data = await run_in_executor(_export, handler, ext, quality, options)
+        encoded = encode_cache.put(key, data, io.MEDIA_TYPES[ext])
+    return encoded
+
+
+def _render_preview(handler: ImageFileHandler, ext: str) -> bytes:
+    if handler.pending is not None:
+        image = handler.pending.preview
+    else:
+        image = preview_store.preview_of(handler.source_id, handler.load_source().image)
+    return io.encode_image(image, ext, quality=90)
+
+
+async def render_preview(
+    handler: ImageFileHandler, accept: str | None = None
+) -> Encoded:
+    """
+    Encodes the screen-sized preview of an image on the worker pool.
+
+    WebP is used if the ``Accept`` header allows it, otherwise PNG for PNG
+    images and JPEG for everything else.
+    """
+    fallback = ".png" if handler.ext == ".png" else ".jpg"
+    candidates = [ext for ext in (".webp", fallback) if io.can_encode(ext)]
+    ext = io.negotiate_format(accept, candidates)
+    key = (handler.image_id, "preview", ext)
+    encoded = encode_cache.get(key)
+    if encoded is None:
+        data = await run_in_executor(_render_preview, handler, ext)
+        encoded = encode_cache.put(key, data, io.MEDIA_TYPES[ext])
+    return encoded
+
+
+async def fetch_image(image_id: str) -> Encoded:
+    """
+    Returns a stored version in the format of its id's extension.
+
+    Raises:
+        KeyError: If the image is not in the store.
+    """
+    key = (image_id,)
+    encoded = encode_cache.get(key)
+    if encoded is None:
+        data = await run_in_executor(store.get_bytes, image_id)
+        media_type = io.MEDIA_TYPES.get(
+            Path(image_id).suffix.lower(), "application/octet-stream"
+        )
+        encoded = encode_cache.put(key, data, media_type)
+    return encoded
+
+
+async def read_upload(
+    file: UploadFile,
+    max_bytes: int = MAX_UPLOAD_BYTES,
+    max_pixels: int = MAX_UPLOAD_PIXELS,
+) -> memoryview:
+    """
+    Reads an upload chunk by chunk into one buffer.
+
+    The image header is checked as soon as enough of it has arrived, so an
+    oversized or unsupported file is rejected without reading the rest.
+
+    Raises:
+        ValueError: If the upload is not a PNG, JPEG, GIF or TIFF image or
+            exceeds ``max_bytes`` or ``max_pixels``.
+    """
+    if file.size is not None and file.size > max_bytes:
+        raise ValueError(f"Upload exceeds the limit of {max_bytes} bytes.")
+    buffer = bytearray()
+    header = None
+    while chunk := await file.read(UPLOAD_CHUNK_BYTES):
+        buffer += chunk
+        if len(buffer) > max_bytes:
+            raise ValueError(f"Upload exceeds the limit of {max_bytes} bytes.")
+        if header is None:
+            header = io.sniff_image(buffer)
+            if header is not None and header[1] * header[2] > max_pixels:
+                raise ValueError(f"Image exceeds the limit of {max_pixels} pixels.")
+    if header is None:
+        raise ValueError("Upload is not a complete image.")
+    return memoryview(buffer)
+
+
+def _store_upload(image_id: str, data: bytes | memoryview) -> None:
+    store.put_bytes(image_id, data)
+    _start_session(image_id, store.get(image_id))
+
+
+def _start_session(image_id: str, image: ImageArray) -> None:
+    if UPLOAD_PREVIEWS:
+        # Build the preview pyramid now so the first interactive edit only
+        # touches a screen-sized level.
+        preview_store.preview_of(image_id, image)
+    history_store.start(image_id, image)
+
+
+async def store_upload(image_id: str, data: bytes | memoryview) -> None:
+    """
+    Decodes an uploaded image from memory and stores it.
+
+    Raises:
+        ValueError: If the data is not a decodable image.
+    """
+    await run_in_executor(_store_upload, image_id, data)
+
+
+def _rasterize_vector(image_id: str, svg_id: str, scale: float) -> None:
+    store.put(image_id, tile_cache.render(svg_id, scale))
+    _start_session(image_id, store.get(image_id))
+
+
+async def rasterize_vector(svg_id: str, scale: float = 1.0) -> str:
+    """
+    Renders a vector document into a new image for the image editor.
+
+    Raises:
+        KeyError: If there is no such document.
+        ValueError: If the rendered image would be too large.
+    """
+    image_id = f"{uuid.uuid4()}.png"
+    await run_in_executor(_rasterize_vector, image_id, svg_id, scale)
+    return image_id
+
+
+def _render_png(svg_id: str, scale: float, tile: tuple[int, int] | None) -> bytes:
+    if tile is None:
+        image = tile_cache.render(svg_id, scale)
+    else:
+        image = tile_cache.tile(svg_id, scale, *tile)
+    # Fast compression: tiles are requested again as shapes are drawn
+    return io.encode_image(image, ".png", png_compression=1)
+
+
+async def render_vector(svg_id: str, scale: float = 1.0) -> bytes:
+    """
+    Renders a whole vector document as PNG.
+
+    Raises:
+        KeyError: If there is no such document.
+        ValueError: If the rendered image would be too large.
+    """
+    return await run_in_executor(_render_png, svg_id, scale, None)
+
+
+async def render_vector_tile(svg_id: str, scale: float, tx: int, ty: int) -> bytes:
+    """
+    Renders one tile of a vector document as PNG; see ``TileCache.tile``.
+
+    Raises:
+        KeyError: If there is no such document.
+        IndexError: If the tile lies outside the document.
     """
-    new_path = handler.get_new_path()
-    operation(handler.editor, **kwargs)
-    handler.editor.save(new_path)
-    handler.cleanup()
-    return new_path
+    return await run_in_executor(_render_png, svg_id, scale, (tx, ty))
@@ -0,0 +1,227 @@
+"""
+Undo/redo history for editing sessions.
+
+A session is the chain of versions that starts with an upload. Versions are
+recorded as the steps that produced them from their parent (crop boxes, LUT
+parameters, kernel sizes, ...) rather than as pixels. Every
+``keyframe_interval`` steps the pixels of a stored version are kept as a
+keyframe, and any other version is rebuilt by replaying steps from the
+nearest keyframe before it. When a session exceeds its byte or step budget
+the oldest keyframe is dropped together with the history before the next one.
+"""
+
+import threading
+from collections import OrderedDict
+from collections.abc import Callable
+from dataclasses import dataclass
+
+from .config import (
+    HISTORY_KEYFRAME_INTERVAL,
+    HISTORY_MAX_SESSIONS,
+    HISTORY_MAX_VERSIONS,
+    HISTORY_SESSION_BYTES,
+)
+from .core.batch import apply_recipe
+from .core.editor import ImageEditor
+from .core.pipeline import Step, is_deterministic
+from .core.types import ImageArray
+
+
+@dataclass
+class Version:
+    image_id: str
+    steps: tuple[Step, ...]  # applied to the previous version
+    keyframe: ImageArray | None = None
+
+
+class EditHistory:
+    """The versions of one session, oldest first, with a movable cursor."""
+
+    def __init__(
+        self,
+        image_id: str,
+        image: ImageArray,
+        keyframe_interval: int = HISTORY_KEYFRAME_INTERVAL,
+        max_versions: int = HISTORY_MAX_VERSIONS,
+        max_bytes: int = HISTORY_SESSION_BYTES,
+    ):
+        self.keyframe_interval = keyframe_interval
+        self.max_versions = max_versions
+        self.max_bytes = max_bytes
+        self.versions = [Version(image_id, (), image)]
+        self.position = 0
+
+    def index(self, image_id: str) -> int:
+        for i, version in enumerate(self.versions):
+            if version.image_id == image_id:
+                return i
+        raise KeyError(image_id)
+
+    @property
+    def nbytes(self) -> int:
+        return sum(v.keyframe.nbytes for v in self.versions if v.keyframe is not None)
+
+    def record(
+        self,
+        parent_id: str,
+        image_id: str,
+        steps: tuple[Step, ...],
+        load: Callable[[], ImageArray] | None,
+    ) -> list[str]:
+        """
+        Appends a version after ``parent_id``, discarding any redo branch.
+
+        Args:
+            parent_id: The version the steps were applied to.
+            image_id: The new version.
+            steps: The steps that produced it.
+            load: Returns the new version's pixels if it has full-resolution
+                pixels that can be kept as a keyframe, else None.
+
+        Returns:
+            The ids of versions that are no longer part of the history.
+        """
+        i = self.index(parent_id)
+        dropped = [v.image_id for v in self.versions[i + 1 :]]
+        del self.versions[i + 1 :]
+
+        version = Version(image_id, steps)
+        if load is not None and (
+            self._steps_since_keyframe() + len(steps) >= self.keyframe_interval
+            # replaying would not reproduce the same pixels
+            or not all(is_deterministic(step) for step in steps)
+        ):
+            version.keyframe = load()
+        self.versions.append(version)
+        self.position = len(self.versions) - 1
+        return dropped + self._trim()
+
+    def _steps_since_keyframe(self) -> int:
+        count = 0
+        for version in reversed(self.versions):
+            if version.keyframe is not None:
+                break
+            count += len(version.steps)
+        return count
+
+    def _trim(self) -> list[str]:
+        dropped = []
+        while len(self.versions) > self.max_versions or self.nbytes > self.max_bytes:
+            # The first version is always a keyframe, so the history can be
+            # cut at the next one without losing anything that comes after.
+            cut = next(
+                (
+                    i
+                    for i, v in enumerate(self.versions)
+                    if i and v.keyframe is not None
+                ),
+                None,
+            )
+            if cut is None or cut > self.position:
+                break
+            dropped += [v.image_id for v in self.versions[:cut]]
+            del self.versions[:cut]
+            self.position -= cut
+        return dropped
+
+    def replay_plan(self, image_id: str) -> tuple[ImageArray, list[Step]]:
+        """Returns the nearest keyframe at or before a version and the steps after it."""
+        i = self.index(image_id)
+        k = max(j for j in range(i + 1) if self.versions[j].keyframe is not None)
+        steps = [step for v in self.versions[k + 1 : i + 1] for step in v.steps]
+        return self.versions[k].keyframe, steps
+
+
+class HistoryStore:
+    """Edit histories of recent sessions, bounded by count."""
+
+    def __init__(self, max_sessions: int = HISTORY_MAX_SESSIONS, **history_options):
+        self.max_sessions = max_sessions
+        self.history_options = history_options
+        self._sessions: OrderedDict[str, EditHistory] = OrderedDict()
+        self._owners: dict[str, str] = {}  # image id -> session key
+        self._lock = threading.Lock()
+        self._rebuilds = 0
+
+    def start(self, image_id: str, image: ImageArray) -> None:
+        """Starts a session whose first keyframe is ``image``."""
+        with self._lock:
+            self._sessions[image_id] = EditHistory(
+                image_id, image, **self.history_options
+            )
+            self._owners[image_id] = image_id
+            while len(self._sessions) > self.max_sessions:
+                _, history = self._sessions.popitem(last=False)
+                for version in history.versions:
+                    self._owners.pop(version.image_id, None)
+
+    def _session(self, image_id: str) -> EditHistory:
+        key = self._owners[image_id]
+        self._sessions.move_to_end(key)
+        return self._sessions[key]
+
+    def record(
+        self,
+        parent_id: str,
+        image_id: str,
+        steps: tuple[Step, ...],
+        load: Callable[[], ImageArray] | None = None,
+    ) -> list[str]:
+        """
+        Records a new version; see ``EditHistory.record``.
+
+        Versions derived from an image without history, e.g. a batch result,
+        start a new session if their pixels are available.
+        """
+        with self._lock:
+            if parent_id in self._owners:
+                key = self._owners[parent_id]
+                history = self._session(parent_id)
+                dropped = history.record(parent_id, image_id, steps, load)
+                self._owners[image_id] = key
+                for dropped_id in dropped:
+                    self._owners.pop(dropped_id, None)
+                return dropped
+        if load is not None:
+            self.start(image_id, load())
+        return []
+
+    def move(self, image_id: str, offset: int) -> str:
+        """
+        Returns the version ``offset`` steps before (negative) or after the given one.
+
+        Raises:
+            KeyError: If the image has no history.
+            IndexError: If there is nothing to undo or redo.
+        """
+        with self._lock:
+            history = self._session(image_id)
+            i = history.index(image_id) + offset
+            if not 0 <= i < len(history.versions):
+                raise IndexError("Nothing to undo" if offset < 0 else "Nothing to redo")
+            history.position = i
+            return history.versions[i].image_id
+
+    def rebuild(self, image_id: str) -> ImageArray:
+        """Replays a version from the nearest keyframe before it."""
+        with self._lock:
+            keyframe, steps = self._session(image_id).replay_plan(image_id)
+            self._rebuilds += 1
+        return apply_recipe(ImageEditor(_image=keyframe), steps).image
+
+    def stats(self) -> dict[str, int]:
+        with self._lock:
+            sessions = list(self._sessions.values())
+            return {
+                "sessions": len(sessions),
+                "versions": sum(len(h.versions) for h in sessions),
+                "keyframes": sum(
+                    1 for h in sessions for v in h.versions if v.keyframe is not None
+                ),
+                "keyframe_bytes": sum(h.nbytes for h in sessions),
+                "rebuilds": self._rebuilds,
+                "max_sessions": self.max_sessions,
+            }
+
+
+history_store = HistoryStore()
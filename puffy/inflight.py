@@ -0,0 +1,100 @@
+"""
+Bookkeeping of operations in flight.
+
+``SingleFlight`` lets concurrent identical requests, e.g. from a double
+click, share one computation and its result. ``SourceReaders`` counts the
+operations reading each stored image, so that deleting an image that is
+still being read waits until the last reader is done.
+"""
+
+import asyncio
+import threading
+from collections.abc import Awaitable, Callable, Hashable
+from typing import Any, TypeVar
+
+T = TypeVar("T")
+
+
+class SingleFlight:
+    """Runs at most one call per key at a time; callers in between share it."""
+
+    def __init__(self):
+        self._calls: dict[Hashable, asyncio.Task[Any]] = {}
+        self._started = 0
+        self._shared = 0
+
+    async def run(self, key: Hashable, fn: Callable[[], Awaitable[T]]) -> T:
+        """
+        Awaits ``fn()``, or the call already running for ``key``.
+
+        The call runs as its own task, so a caller that is cancelled, e.g.
+        because its client went away, does not cancel it for the others.
+        """
+        task = self._calls.get(key)
+        if task is None:
+            task = asyncio.ensure_future(fn())
+            self._calls[key] = task
+            self._started += 1
+            task.add_done_callback(lambda done: self._forget(key, done))
+        else:
+            self._shared += 1
+        return await asyncio.shield(task)
+
+    def _forget(self, key: Hashable, task: asyncio.Task[Any]) -> None:
+        if self._calls.get(key) is task:
+            del self._calls[key]
+
+    def stats(self) -> dict[str, Any]:
+        return {
+            "in_flight": len(self._calls),
+            "started": self._started,
+            "shared": self._shared,
+        }
+
+
+class SourceReaders:
+    """Reference counts of the images operations are reading."""
+
+    def __init__(self):
+        self._readers: dict[str, int] = {}
+        self._deferred: dict[str, Callable[[], None]] = {}
+        self._lock = threading.Lock()
+        self._deferred_count = 0
+
+    def acquire(self, image_id: str) -> None:
+        with self._lock:
+            self._readers[image_id] = self._readers.get(image_id, 0) + 1
+
+    def release(self, image_id: str) -> None:
+        """Drops a reference, running a deletion deferred until the last one."""
+        with self._lock:
+            count = self._readers[image_id] - 1
+            if count:
+                self._readers[image_id] = count
+                return
+            del self._readers[image_id]
+            delete = self._deferred.pop(image_id, None)
+        if delete is not None:
+            delete()
+
+    def delete(self, image_id: str, delete: Callable[[], None]) -> None:
+        """Calls ``delete`` now, or once nobody is reading the image anymore."""
+        with self._lock:
+            if image_id in self._readers:
+                self._deferred[image_id] = delete
+                self._deferred_count += 1
+                return
+        delete()
+
+    def stats(self) -> dict[str, Any]:
+        with self._lock:
+            return {
+                "images": len(self._readers),
+                "readers": sum(self._readers.values()),
+                "pending_deletes": len(self._deferred),
+                "deferred_deletes": self._deferred_count,
+            }
+
+
+single_flight = SingleFlight()
+source_readers = SourceReaders()
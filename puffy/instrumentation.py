@@ -0,0 +1,163 @@
+"""
+Request instrumentation: Server-Timing headers, request histograms, timed
+template rendering and a sampling profiler for slow requests.
+"""
+
+import collections
+import os
+import sys
+import threading
+import time
+from collections.abc import Awaitable, Callable
+from pathlib import Path
+from typing import Any
+
+from fastapi import Request, Response
+from fastapi.templating import Jinja2Templates
+
+from .config import (
+    PROFILE_DIR,
+    PROFILE_ENABLED,
+    PROFILE_INTERVAL_MS,
+    PROFILE_SLOW_MS,
+)
+from .core import timing
+
+timing.registry.describe("puffy_request_seconds", "Time to produce each HTTP response.")
+
+# Innermost frames of threads that are waiting for work rather than running it.
+_IDLE_FRAMES = frozenset({"wait", "select", "poll", "_worker"})
+
+
+class TimedTemplates(Jinja2Templates):
+    """Jinja2Templates that records rendering time as the ``template`` stage."""
+
+    def TemplateResponse(self, *args: Any, **kwargs: Any):  # noqa: N802
+        with timing.timed("template"):
+            return super().TemplateResponse(*args, **kwargs)
+
+
+def _collapse(frame) -> str:
+    names = []
+    while frame is not None:
+        code = frame.f_code
+        names.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+        frame = frame.f_back
+    return ";".join(reversed(names))
+
+
+class SlowRequestProfiler:
+    """
+    Samples the stacks of all threads while enabled.
+
+    When a request takes longer than ``threshold`` seconds, the samples taken
+    during it are written as collapsed stacks (``frame;frame;frame count``),
+    the input format of flamegraph.pl and speedscope. Samples include every
+    busy thread, so concurrent requests show up in each other's profiles.
+    """
+
+    def __init__(
+        self,
+        threshold: float = PROFILE_SLOW_MS / 1000,
+        interval: float = PROFILE_INTERVAL_MS / 1000,
+        directory: Path = PROFILE_DIR,
+        max_samples: int = 100_000,
+    ):
+        self.threshold = threshold
+        self.interval = interval
+        self.directory = directory
+        self._samples: collections.deque[tuple[float, str]] = collections.deque(
+            maxlen=max_samples
+        )
+        self._thread: threading.Thread | None = None
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+        self._dumps: collections.deque[str] = collections.deque(maxlen=20)
+
+    @property
+    def enabled(self) -> bool:
+        return self._thread is not None
+
+    def enable(self) -> None:
+        with self._lock:
+            if self._thread is None:
+                self._stop.clear()
+                self._thread = threading.Thread(
+                    target=self._sample, name="puffy-profiler", daemon=True
+                )
+                self._thread.start()
+
+    def disable(self) -> None:
+        with self._lock:
+            thread, self._thread = self._thread, None
+        if thread is not None:
+            self._stop.set()
+            thread.join()
+            self._samples.clear()
+
+    def _sample(self) -> None:
+        own = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            now = time.perf_counter()
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id != own and frame.f_code.co_name not in _IDLE_FRAMES:
+                    self._samples.append((now, _collapse(frame)))
+
+    def finish(self, name: str, start: float, elapsed: float) -> Path | None:
+        """Dumps the samples of a finished request if it was slow."""
+        if not self.enabled or elapsed < self.threshold:
+            return None
+        counts = collections.Counter(s for t, s in list(self._samples) if t >= start)
+        if not counts:
+            return None
+        self.directory.mkdir(parents=True, exist_ok=True)
+        slug = "".join(c if c.isalnum() else "_" for c in name).strip("_")
+        path = (
+            self.directory
+            / f"{time.strftime('%Y%m%d-%H%M%S')}-{slug}-{elapsed * 1e3:.0f}ms.folded"
+        )
+        path.write_text(
+            "".join(f"{stack} {count}\n" for stack, count in counts.items())
+        )
+        self._dumps.append(path.name)
+        return path
+
+    def stats(self) -> dict[str, Any]:
+        return {
+            "enabled": self.enabled,
+            "threshold_ms": self.threshold * 1000,
+            "interval_ms": self.interval * 1000,
+            "samples": len(self._samples),
+            "directory": str(self.directory),
+            "recent_dumps": list(self._dumps),
+        }
+
+
+profiler = SlowRequestProfiler()
+if PROFILE_ENABLED:
+    profiler.enable()
+
+
+async def instrument_request(
+    request: Request, call_next: Callable[[Request], Awaitable[Response]]
+) -> Response:
+    """
+    HTTP middleware timing each request.
+
+    Stage timings recorded while handling the request, including on worker
+    threads, are returned in a ``Server-Timing`` header next to the total.
+    """
+    start = time.perf_counter()
+    with timing.collect() as timings:
+        response = await call_next(request)
+    elapsed = time.perf_counter() - start
+
+    route = getattr(request.scope.get("route"), "path", "unmatched")
+    timing.registry.observe(
+        "puffy_request_seconds", {"method": request.method, "route": route}, elapsed
+    )
+    response.headers["Server-Timing"] = timing.server_timing(
+        [*timings, ("total", elapsed)]
+    )
+    profiler.finish(f"{request.method} {route}", start, elapsed)
+    return response
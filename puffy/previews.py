@@ -0,0 +1,125 @@
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+
+from .config import PREVIEW_MAX_BYTES, PREVIEW_MAX_SIDE
+from .core.pipeline import Size, Step
+from .core.pyramid import build_pyramid, select_level
+from .core.types import ImageArray
+
+# Evicted pending versions whose ids are kept so they can be replayed
+MAX_EVICTED_IDS = 4096
+
+
+@dataclass(frozen=True)
+class PendingVersion:
+    """
+    An edit that has only been rendered at preview resolution.
+
+    The full-resolution result is ``steps`` applied to the stored image
+    ``base_id``; it is computed on commit or download.
+    """
+
+    base_id: str
+    steps: tuple[Step, ...]
+    size: Size  # full-resolution (width, height) after the steps
+    preview: ImageArray
+
+
+def _nbytes(value: list[ImageArray] | PendingVersion) -> int:
+    if isinstance(value, PendingVersion):
+        return value.preview.nbytes
+    return sum(level.nbytes for level in value)
+
+
+class PreviewStore:
+    """
+    Keeps image pyramids and pending preview versions, bounded by bytes.
+
+    Pyramids are evicted before pending versions, least recently used first.
+    An evicted pending version is not lost: its steps are in the edit
+    history, which ``ImageFileHandler`` replays it from. The ids of the most
+    recently evicted ones are remembered for that.
+    """
+
+    def __init__(
+        self, max_bytes: int = PREVIEW_MAX_BYTES, max_side: int = PREVIEW_MAX_SIDE
+    ):
+        self.max_bytes = max_bytes
+        self.max_side = max_side
+        self._pyramids: OrderedDict[str, list[ImageArray]] = OrderedDict()
+        self._pending: OrderedDict[str, PendingVersion] = OrderedDict()
+        self._evicted: OrderedDict[str, None] = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def preview_of(self, image_id: str, image: ImageArray) -> ImageArray:
+        """Returns the largest pyramid level of a stored image that fits the screen."""
+        if max(image.shape[:2]) <= self.max_side:
+            return image
+        with self._lock:
+            pyramid = self._pyramids.get(image_id)
+            if pyramid is not None:
+                self._pyramids.move_to_end(image_id)
+        if pyramid is None:
+            # Level 0 is the full image, which the image cache already owns,
+            # and is too large here anyway.
+            pyramid = build_pyramid(image)[1:] or [image]
+            with self._lock:
+                self._insert(self._pyramids, image_id, pyramid)
+        return select_level(pyramid, self.max_side)
+
+    def get(self, image_id: str) -> PendingVersion | None:
+        with self._lock:
+            pending = self._pending.get(image_id)
+            if pending is not None:
+                self._pending.move_to_end(image_id)
+            return pending
+
+    def put(self, image_id: str, pending: PendingVersion) -> None:
+        with self._lock:
+            self._insert(self._pending, image_id, pending)
+
+    def was_evicted(self, image_id: str) -> bool:
+        """Whether a pending version was dropped to stay within ``max_bytes``."""
+        with self._lock:
+            return image_id in self._evicted
+
+    def discard(self, image_id: str) -> None:
+        with self._lock:
+            self._evicted.pop(image_id, None)
+            for entries in (self._pyramids, self._pending):
+                value = entries.pop(image_id, None)
+                if value is not None:
+                    self._bytes -= _nbytes(value)
+
+    def _insert(self, entries: OrderedDict, key: str, value) -> None:
+        old = entries.pop(key, None)
+        if old is not None:
+            self._bytes -= _nbytes(old)
+        entries[key] = value
+        self._bytes += _nbytes(value)
+        for lru in (self._pyramids, self._pending):
+            while self._bytes > self.max_bytes and lru:
+                oldest = next(iter(lru))
+                if oldest == key and lru is entries:
+                    break  # keep the entry just inserted
+                self._bytes -= _nbytes(lru.pop(oldest))
+                if lru is self._pending:
+                    self._evicted[oldest] = None
+                    if len(self._evicted) > MAX_EVICTED_IDS:
+                        self._evicted.popitem(last=False)
+
+    def stats(self) -> dict[str, int]:
+        with self._lock:
+            return {
+                "pyramids": len(self._pyramids),
+                "pending": len(self._pending),
+                "pending_bytes": sum(p.preview.nbytes for p in self._pending.values()),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "max_side": self.max_side,
+            }
+
+
+preview_store = PreviewStore()
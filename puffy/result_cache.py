@@ -0,0 +1,175 @@
+import functools
+import hashlib
+import json
+import os
+import shutil
+import threading
+import weakref
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any
+
+from .config import RESULT_CACHE_BYTES, RESULT_CACHE_DIR
+from .core.pipeline import Step, is_deterministic
+from .core.types import ImageArray
+
+
+@functools.lru_cache(maxsize=1024)
+def _file_digest(path: str, mtime_ns: int, size: int) -> str:
+    with open(path, "rb") as f:
+        return hashlib.file_digest(f, "sha256").hexdigest()
+
+
+def file_digest(path: Path) -> str:
+    """Returns the SHA-256 of a file, memoized until the file changes."""
+    stat = path.stat()
+    return _file_digest(str(path), stat.st_mtime_ns, stat.st_size)
+
+
+def _canonical(value: Any) -> Any:
+    if isinstance(value, tuple | list):
+        return [_canonical(v) for v in value]
+    if isinstance(value, float) and value.is_integer():
+        return int(value)
+    return value
+
+
+class ResultCache:
+    """
+    On-disk, content-addressed cache of operation results.
+
+    Entries are keyed by the hash of the source file's bytes, the operation
+    name, its canonicalized arguments and the output format, so re-applying
+    the same operation to the same pixels returns the stored file instead of
+    recomputing it. The least recently used entries are deleted once the
+    cache grows beyond ``max_bytes``.
+
+    Stores that keep pixels in memory do not go through files: their results
+    are remembered by reference for as long as the store holds them.
+    """
+
+    def __init__(
+        self, directory: Path = RESULT_CACHE_DIR, max_bytes: int = RESULT_CACHE_BYTES
+    ):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._entries: OrderedDict[str, int] = OrderedDict()
+        self._bytes = 0
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+        self._live: weakref.WeakValueDictionary[str, ImageArray] = (
+            weakref.WeakValueDictionary()
+        )
+
+        # Rebuild the LRU order from modification times, which are bumped on
+        # every hit.
+        files = sorted(
+            (p for p in directory.iterdir() if p.is_file()),
+            key=lambda p: p.stat().st_mtime_ns,
+        )
+        for path in files:
+            size = path.stat().st_size
+            self._entries[path.name] = size
+            self._bytes += size
+
+    @staticmethod
+    def key(source_digest: str, suffix: str, step: Step) -> str | None:
+        """
+        Returns the cache key for ``step`` applied to an image, if cacheable.
+
+        Args:
+            source_digest: Content hash of the source image.
+            suffix: Extension of the cached file, which names its format.
+            step: The operation and its arguments.
+        """
+        if not is_deterministic(step):
+            return None
+        kwargs = {k: _canonical(v) for k, v in step.kwargs.items()}
+        payload = json.dumps(
+            [source_digest, step.op, kwargs], sort_keys=True, separators=(",", ":")
+        )
+        digest = hashlib.sha256(payload.encode()).hexdigest()
+        return f"{digest}{suffix}"
+
+    def path(self, key: str) -> Path:
+        return self.directory / key
+
+    def lookup(self, key: str) -> Path | None:
+        """Returns the cached result file, or None on a miss."""
+        path = self.path(key)
+        with self._lock:
+            if key not in self._entries:
+                self._misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self._hits += 1
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            with self._lock:
+                self._remove(key)
+            return None
+        return path
+
+    def recall(self, key: str) -> ImageArray | None:
+        """Returns a remembered in-memory result, or None on a miss."""
+        with self._lock:
+            image = self._live.get(key)
+            if image is None:
+                self._misses += 1
+            else:
+                self._hits += 1
+            return image
+
+    def remember(self, key: str, image: ImageArray) -> None:
+        """Remembers a stored result until the store lets go of the array."""
+        with self._lock:
+            self._live[key] = image
+
+    def commit(self, key: str) -> None:
+        """Registers a result that was just written to ``path(key)``."""
+        path = self.path(key)
+        size = path.stat().st_size
+        if size > self.max_bytes:
+            path.unlink(missing_ok=True)
+            return
+        with self._lock:
+            self._remove(key)
+            self._entries[key] = size
+            self._bytes += size
+            while self._bytes > self.max_bytes:
+                oldest = next(iter(self._entries))
+                self._remove(oldest)
+                self.path(oldest).unlink(missing_ok=True)
+                self._evictions += 1
+
+    def _remove(self, key: str) -> None:
+        size = self._entries.pop(key, None)
+        if size is not None:
+            self._bytes -= size
+
+    def stats(self) -> dict[str, Any]:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self._hits,
+                "misses": self._misses,
+                "evictions": self._evictions,
+                "live": len(self._live),
+            }
+
+
+def link_or_copy(source: Path, destination: Path) -> None:
+    # Hard links cost no extra space; fall back to a copy across filesystems.
+    destination.unlink(missing_ok=True)
+    try:
+        os.link(source, destination)
+    except OSError:
+        shutil.copyfile(source, destination)
+
+
+result_cache = ResultCache()
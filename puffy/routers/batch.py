@@ -0,0 +1,152 @@
+import json
+import shutil
+import tempfile
+import time
+import uuid
+import zipfile
+import zlib
+from collections.abc import Iterator
+from pathlib import Path
+
+from fastapi import APIRouter, File, Form, HTTPException, UploadFile
+from fastapi.responses import StreamingResponse
+from starlette.background import BackgroundTask
+
+from puffy.config import (
+    ALLOWED_EXTENSIONS,
+    BATCH_MAX_BYTES,
+    BATCH_MAX_FILES,
+    BATCH_WORKERS,
+    MAX_UPLOAD_BYTES,
+    TMP_DIR,
+)
+from puffy.core.batch import BatchItemResult, parse_recipe, run_batch, summarize
+from puffy.handlers import run_in_executor
+from puffy.store import store
+
+router = APIRouter()
+
+
+def _extract_archive(archive: UploadFile, workdir: Path) -> dict[Path, str]:
+    """
+    Extracts the supported images in an uploaded zip file into ``workdir``.
+
+    The sizes in the archive's directory are not trusted: bytes are counted
+    as they are decompressed, so a zip bomb is stopped at the limit.
+
+    Raises:
+        HTTPException: 400 for an invalid archive, 413 for one with more than
+            ``BATCH_MAX_FILES`` entries, an image larger than
+            ``MAX_UPLOAD_BYTES``, or more than ``BATCH_MAX_BYTES`` in total.
+    """
+    sources = {}
+    total = 0
+    try:
+        with zipfile.ZipFile(archive.file) as zf:
+            infos = zf.infolist()
+            if len(infos) > BATCH_MAX_FILES:
+                raise HTTPException(
+                    status_code=413,
+                    detail=f"Archive has more than {BATCH_MAX_FILES} files.",
+                )
+            for info in infos:
+                ext = Path(info.filename).suffix.lower()
+                if info.is_dir() or ext not in ALLOWED_EXTENSIONS:
+                    continue
+                path = workdir / f"{uuid.uuid4()}{ext}"
+                size = 0
+                with zf.open(info) as src, open(path, "wb") as dst:
+                    while chunk := src.read(1 << 20):
+                        size += len(chunk)
+                        total += len(chunk)
+                        if size > MAX_UPLOAD_BYTES:
+                            raise HTTPException(
+                                status_code=413,
+                                detail=f"{info.filename} is too large.",
+                            )
+                        if total > BATCH_MAX_BYTES:
+                            raise HTTPException(
+                                status_code=413, detail="Archive is too large."
+                            )
+                        dst.write(chunk)
+                sources[path] = info.filename
+    except (zipfile.BadZipFile, zlib.error, NotImplementedError) as e:
+        raise HTTPException(status_code=400, detail="Invalid zip archive.") from e
+    return sources
+
+
+def _stage_image_ids(image_ids: list[str], workdir: Path) -> dict[Path, str]:
+    """Writes stored images to ``workdir`` in the store's native file format."""
+    sources = {}
+    for image_id in image_ids:
+        if image_id not in store:
+            raise HTTPException(status_code=404, detail=f"Image not found: {image_id}")
+        path = workdir / f"{uuid.uuid4()}{store.file_suffix(image_id)}"
+        store.write_file(image_id, path)
+        sources[path] = image_id
+    return sources
+
+
+def _item_json(
+    item: BatchItemResult, total: int, source: str, image_id: str | None
+) -> dict:
+    return {
+        "index": item.index,
+        "total": total,
+        "source": source,
+        "image_id": image_id,
+        "error": item.error,
+        "seconds": item.seconds,
+    }
+
+
+@router.post("/batch")
+async def batch_process(
+    recipe: str = Form(...),
+    image_ids: list[str] = Form(default=[]),
+    archive: UploadFile | None = File(None),
+    quality: int = Form(95),
+):
+    """
+    Applies a recipe to many images and streams the results as NDJSON.
+
+    One line is emitted per image as soon as it finishes, followed by a final
+    ``{"summary": ...}`` line with aggregate throughput. Source images are
+    left untouched; each result is stored under a new image id.
+    """
+    try:
+        steps = parse_recipe(json.loads(recipe))
+    except (json.JSONDecodeError, ValueError) as e:
+        raise HTTPException(status_code=400, detail=str(e)) from e
+
+    workdir = Path(tempfile.mkdtemp(dir=TMP_DIR))
+    cleanup = BackgroundTask(shutil.rmtree, workdir, ignore_errors=True)
+    try:
+        sources = await run_in_executor(_stage_image_ids, image_ids, workdir)
+        if archive is not None and archive.filename:
+            sources |= await run_in_executor(_extract_archive, archive, workdir)
+        if not sources:
+            raise HTTPException(status_code=400, detail="No images to process.")
+    except BaseException:
+        shutil.rmtree(workdir, ignore_errors=True)
+        raise
+
+    def stream() -> Iterator[str]:
+        start = time.perf_counter()
+        results = []
+        paths = list(sources)
+        for item in run_batch(steps, paths, workdir, BATCH_WORKERS, quality):
+            results.append(item)
+            name = sources[item.source]
+            new_id = None
+            if item.output is not None:
+                new_id = f"{uuid.uuid4()}{Path(name).suffix.lower()}"
+                store.put_file(new_id, item.output)
+                item.output.unlink(missing_ok=True)
+            yield json.dumps(_item_json(item, len(paths), name, new_id)) + "\n"
+        summary = summarize(results, time.perf_counter() - start)
+        yield json.dumps({"summary": summary}) + "\n"
+
+    return StreamingResponse(
+        stream(), media_type="application/x-ndjson", background=cleanup
+    )
@@ -1,35 +1,45 @@
-import os
-import shutil
 import uuid
 from pathlib import Path
 from typing import List
 
 from fastapi import (
     APIRouter,
-    BackgroundTasks,
     Depends,
     File,
     Form,
+    HTTPException,
+    Query,
     Request,
     UploadFile,
 )
-from fastapi.responses import HTMLResponse, FileResponse
-from fastapi.templating import Jinja2Templates
+from fastapi.responses import HTMLResponse, Response
 
-from puffy.config import UPLOAD_DIR
+from puffy.config import ALLOWED_EXTENSIONS
+from puffy.core import io
 from puffy.core.editor import ImageEditor
-from puffy.dependencies import ImageFileHandler
-from puffy.handlers import process_image_and_save
+from puffy.dependencies import ImageFileHandler, open_image_file, region_form
+from puffy.encode_cache import Encoded
+from puffy.handlers import (
+    export_image,
+    fetch_image,
+    process_image_and_save,
+    read_upload,
+    redo,
+    render_preview,
+    store_upload,
+    undo,
+)
+from puffy.instrumentation import TimedTemplates
 
 router = APIRouter()
-templates = Jinja2Templates(
+templates = TimedTemplates(
     directory=str(Path(__file__).resolve().parent.parent / "templates")
 )
+templates.env.globals["can_encode"] = io.can_encode
 
 
-def cleanup_file(path: Path):
-    if path.exists():
-        os.remove(path)
+# Image ids are never reused, so their content can be cached indefinitely.
+IMMUTABLE = {"Cache-Control": "public, max-age=31536000, immutable"}
 
 
 @router.post("/upload", response_class=HTMLResponse)
@@ -38,18 +48,18 @@ async def upload_file(request: Request, file: UploadFile = File(...)):
         return templates.TemplateResponse(
             request, "error.html", {"message": "Invalid file upload."}
         )
-    allowed_extensions = {".jpg", ".jpeg", ".png", ".gif", ".tiff"}
     ext = Path(file.filename).suffix.lower()
-    if ext not in allowed_extensions:
+    if ext not in ALLOWED_EXTENSIONS:
         return templates.TemplateResponse(
             request, "error.html", {"message": "Unsupported file format."}
         )
 
     image_id = f"{uuid.uuid4()}{ext}"
-    save_path = UPLOAD_DIR / image_id
-
-    with open(save_path, "wb") as buffer:
-        shutil.copyfileobj(file.file, buffer)
+    try:
+        data = await read_upload(file)
+        await store_upload(image_id, data)
+    except ValueError as e:
+        return templates.TemplateResponse(request, "error.html", {"message": str(e)})
 
     return templates.TemplateResponse(
         request,
@@ -64,17 +74,19 @@ async def resize_image(
     width: int = Form(..., gt=0),
     height: int = Form(..., gt=0),
     interpolation: str = Form("bicubic"),
-    handler: ImageFileHandler = Depends(ImageFileHandler),
+    preview: bool = Form(False),
+    handler: ImageFileHandler = Depends(open_image_file),
 ):
-    new_path = process_image_and_save(
+    new_id = await process_image_and_save(
         handler,
         ImageEditor.resize,
+        preview=preview,
         width=width,
         height=height,
         interpolation=interpolation,
     )
     context = {
-        "image_id": new_path.name,
+        "image_id": new_id,
         "alt_text": f"resized image ({width}x{height})",
         "width": width,
         "height": height,
@@ -90,19 +102,21 @@ async def crop_image(
     y: int = Form(..., ge=0),
     width: int = Form(..., gt=0),
     height: int = Form(..., gt=0),
-    handler: ImageFileHandler = Depends(ImageFileHandler),
+    preview: bool = Form(False),
+    handler: ImageFileHandler = Depends(open_image_file),
 ):
     try:
-        new_path = process_image_and_save(
+        new_id = await process_image_and_save(
             handler,
             ImageEditor.crop,
+            preview=preview,
             x=x,
             y=y,
             width=width,
             height=height,
         )
         context = {
-            "image_id": new_path.name,
+            "image_id": new_id,
             "alt_text": f"cropped image ({width}x{height} at {x},{y})",
             "x": x,
             "y": y,
@@ -120,7 +134,8 @@ async def crop_image(
 async def flip_image(
     request: Request,
     direction: list[str] = Form(default=[]),
-    handler: ImageFileHandler = Depends(ImageFileHandler),
+    preview: bool = Form(False),
+    handler: ImageFileHandler = Depends(open_image_file),
 ):
     if not direction:
         return templates.TemplateResponse(
@@ -135,14 +150,15 @@ async def flip_image(
 
     horizontal = "horizontal" in direction
     vertical = "vertical" in direction
-    new_path = process_image_and_save(
+    new_id = await process_image_and_save(
         handler,
         ImageEditor.flip,
+        preview=preview,
         horizontal=horizontal,
         vertical=vertical,
     )
     context = {
-        "image_id": new_path.name,
+        "image_id": new_id,
         "alt_text": f"flipped {', '.join(direction) if direction else 'none'}",
         "direction": direction,
     }
@@ -155,19 +171,21 @@ async def rotate_image(
     angle: float = Form(...),
     center_x: int | None = Form(None),
     center_y: int | None = Form(None),
-    handler: ImageFileHandler = Depends(ImageFileHandler),
+    preview: bool = Form(False),
+    handler: ImageFileHandler = Depends(open_image_file),
 ):
     center = (
         (center_x, center_y) if center_x is not None and center_y is not None else None
     )
-    new_path = process_image_and_save(
+    new_id = await process_image_and_save(
         handler,
         ImageEditor.rotate,
+        preview=preview,
         angle=angle,
         center=center,
     )
     context = {
-        "image_id": new_path.name,
+        "image_id": new_id,
         "alt_text": f"rotated image ({angle} degrees)",
         "angle": angle,
         "center_x": center_x,
@@ -181,16 +199,20 @@ async def adjust_brightness_contrast(
     request: Request,
     brightness: int = Form(0),
     contrast: float = Form(1.0),
-    handler: ImageFileHandler = Depends(ImageFileHandler),
+    preview: bool = Form(False),
+    region: dict = Depends(region_form),
+    handler: ImageFileHandler = Depends(open_image_file),
 ):
-    new_path = process_image_and_save(
+    new_id = await process_image_and_save(
         handler,
         ImageEditor.adjust_brightness_contrast,
+        preview=preview,
         brightness=brightness,
         contrast=contrast,
+        **region,
     )
     context = {
-        "image_id": new_path.name,
+        "image_id": new_id,
         "alt_text": "brightness/contrast adjusted",
         "brightness": brightness,
         "contrast": contrast,
@@ -204,17 +226,21 @@ async def adjust_color_balance(
     red: int = Form(0),
     green: int = Form(0),
     blue: int = Form(0),
-    handler: ImageFileHandler = Depends(ImageFileHandler),
+    preview: bool = Form(False),
+    region: dict = Depends(region_form),
+    handler: ImageFileHandler = Depends(open_image_file),
 ):
-    new_path = process_image_and_save(
+    new_id = await process_image_and_save(
         handler,
         ImageEditor.adjust_color_balance,
+        preview=preview,
         red=red,
         green=green,
         blue=blue,
+        **region,
     )
     context = {
-        "image_id": new_path.name,
+        "image_id": new_id,
         "alt_text": "color balance adjusted",
         "red": red,
         "green": green,
@@ -228,19 +254,26 @@ async def add_noise(
     request: Request,
     noise_type: str = Form("gaussian"),
     intensity: float = Form(0.1),
-    handler: ImageFileHandler = Depends(ImageFileHandler),
+    seed: int | None = Form(None),
+    preview: bool = Form(False),
+    region: dict = Depends(region_form),
+    handler: ImageFileHandler = Depends(open_image_file),
 ):
-    new_path = process_image_and_save(
+    new_id = await process_image_and_save(
         handler,
         ImageEditor.add_noise,
+        preview=preview,
         noise_type=noise_type,
         intensity=intensity,
+        seed=seed,
+        **region,
     )
     context = {
-        "image_id": new_path.name,
+        "image_id": new_id,
         "alt_text": f"{noise_type} noise added",
         "noise_type": noise_type,
         "intensity": intensity,
+        "seed": seed,
     }
     return templates.TemplateResponse(request, "editor.html", context)
 
@@ -250,16 +283,20 @@ async def blur(
     request: Request,
     blur_type: str = Form("gaussian"),
     kernel_size: int = Form(5, gt=0),
-    handler: ImageFileHandler = Depends(ImageFileHandler),
+    preview: bool = Form(False),
+    region: dict = Depends(region_form),
+    handler: ImageFileHandler = Depends(open_image_file),
 ):
-    new_path = process_image_and_save(
+    new_id = await process_image_and_save(
         handler,
         ImageEditor.blur,
+        preview=preview,
         blur_type=blur_type,
         kernel_size=kernel_size,
+        **region,
     )
     context = {
-        "image_id": new_path.name,
+        "image_id": new_id,
         "alt_text": f"{blur_type} blur applied",
         "blur_type": blur_type,
         "kernel_size": kernel_size,
@@ -267,23 +304,171 @@ async def blur(
     return templates.TemplateResponse(request, "editor.html", context)
 
 
+@router.post("/commit", response_class=HTMLResponse)
+async def commit_image(
+    request: Request,
+    handler: ImageFileHandler = Depends(open_image_file),
+):
+    """Applies pending preview edits at full resolution and stores the result."""
+    if handler.pending is None:
+        new_id = handler.image_id
+    else:
+        new_id = await process_image_and_save(handler, ImageEditor.materialize)
+    context = {"image_id": new_id, "alt_text": "committed image"}
+    return templates.TemplateResponse(request, "editor.html", context)
+
+
+@router.post("/undo", response_class=HTMLResponse)
+async def undo_edit(
+    request: Request,
+    handler: ImageFileHandler = Depends(open_image_file),
+):
+    try:
+        new_id = await undo(handler)
+    except KeyError:
+        return templates.TemplateResponse(
+            request, "error.html", {"message": "No edit history for this image."}
+        )
+    except IndexError as e:
+        return templates.TemplateResponse(request, "error.html", {"message": str(e)})
+    context = {"image_id": new_id, "alt_text": "undone edit"}
+    return templates.TemplateResponse(request, "editor.html", context)
+
+
+@router.post("/redo", response_class=HTMLResponse)
+async def redo_edit(
+    request: Request,
+    handler: ImageFileHandler = Depends(open_image_file),
+):
+    try:
+        new_id = await redo(handler)
+    except KeyError:
+        return templates.TemplateResponse(
+            request, "error.html", {"message": "No edit history for this image."}
+        )
+    except IndexError as e:
+        return templates.TemplateResponse(request, "error.html", {"message": str(e)})
+    context = {"image_id": new_id, "alt_text": "redone edit"}
+    return templates.TemplateResponse(request, "editor.html", context)
+
+
+def _byte_range(header: str, size: int) -> tuple[int, int] | None:
+    """
+    Parses a single ``bytes=start-end`` range into inclusive offsets.
+
+    Returns None if the range cannot be satisfied; raises ValueError for
+    ranges that are malformed or not supported, which are ignored.
+    """
+    unit, _, spec = header.partition("=")
+    if unit.strip() != "bytes" or "," in spec:
+        raise ValueError(header)
+    first, _, last = spec.strip().partition("-")
+    if not first:
+        start, end = max(size - int(last), 0), size - 1
+    else:
+        start, end = int(first), min(int(last), size - 1) if last else size - 1
+    return (start, end) if start <= end else None
+
+
+def _encoded_response(
+    request: Request, encoded: Encoded, headers: dict[str, str] | None = None
+) -> Response:
+    """Serves cached bytes with ETag validation and single byte ranges."""
+    headers = {"ETag": encoded.etag, "Accept-Ranges": "bytes", **(headers or {})}
+    if encoded.etag in request.headers.get("if-none-match", ""):
+        return Response(status_code=304, headers=headers)
+
+    size = len(encoded.data)
+    range_header = request.headers.get("range")
+    if range_header and request.headers.get("if-range", encoded.etag) == encoded.etag:
+        try:
+            byte_range = _byte_range(range_header, size)
+        except ValueError:
+            byte_range = (0, size - 1)
+        if byte_range is None:
+            headers["Content-Range"] = f"bytes */{size}"
+            return Response(status_code=416, headers=headers)
+        start, end = byte_range
+        if (start, end) != (0, size - 1):
+            headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+            return Response(
+                encoded.data[start : end + 1],
+                status_code=206,
+                media_type=encoded.media_type,
+                headers=headers,
+            )
+    return Response(encoded.data, media_type=encoded.media_type, headers=headers)
+
+
+@router.get("/preview/{image_id}")
+async def preview_image(request: Request, image_id: str):
+    with ImageFileHandler(image_id) as handler:
+        encoded = await render_preview(handler, request.headers.get("accept"))
+    return _encoded_response(request, encoded, {**IMMUTABLE, "Vary": "Accept"})
+
+
+@router.get("/image/{image_id}")
+async def get_image(request: Request, image_id: str):
+    """Serves a stored version, encoding it only now if the store holds pixels."""
+    try:
+        encoded = await fetch_image(image_id)
+    except KeyError as e:
+        raise HTTPException(status_code=404, detail="Image not found.") from e
+    return _encoded_response(request, encoded, IMMUTABLE)
+
+
+async def _download(
+    request: Request,
+    handler: ImageFileHandler,
+    format: str,
+    quality: int,
+    png_compression: int,
+    progressive: bool,
+    optimize: bool,
+) -> Response:
+    ext = f".{format.lower()}"
+    if not io.can_encode(ext):
+        raise HTTPException(status_code=400, detail="Unsupported format.")
+    encoded = await export_image(
+        handler,
+        ext,
+        quality,
+        png_compression=png_compression,
+        progressive=progressive,
+        optimize=optimize,
+    )
+    headers = {"Content-Disposition": f'attachment; filename="edited_image{ext}"'}
+    return _encoded_response(request, encoded, headers)
+
+
 @router.post("/download")
 async def download_image(
-    background_tasks: BackgroundTasks,
+    request: Request,
     image_id: str = Form(...),
     format: str = Form("jpeg"),
-    quality: int = Form(95),
-    handler: ImageFileHandler = Depends(ImageFileHandler),
+    quality: int = Form(95, ge=0, le=101),
+    png_compression: int = Form(3, ge=0, le=9),
+    progressive: bool = Form(False),
+    optimize: bool = Form(False),
+    handler: ImageFileHandler = Depends(open_image_file),
 ):
-    ext = f".{format.lower()}"
-    download_id = f"{uuid.uuid4()}{ext}"
-    download_path = UPLOAD_DIR / download_id
-
-    editor = ImageEditor.open(handler.original_path)
-    editor.save(download_path, quality=quality)
+    return await _download(
+        request, handler, format, quality, png_compression, progressive, optimize
+    )
 
-    background_tasks.add_task(cleanup_file, download_path)
 
-    return FileResponse(
-        download_path, media_type=f"image/{format}", filename=f"edited_image{ext}"
-    )
+@router.get("/download/{image_id}")
+async def download_image_get(
+    request: Request,
+    image_id: str,
+    format: str = "jpeg",
+    quality: int = Query(95, ge=0, le=101),
+    png_compression: int = Query(3, ge=0, le=9),
+    progressive: bool = False,
+    optimize: bool = False,
+):
+    """Like POST /download, but resumable and cacheable by browsers."""
+    with ImageFileHandler(image_id) as handler:
+        return await _download(
+            request, handler, format, quality, png_compression, progressive, optimize
+        )
@@ -0,0 +1,97 @@
+import asyncio
+
+from fastapi import APIRouter
+from fastapi.responses import PlainTextResponse
+
+from puffy.cache import image_cache
+from puffy.core import blur, timing
+from puffy.encode_cache import encode_cache
+from puffy.executor import executor
+from puffy.history import history_store
+from puffy.inflight import single_flight, source_readers
+from puffy.instrumentation import profiler
+from puffy.previews import preview_store
+from puffy.result_cache import result_cache
+from puffy.store import store
+from puffy.tile_cache import tile_cache
+from puffy.vector_store import vector_store
+
+router = APIRouter()
+
+
+@router.get("/metrics", response_class=PlainTextResponse)
+async def prometheus_metrics():
+    """Stage, operation and request latency histograms for Prometheus."""
+    return PlainTextResponse(
+        timing.registry.render(), media_type="text/plain; version=0.0.4"
+    )
+
+
+@router.get("/metrics/profiler")
+async def profiler_status():
+    return profiler.stats()
+
+
+@router.post("/metrics/profiler")
+async def toggle_profiler(enabled: bool):
+    """Starts or stops sampling; slow requests are dumped while it runs."""
+    if enabled:
+        profiler.enable()
+    else:
+        await asyncio.to_thread(profiler.disable)
+    return profiler.stats()
+
+
+@router.get("/metrics/encodes")
+async def encode_cache_metrics():
+    return encode_cache.stats()
+
+
+@router.get("/metrics/executor")
+async def executor_metrics():
+    return executor.stats()
+
+
+@router.get("/metrics/inflight")
+async def inflight_metrics():
+    return {"operations": single_flight.stats(), "sources": source_readers.stats()}
+
+
+@router.get("/metrics/blur")
+async def blur_metrics():
+    return blur.strategy_counts()
+
+
+@router.get("/metrics/cache")
+async def cache_metrics():
+    return image_cache.stats()
+
+
+@router.get("/metrics/previews")
+async def preview_metrics():
+    return preview_store.stats()
+
+
+@router.get("/metrics/history")
+async def history_metrics():
+    return history_store.stats()
+
+
+@router.get("/metrics/results")
+async def result_cache_metrics():
+    return result_cache.stats()
+
+
+@router.get("/metrics/store")
+async def store_metrics():
+    return store.stats()
+
+
+@router.get("/metrics/vector")
+async def vector_metrics():
+    return vector_store.stats()
+
+
+@router.get("/metrics/tiles")
+async def tile_cache_metrics():
+    return tile_cache.stats()
@@ -2,10 +2,11 @@ from pathlib import Path
 
 from fastapi import APIRouter, Request
 from fastapi.responses import HTMLResponse
-from fastapi.templating import Jinja2Templates
+
+from puffy.instrumentation import TimedTemplates
 
 router = APIRouter()
-templates = Jinja2Templates(
+templates = TimedTemplates(
     directory=str(Path(__file__).resolve().parent.parent / "templates")
 )
 
@@ -1,12 +1,76 @@
+import json
 import uuid
+import xml.etree.ElementTree as ET
+from collections import defaultdict
+from pathlib import Path
+from typing import Literal
 
-from fastapi import APIRouter, Form, Request
-from fastapi.responses import FileResponse, RedirectResponse
+from fastapi import (
+    APIRouter,
+    Form,
+    HTTPException,
+    Query,
+    Request,
+    WebSocket,
+    WebSocketDisconnect,
+)
+from fastapi.responses import HTMLResponse, RedirectResponse, Response
+from starlette.concurrency import run_in_threadpool
 
-from puffy.config import UPLOAD_DIR
-from puffy.core.vector.editor import VectorEditor
+from puffy.core import io
+from puffy.core.vector.geometry import local_name
+from puffy.core.vector.shapes import (
+    MAX_STROKE_WIDTH,
+    ShapeOp,
+    apply_shape_ops,
+    parse_shape_ops,
+)
+from puffy.core.vector.spatial import ShapeIndex, element_ids
+from puffy.handlers import rasterize_vector, render_vector, render_vector_tile
+from puffy.instrumentation import TimedTemplates
+from puffy.vector_store import vector_store
 
 router = APIRouter()
+templates = TimedTemplates(
+    directory=str(Path(__file__).resolve().parent.parent / "templates")
+)
+templates.env.globals["can_encode"] = io.can_encode
+
+# Output pixels per canvas pixel accepted by the raster endpoints.
+MAX_SCALE = 16.0
+
+# Open websocket channels per document.
+_subscribers: defaultdict[str, set[WebSocket]] = defaultdict(set)
+
+
+def _apply_ops(svg_id: str, data) -> list[ShapeOp]:
+    """
+    Validates and applies a batch of shape operations.
+
+    Raises:
+        ValueError: If the batch is invalid.
+        KeyError: If there is no such document.
+    """
+    ops = parse_shape_ops(data)
+    try:
+        with vector_store.edit(svg_id) as editor:
+            apply_shape_ops(editor, ops)
+    except ArithmeticError as e:
+        # Valid numbers can still overflow, e.g. through nested transforms;
+        # the edit has been undone.
+        raise ValueError(f"Shapes could not be placed: {e}") from e
+    return ops
+
+
+async def _broadcast(svg_id: str, ops: list[ShapeOp], sender: WebSocket | None = None):
+    """Sends applied operations to every other client drawing on the document."""
+    subscribers = _subscribers.get(svg_id, set())
+    for websocket in list(subscribers):
+        if websocket is not sender:
+            try:
+                await websocket.send_json({"ops": ops})
+            except (RuntimeError, WebSocketDisconnect):
+                subscribers.discard(websocket)
 
 
 @router.post("/vector/new", response_class=RedirectResponse)
@@ -17,9 +81,8 @@ async def new_vector_canvas(
     units: str = Form("px"),
 ):
     svg_id = f"{uuid.uuid4()}.svg"
-    save_path = UPLOAD_DIR / svg_id
-    VectorEditor.create_canvas(
-        filepath=save_path, width=width, height=height, units=units
+    await run_in_threadpool(
+        vector_store.create, svg_id, width=width, height=height, units=units
     )
     return RedirectResponse(f"/vector?svg_id={svg_id}", status_code=303)
 
@@ -29,23 +92,227 @@ async def add_shape(
     request: Request,
     svg_id: str = Form(...),
     shape: str = Form(...),
-    x: float = Form(...),
-    y: float = Form(...),
-    width: float = Form(...),
-    height: float = Form(...),
+    x: float = Form(..., allow_inf_nan=False),
+    y: float = Form(..., allow_inf_nan=False),
+    width: float = Form(..., allow_inf_nan=False),
+    height: float = Form(..., allow_inf_nan=False),
     fill: str = Form(...),
     stroke: str = Form(...),
-    stroke_width: float = Form(...),
+    stroke_width: float = Form(..., ge=0, le=MAX_STROKE_WIDTH, allow_inf_nan=False),
 ):
-    filepath = UPLOAD_DIR / svg_id
-    editor = VectorEditor(filepath)
-    if shape == "rect":
-        editor.add_rect(x, y, width, height, fill, stroke, stroke_width)
-    editor.save()
+    def add() -> None:
+        with vector_store.edit(svg_id) as editor:
+            if shape == "rect":
+                editor.add_rect(
+                    x,
+                    y,
+                    width,
+                    height,
+                    fill,
+                    stroke,
+                    stroke_width,
+                    element_id=uuid.uuid4().hex[:12],
+                )
+
+    try:
+        await run_in_threadpool(add)
+    except KeyError as e:
+        raise HTTPException(status_code=404, detail="Document not found.") from e
     return {"status": "ok"}
 
 
+@router.post("/vector/shapes/{svg_id}")
+async def add_shapes(svg_id: str, request: Request):
+    """
+    Adds a JSON list of shapes in one request; see ``parse_shape_ops``.
+
+    Returns the ids given to the top-level shapes.
+    """
+    try:
+        ops = await run_in_threadpool(_apply_ops, svg_id, await request.json())
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e)) from e
+    except KeyError as e:
+        raise HTTPException(status_code=404, detail="Document not found.") from e
+    await _broadcast(svg_id, ops)
+    return {"status": "ok", "ids": [op["id"] for op in ops]}
+
+
+@router.websocket("/vector/ws/{svg_id}")
+async def shape_channel(websocket: WebSocket, svg_id: str):
+    """
+    Streams shape operations both ways.
+
+    Each message from a client is a list of shapes, applied as one batch and
+    acknowledged with the ids given to them. Batches applied by other
+    clients, or through ``/vector/shapes``, are pushed as ``{"ops": [...]}``.
+    """
+    if not vector_store.path(svg_id).exists():
+        await websocket.close(code=4404)
+        return
+    await websocket.accept()
+    _subscribers[svg_id].add(websocket)
+    try:
+        while True:
+            text = await websocket.receive_text()
+            try:
+                ops = await run_in_threadpool(_apply_ops, svg_id, json.loads(text))
+            except (ValueError, KeyError) as e:
+                await websocket.send_json({"status": "error", "detail": str(e)})
+                continue
+            await websocket.send_json({"status": "ok", "ids": [op["id"] for op in ops]})
+            await _broadcast(svg_id, ops, sender=websocket)
+    except WebSocketDisconnect:
+        pass
+    finally:
+        _subscribers[svg_id].discard(websocket)
+        if not _subscribers[svg_id]:
+            del _subscribers[svg_id]
+
+
+async def _index(svg_id: str) -> ShapeIndex:
+    try:
+        # Parses the document if it is not loaded
+        return await run_in_threadpool(vector_store.index, svg_id)
+    except KeyError as e:
+        raise HTTPException(status_code=404, detail="Document not found.") from e
+
+
+def _describe(index: ShapeIndex, i: int) -> dict:
+    element = index.elements[i]
+    return {
+        "id": element.get("id"),
+        "shape": local_name(element),
+        "bbox": index.boxes[i],
+    }
+
+
+@router.get("/vector/hit-test/{svg_id}")
+async def hit_test(
+    svg_id: str, x: float, y: float, tolerance: float = Query(2.0, ge=0)
+):
+    """The topmost shape painted at a point of the canvas, or null."""
+    index = await _index(svg_id)
+    i = await run_in_threadpool(index.hit_test, x, y, tolerance)
+    return {"shape": None if i is None else _describe(index, i)}
+
+
+@router.get("/vector/select/{svg_id}")
+async def select_in_rect(
+    svg_id: str,
+    x0: float,
+    y0: float,
+    x1: float,
+    y1: float,
+    mode: Literal["intersect", "contain"] = "intersect",
+):
+    """Ids of the shapes that overlap, or lie inside, a rectangle."""
+    index = await _index(svg_id)
+    box = (min(x0, x1), min(y0, y1), max(x0, x1), max(y0, y1))
+    found = index.query(box) if mode == "intersect" else index.contained(box)
+    return {"ids": element_ids(index, found)}
+
+
+@router.get("/vector/viewport/{svg_id}")
+async def viewport(svg_id: str, x: float, y: float, width: float, height: float):
+    """
+    The part of the document inside a viewport, as SVG.
+
+    Only the shapes that overlap the viewport are included, so clients can
+    show a zoomed-in part of a large document without loading all of it.
+    """
+    if width <= 0 or height <= 0:
+        raise HTTPException(status_code=400, detail="Empty viewport.")
+    index = await _index(svg_id)
+
+    def serialize() -> tuple[bytes, int]:
+        found = index.query((x, y, x + width, y + height))
+        root = ET.Element(
+            "{http://www.w3.org/2000/svg}svg",
+            {
+                "width": f"{width}",
+                "height": f"{height}",
+                "viewBox": f"{x} {y} {width} {height}",
+            },
+        )
+        # Serializing only reads the elements, so they are shared with the
+        # document rather than copied.
+        root.extend(index.elements[i] for i in found)
+        data = ET.tostring(root, encoding="utf-8", xml_declaration=True)
+        return data, len(found)
+
+    data, count = await run_in_threadpool(serialize)
+    return Response(
+        data,
+        media_type="image/svg+xml",
+        headers={"Cache-Control": "no-store", "X-Shape-Count": str(count)},
+    )
+
+
+async def _svg_response(svg_id: str, **headers: str) -> Response:
+    try:
+        data = await run_in_threadpool(vector_store.get_bytes, svg_id)
+    except KeyError as e:
+        raise HTTPException(status_code=404, detail="Document not found.") from e
+    return Response(data, media_type="image/svg+xml", headers=headers)
+
+
+@router.get("/vector/svg/{svg_id}")
+async def view_svg(svg_id: str):
+    """The current document, including edits not yet written to disk."""
+    return await _svg_response(svg_id, **{"Cache-Control": "no-store"})
+
+
 @router.get("/vector/download/{svg_id}")
 async def download_svg(svg_id: str):
-    filepath = UPLOAD_DIR / svg_id
-    return FileResponse(filepath, media_type="image/svg+xml", filename=svg_id)
+    return await _svg_response(
+        svg_id, **{"Content-Disposition": f'attachment; filename="{svg_id}"'}
+    )
+
+
+@router.get("/vector/render/{svg_id}")
+async def render_svg(svg_id: str, scale: float = Query(1.0, gt=0, le=MAX_SCALE)):
+    """The document rasterized at ``scale``, as PNG."""
+    try:
+        data = await render_vector(svg_id, scale)
+    except KeyError as e:
+        raise HTTPException(status_code=404, detail="Document not found.") from e
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e)) from e
+    return Response(data, media_type="image/png", headers={"Cache-Control": "no-store"})
+
+
+@router.get("/vector/tiles/{svg_id}/{tx}/{ty}")
+async def render_tile(
+    svg_id: str, tx: int, ty: int, scale: float = Query(1.0, gt=0, le=MAX_SCALE)
+):
+    """One tile of the rasterized document, as PNG; see ``TileCache``."""
+    try:
+        data = await render_vector_tile(svg_id, scale, tx, ty)
+    except KeyError as e:
+        raise HTTPException(status_code=404, detail="Document not found.") from e
+    except IndexError as e:
+        raise HTTPException(status_code=404, detail=str(e)) from e
+    return Response(data, media_type="image/png", headers={"Cache-Control": "no-store"})
+
+
+@router.post("/vector/rasterize", response_class=HTMLResponse)
+async def rasterize(
+    request: Request,
+    svg_id: str = Form(...),
+    scale: float = Form(1.0, gt=0, le=MAX_SCALE),
+):
+    """Opens a rasterized copy of the document in the image editor."""
+    try:
+        image_id = await rasterize_vector(svg_id, scale)
+    except KeyError:
+        return templates.TemplateResponse(
+            request, "error.html", {"message": "Document not found."}
+        )
+    except ValueError as e:
+        return templates.TemplateResponse(request, "error.html", {"message": str(e)})
+    return templates.TemplateResponse(
+        request,
+        "editor.html",
+        {"image_id": image_id, "alt_text": "rasterized vector canvas"},
+    )
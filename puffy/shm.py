@@ -0,0 +1,202 @@
+"""
+Images in shared memory segments, passed between processes by handle.
+
+The web process owns every segment. An image is shared by copying it into a
+new segment once; the results of worker processes are written into segments
+named by the web process and adopted as arrays without a copy. Only an
+``ImageHandle`` (name, shape and dtype) is ever pickled, never pixel data.
+
+A segment lives as long as any array or view of it is referenced in the web
+process: it is unlinked when the last reference is garbage collected, so
+images can be stored, cached and kept in the history like any other array.
+Segments written by a worker that crashed are unlinked by name.
+
+Segments are opened untracked: ownership is explicit, so the
+multiprocessing resource tracker must not unlink a segment when a worker
+that merely attached to it exits, nor warn about it as leaked.
+"""
+
+from __future__ import annotations
+
+import os
+import sys
+import threading
+import uuid
+import weakref
+from dataclasses import dataclass
+from multiprocessing import resource_tracker, shared_memory
+from typing import Any
+
+import numpy as np
+
+from .core.types import ImageArray
+
+# Short enough for the 31 character limit on macOS
+PREFIX = "puffy-"
+
+
+@dataclass(frozen=True)
+class ImageHandle:
+    """Everything needed to map an image in another process."""
+
+    name: str
+    shape: tuple[int, ...]
+    dtype: str
+
+    @property
+    def nbytes(self) -> int:
+        return int(np.prod(self.shape)) * np.dtype(self.dtype).itemsize
+
+
+def new_name() -> str:
+    return f"{PREFIX}{uuid.uuid4().hex[:16]}"
+
+
+def open_segment(
+    name: str, create: bool = False, size: int = 0
+) -> shared_memory.SharedMemory:
+    """Opens or creates a segment the resource tracker does not know about."""
+    if sys.version_info >= (3, 13):
+        return shared_memory.SharedMemory(name, create, size, track=False)
+    segment = shared_memory.SharedMemory(name, create, size)
+    if os.name == "posix":
+        resource_tracker.unregister(segment._name, "shared_memory")  # type: ignore[attr-defined]
+    return segment
+
+
+def unlink(segment: shared_memory.SharedMemory) -> None:
+    """Unlinks a segment opened by ``open_segment``."""
+    if sys.version_info >= (3, 13) or os.name != "posix":
+        segment.unlink()
+    else:
+        # SharedMemory.unlink would unregister the segment a second time
+        import _posixshmem
+
+        _posixshmem.shm_unlink(segment._name)  # type: ignore[attr-defined]
+
+
+def _view(segment: shared_memory.SharedMemory, handle: ImageHandle) -> ImageArray:
+    return np.ndarray(handle.shape, handle.dtype, buffer=segment.buf)
+
+
+def write(name: str, image: ImageArray) -> ImageHandle:
+    """Copies an image into a new segment; used by workers for their results."""
+    handle = ImageHandle(name, image.shape, image.dtype.str)
+    segment = open_segment(name, create=True, size=max(image.nbytes, 1))
+    try:
+        _view(segment, handle)[...] = image
+    finally:
+        segment.close()
+    return handle
+
+
+class SharedImages:
+    """The segments owned by this process, tracked through their arrays."""
+
+    def __init__(self):
+        # id of the array owning a segment -> (weak reference to it, handle)
+        self._owners: dict[int, tuple[weakref.ref[ImageArray], ImageHandle]] = {}
+        # Unlinked segments whose mappings are closed once their last
+        # buffer export is gone
+        self._closing: list[shared_memory.SharedMemory] = []
+        # Reentrant: a segment may be released by garbage collection while
+        # the lock is held
+        self._lock = threading.RLock()
+        self._counts = {"shared": 0, "adopted": 0, "released": 0, "discarded": 0}
+
+    def handle(self, image: ImageArray) -> ImageHandle | None:
+        """The handle of a whole shared image; None for other arrays and views."""
+        owner = image
+        while isinstance(owner.base, np.ndarray):
+            owner = owner.base
+        with self._lock:
+            entry = self._owners.get(id(owner))
+        if entry is None or entry[0]() is not owner:
+            return None
+        handle = entry[1]
+        if (
+            image.shape != handle.shape
+            or image.dtype.str != handle.dtype
+            or not image.flags.c_contiguous
+            or image.ctypes.data != owner.ctypes.data
+        ):
+            return None
+        return handle
+
+    def share(self, image: ImageArray) -> ImageArray:
+        """
+        Returns the image backed by a segment, copying it into one if needed.
+
+        The segment stays alive while the returned array is referenced.
+        """
+        if self.handle(image) is not None:
+            return image
+        handle = ImageHandle(new_name(), image.shape, image.dtype.str)
+        segment = open_segment(handle.name, create=True, size=max(image.nbytes, 1))
+        owner = self._track(segment, handle, "shared")
+        owner[...] = image
+        owner.flags.writeable = False
+        return owner
+
+    def adopt(self, handle: ImageHandle) -> ImageArray:
+        """Maps a segment written by a worker as a read-only array, taking it over."""
+        segment = open_segment(handle.name)
+        owner = self._track(segment, handle, "adopted")
+        owner.flags.writeable = False
+        return owner
+
+    def discard(self, name: str) -> None:
+        """Unlinks a segment that was never adopted, if it exists."""
+        try:
+            segment = open_segment(name)
+        except FileNotFoundError:
+            return
+        segment.close()
+        unlink(segment)
+        self._count("discarded")
+
+    def _track(
+        self, segment: shared_memory.SharedMemory, handle: ImageHandle, event: str
+    ) -> ImageArray:
+        owner = _view(segment, handle)
+        key = id(owner)
+        with self._lock:
+            self._sweep()
+            self._owners[key] = (weakref.ref(owner), handle)
+            self._counts[event] += 1
+        weakref.finalize(owner, self._release, key, segment)
+        return owner
+
+    def _release(self, key: int, segment: shared_memory.SharedMemory) -> None:
+        # Runs while the owner is being deallocated and still exports the
+        # segment's buffer, so the mapping can only be closed later.
+        unlink(segment)
+        with self._lock:
+            self._owners.pop(key, None)
+            self._closing.append(segment)
+            self._counts["released"] += 1
+
+    def _sweep(self) -> None:
+        closing, self._closing = self._closing, []
+        for segment in closing:
+            try:
+                segment.close()
+            except BufferError:
+                self._closing.append(segment)
+
+    def _count(self, name: str) -> None:
+        with self._lock:
+            self._counts[name] += 1
+
+    def stats(self) -> dict[str, Any]:
+        with self._lock:
+            self._sweep()
+            handles = [handle for _, handle in list(self._owners.values())]
+            return {
+                "segments": len(handles),
+                "bytes": sum(handle.nbytes for handle in handles),
+                **self._counts,
+            }
+
+
+shared_images = SharedImages()
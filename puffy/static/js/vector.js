@@ -2,41 +2,144 @@ document.body.addEventListener('htmx:afterSwap', function(event) {
     const svgObject = document.getElementById('svg-canvas');
     if (!svgObject) return;
 
+    const SVG_NS = 'http://www.w3.org/2000/svg';
+    const svgId = svgObject.data.split('/').pop();
+
     let svgCanvas = null;
+    let tool = null;
     let isDrawing = false;
     let startX, startY;
-    let currentRect = null;
+    let currentShape = null;
+    let points = [];
+
+    // Finished shapes are queued and sent together once per animation frame,
+    // over the websocket when it is open and as one bulk POST otherwise.
+    let queue = [];
+    let flushScheduled = false;
+    let socket = null;
 
     svgObject.addEventListener('load', () => {
         svgCanvas = svgObject.contentDocument;
+        for (const [name, handler] of [
+            ['mousedown', startDrawing],
+            ['mousemove', draw],
+            ['mouseup', stopDrawing],
+            ['mouseleave', stopDrawing],
+        ]) {
+            svgCanvas.addEventListener(name, handler);
+        }
+        connect();
     });
 
-    const rectTool = document.getElementById('rect-tool');
-    if (rectTool) {
-        rectTool.addEventListener('click', () => {
-            if (svgCanvas) {
-                svgCanvas.addEventListener('mousedown', startDrawing);
-                svgCanvas.addEventListener('mousemove', draw);
-                svgCanvas.addEventListener('mouseup', stopDrawing);
-                svgCanvas.addEventListener('mouseleave', stopDrawing);
+    for (const name of ['select', 'rect', 'ellipse', 'line', 'pen']) {
+        const button = document.getElementById(`${name}-tool`);
+        if (button) {
+            button.addEventListener('click', () => { tool = name; });
+        }
+    }
+
+    function connect() {
+        const protocol = location.protocol === 'https:' ? 'wss:' : 'ws:';
+        socket = new WebSocket(`${protocol}//${location.host}/vector/ws/${svgId}`);
+        socket.addEventListener('message', (message) => {
+            const data = JSON.parse(message.data);
+            if (data.ops) {
+                // Shapes drawn by other clients
+                data.ops.forEach(op => render(op, svgCanvas.documentElement));
+            } else if (data.status === 'error') {
+                console.error('Failed to save shapes:', data.detail);
             }
         });
+        socket.addEventListener('close', () => {
+            socket = null;
+            setTimeout(connect, 2000);
+        });
+    }
+
+    function send(op) {
+        queue.push(op);
+        if (!flushScheduled) {
+            flushScheduled = true;
+            requestAnimationFrame(flush);
+        }
+    }
+
+    function flush() {
+        flushScheduled = false;
+        if (queue.length === 0) return;
+        const ops = queue;
+        queue = [];
+        if (socket && socket.readyState === WebSocket.OPEN) {
+            socket.send(JSON.stringify(ops));
+            return;
+        }
+        fetch(`/vector/shapes/${svgId}`, {
+            method: 'POST',
+            headers: {'Content-Type': 'application/json'},
+            body: JSON.stringify(ops)
+        })
+        .then(response => response.json())
+        .then(data => {
+            if (data.status !== 'ok') {
+                console.error('Failed to save shapes');
+            }
+        })
+        .catch(error => console.error('Error:', error));
+    }
+
+    const SVG_ATTRIBUTES = {stroke_width: 'stroke-width'};
+
+    function render(op, parent) {
+        const tag = op.shape === 'group' ? 'g' : op.shape;
+        const element = document.createElementNS(SVG_NS, tag);
+        for (const [key, value] of Object.entries(op)) {
+            if (key !== 'shape' && key !== 'children') {
+                element.setAttribute(SVG_ATTRIBUTES[key] || key, value);
+            }
+        }
+        (op.children || []).forEach(child => render(child, element));
+        parent.appendChild(element);
+    }
+
+    function newId() {
+        return Math.random().toString(16).slice(2, 14);
+    }
+
+    function select(x, y) {
+        fetch(`/vector/hit-test/${svgId}?x=${x}&y=${y}`)
+        .then(response => response.json())
+        .then(data => {
+            const selected = svgCanvas.querySelector('.selected');
+            if (selected) selected.classList.remove('selected');
+            if (selected) selected.removeAttribute('stroke-dasharray');
+            const id = data.shape && data.shape.id;
+            const element = id && svgCanvas.getElementById(id);
+            if (element) {
+                element.classList.add('selected');
+                element.setAttribute('stroke-dasharray', '4 2');
+            }
+        })
+        .catch(error => console.error('Error:', error));
     }
 
     function startDrawing(e) {
+        if (tool === 'select') {
+            select(e.offsetX, e.offsetY);
+            return;
+        }
+        if (!tool) return;
         isDrawing = true;
         startX = e.offsetX;
         startY = e.offsetY;
+        points = [[startX, startY]];
 
-        currentRect = document.createElementNS('http://www.w3.org/2000/svg', 'rect');
-        currentRect.setAttribute('x', startX);
-        currentRect.setAttribute('y', startY);
-        currentRect.setAttribute('width', '0');
-        currentRect.setAttribute('height', '0');
-        currentRect.setAttribute('fill', 'none');
-        currentRect.setAttribute('stroke', 'black');
-        currentRect.setAttribute('stroke-width', '2');
-        svgCanvas.documentElement.appendChild(currentRect);
+        const tag = {rect: 'rect', ellipse: 'ellipse', line: 'line', pen: 'path'}[tool];
+        currentShape = document.createElementNS(SVG_NS, tag);
+        currentShape.setAttribute('fill', 'none');
+        currentShape.setAttribute('stroke', 'black');
+        currentShape.setAttribute('stroke-width', '2');
+        draw(e);
+        svgCanvas.documentElement.appendChild(currentShape);
     }
 
     function draw(e) {
@@ -49,42 +152,43 @@ document.body.addEventListener('htmx:afterSwap', function(event) {
         const newX = (x < startX) ? x : startX;
         const newY = (y < startY) ? y : startY;
 
-        currentRect.setAttribute('x', newX);
-        currentRect.setAttribute('y', newY);
-        currentRect.setAttribute('width', width);
-        currentRect.setAttribute('height', height);
+        if (tool === 'rect') {
+            currentShape.setAttribute('x', newX);
+            currentShape.setAttribute('y', newY);
+            currentShape.setAttribute('width', width);
+            currentShape.setAttribute('height', height);
+        } else if (tool === 'ellipse') {
+            currentShape.setAttribute('cx', newX + width / 2);
+            currentShape.setAttribute('cy', newY + height / 2);
+            currentShape.setAttribute('rx', width / 2);
+            currentShape.setAttribute('ry', height / 2);
+        } else if (tool === 'line') {
+            currentShape.setAttribute('x1', startX);
+            currentShape.setAttribute('y1', startY);
+            currentShape.setAttribute('x2', x);
+            currentShape.setAttribute('y2', y);
+        } else if (tool === 'pen') {
+            points.push([x, y]);
+            currentShape.setAttribute(
+                'd', 'M' + points.map(p => p.join(' ')).join(' L')
+            );
+        }
     }
 
     function stopDrawing() {
         if (!isDrawing) return;
         isDrawing = false;
 
-        const svgId = svgObject.data.split('/').pop();
-        const formData = new FormData();
-        formData.append('svg_id', svgId);
-        formData.append('shape', 'rect');
-        formData.append('x', currentRect.getAttribute('x'));
-        formData.append('y', currentRect.getAttribute('y'));
-        formData.append('width', currentRect.getAttribute('width'));
-        formData.append('height', currentRect.getAttribute('height'));
-        formData.append('fill', currentRect.getAttribute('fill'));
-        formData.append('stroke', currentRect.getAttribute('stroke'));
-        formData.append('stroke_width', currentRect.getAttribute('stroke-width'));
-
-        fetch('/vector/add-shape', {
-            method: 'POST',
-            body: formData
-        })
-        .then(response => response.json())
-        .then(data => {
-            if (data.status === 'ok') {
-                console.log('Shape saved successfully');
-            } else {
-                console.error('Failed to save shape');
-            }
-        })
-        .catch(error => console.error('Error:', error));
+        const shape = tool === 'pen' ? 'path' : tool;
+        const op = {shape: shape, id: newId()};
+        for (const attribute of currentShape.getAttributeNames()) {
+            if (shape === 'line' && attribute === 'fill') continue;
+            op[attribute === 'stroke-width' ? 'stroke_width' : attribute] =
+                currentShape.getAttribute(attribute);
+        }
+        currentShape.setAttribute('id', op.id);
+        send(op);
 
-        currentRect = null;
+        currentShape = null;
     }
 });
@@ -0,0 +1,308 @@
+import hashlib
+import os
+import threading
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any
+
+import numpy as np
+
+from .cache import image_cache
+from .config import IMAGE_STORE, IMAGE_STORE_BYTES, SPILL_DIR, UPLOAD_DIR
+from .core import io
+from .core.types import ImageArray
+from .result_cache import file_digest, link_or_copy
+from .shm import shared_images
+
+
+def is_safe_path(basedir, path, follow_symlinks=True):
+    if follow_symlinks:
+        return os.path.realpath(path).startswith(str(basedir))
+    return os.path.abspath(path).startswith(str(basedir))
+
+
+def _read_only(image: ImageArray) -> ImageArray:
+    if image.base is not None and shared_images.handle(image) is None:
+        # Views (e.g. crops) would otherwise keep the whole parent alive.
+        # Whole images in shared memory are kept as they are, so they can be
+        # handed to compute processes again without a copy.
+        image = image.copy()
+    image.flags.writeable = False
+    return image
+
+
+class ImageStore(ABC):
+    """
+    Storage for image versions, addressed by image id.
+
+    The id's extension names the format the image is delivered in, but
+    backends are free to keep pixels decoded and only encode when the bytes
+    are actually requested. Returned arrays are read-only since they may be
+    shared between requests.
+    """
+
+    # Whether results are cached as files, written with ``write_file`` and
+    # stored with ``put_file``; otherwise they are remembered in memory.
+    caches_files: bool = True
+
+    @abstractmethod
+    def put(self, image_id: str, image: ImageArray) -> None:
+        """Stores decoded pixels."""
+
+    @abstractmethod
+    def put_bytes(self, image_id: str, data: bytes | memoryview) -> None:
+        """
+        Stores an encoded image, e.g. an upload.
+
+        The pixels are decoded straight from ``data``, so a following ``get``
+        does not read the image back.
+
+        Raises:
+            ValueError: If the data cannot be decoded.
+        """
+
+    @abstractmethod
+    def put_file(self, image_id: str, path: Path) -> None:
+        """Stores the image in a file written by ``write_file`` or a codec."""
+
+    @abstractmethod
+    def get(self, image_id: str) -> ImageArray:
+        """Returns the decoded pixels; raises KeyError for unknown ids."""
+
+    @abstractmethod
+    def get_bytes(self, image_id: str) -> bytes:
+        """Returns the image encoded in the format of its id's extension."""
+
+    @abstractmethod
+    def write_file(self, image_id: str, path: Path) -> None:
+        """Writes the image to ``path`` in the format of ``file_suffix``."""
+
+    @abstractmethod
+    def file_suffix(self, image_id: str) -> str:
+        """Extension of the files produced by ``write_file``."""
+
+    @abstractmethod
+    def delete(self, image_id: str) -> None: ...
+
+    @abstractmethod
+    def __contains__(self, image_id: str) -> bool: ...
+
+    @abstractmethod
+    def digest(self, image_id: str) -> str:
+        """A content hash that is equal for equal images."""
+
+    @abstractmethod
+    def stats(self) -> dict[str, Any]: ...
+
+
+class FilesystemStore(ImageStore):
+    """
+    Keeps every version as an encoded file in a directory.
+
+    Decoded pixels are cached in the process-wide image cache, so chained
+    operations still skip the decoder, but each ``put`` pays for an encode.
+    """
+
+    def __init__(self, directory: Path = UPLOAD_DIR):
+        self.directory = directory
+        self._encodes = 0
+
+    def path(self, image_id: str) -> Path:
+        path = self.directory / image_id
+        if not is_safe_path(self.directory, path):
+            raise KeyError(image_id)
+        return path
+
+    def put(self, image_id: str, image: ImageArray) -> None:
+        io.save_image(image, self.path(image_id))
+        self._encodes += 1
+        image_cache.put(image_id, image)
+
+    def put_bytes(self, image_id: str, data: bytes | memoryview) -> None:
+        image = io.decode_image(data)
+        self.path(image_id).write_bytes(data)
+        image_cache.put(image_id, image)
+
+    def put_file(self, image_id: str, path: Path) -> None:
+        destination = self.path(image_id)
+        if path.suffix.lower() == destination.suffix.lower():
+            link_or_copy(path, destination)
+        else:
+            self.put(image_id, io.load_image(path))
+
+    def get(self, image_id: str) -> ImageArray:
+        image = image_cache.get(image_id)
+        if image is None:
+            try:
+                image = io.load_image(self.path(image_id))
+            except FileNotFoundError as e:
+                raise KeyError(image_id) from e
+            image_cache.put(image_id, image)
+        return image
+
+    def get_bytes(self, image_id: str) -> bytes:
+        try:
+            return self.path(image_id).read_bytes()
+        except FileNotFoundError as e:
+            raise KeyError(image_id) from e
+
+    def write_file(self, image_id: str, path: Path) -> None:
+        link_or_copy(self.path(image_id), path)
+
+    def file_suffix(self, image_id: str) -> str:
+        return Path(image_id).suffix.lower()
+
+    def delete(self, image_id: str) -> None:
+        image_cache.discard(image_id)
+        try:
+            self.path(image_id).unlink(missing_ok=True)
+        except KeyError:
+            pass
+
+    def __contains__(self, image_id: str) -> bool:
+        try:
+            return self.path(image_id).is_file()
+        except KeyError:
+            return False
+
+    def digest(self, image_id: str) -> str:
+        return file_digest(self.path(image_id))
+
+    def stats(self) -> dict[str, Any]:
+        return {
+            "backend": "filesystem",
+            "encodes": self._encodes,
+            **image_cache.stats(),
+        }
+
+
+class MemoryStore(ImageStore):
+    """
+    Keeps decoded versions in memory and spills to disk past a byte budget.
+
+    Least recently used images are written to ``spill_dir`` as raw ``.npy``
+    arrays (no codec involved) and read back on the next access. Images are
+    only encoded when ``get_bytes`` is called.
+    """
+
+    caches_files = False
+
+    def __init__(self, max_bytes: int = IMAGE_STORE_BYTES, spill_dir: Path = SPILL_DIR):
+        self.max_bytes = max_bytes
+        self.spill_dir = spill_dir
+        self._lock = threading.RLock()
+        self._entries: OrderedDict[str, ImageArray] = OrderedDict()
+        self._spilled: dict[str, int] = {}
+        self._digests: dict[str, str] = {}
+        self._bytes = 0
+        self._spills = 0
+        self._restores = 0
+        self._encodes = 0
+
+    def _spill_path(self, image_id: str) -> Path:
+        return self.spill_dir / f"{hashlib.sha1(image_id.encode()).hexdigest()}.npy"
+
+    def put(self, image_id: str, image: ImageArray) -> None:
+        image = _read_only(image)
+        with self._lock:
+            self._discard(image_id)
+            self._entries[image_id] = image
+            self._bytes += image.nbytes
+            while self._bytes > self.max_bytes and len(self._entries) > 1:
+                self._spill(next(iter(self._entries)))
+
+    def _spill(self, image_id: str) -> None:
+        image = self._entries.pop(image_id)
+        self._bytes -= image.nbytes
+        io.save_image(image, self._spill_path(image_id))
+        self._spilled[image_id] = image.nbytes
+        self._spills += 1
+
+    def put_bytes(self, image_id: str, data: bytes | memoryview) -> None:
+        self.put(image_id, io.decode_image(data))
+
+    def put_file(self, image_id: str, path: Path) -> None:
+        self.put(image_id, io.load_image(path))
+
+    def get(self, image_id: str) -> ImageArray:
+        with self._lock:
+            image = self._entries.get(image_id)
+            if image is not None:
+                self._entries.move_to_end(image_id)
+                return image
+            if image_id not in self._spilled:
+                raise KeyError(image_id)
+            path = self._spill_path(image_id)
+            image = io.load_image(path)
+            del self._spilled[image_id]
+            path.unlink(missing_ok=True)
+            self._restores += 1
+            self.put(image_id, image)
+            return self._entries[image_id]
+
+    def get_bytes(self, image_id: str) -> bytes:
+        image = self.get(image_id)
+        with self._lock:
+            self._encodes += 1
+        return io.encode_image(image, Path(image_id).suffix)
+
+    def write_file(self, image_id: str, path: Path) -> None:
+        io.save_image(self.get(image_id), path)
+
+    def file_suffix(self, image_id: str) -> str:
+        return ".npy"
+
+    def delete(self, image_id: str) -> None:
+        with self._lock:
+            self._discard(image_id)
+
+    def _discard(self, image_id: str) -> None:
+        image = self._entries.pop(image_id, None)
+        if image is not None:
+            self._bytes -= image.nbytes
+        if self._spilled.pop(image_id, None) is not None:
+            self._spill_path(image_id).unlink(missing_ok=True)
+        self._digests.pop(image_id, None)
+
+    def __contains__(self, image_id: str) -> bool:
+        with self._lock:
+            return image_id in self._entries or image_id in self._spilled
+
+    def digest(self, image_id: str) -> str:
+        with self._lock:
+            digest = self._digests.get(image_id)
+        if digest is None:
+            image = self.get(image_id)
+            h = hashlib.sha256(str(image.shape).encode())
+            h.update(np.ascontiguousarray(image).data)
+            digest = h.hexdigest()
+            with self._lock:
+                if image_id in self:
+                    self._digests[image_id] = digest
+        return digest
+
+    def stats(self) -> dict[str, Any]:
+        with self._lock:
+            return {
+                "backend": "memory",
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "spilled_entries": len(self._spilled),
+                "spilled_bytes": sum(self._spilled.values()),
+                "spills": self._spills,
+                "restores": self._restores,
+                "encodes": self._encodes,
+            }
+
+
+def create_store(backend: str = IMAGE_STORE) -> ImageStore:
+    if backend == "memory":
+        return MemoryStore()
+    if backend == "filesystem":
+        return FilesystemStore()
+    raise ValueError(f"Unknown image store backend: {backend}")
+
+
+store = create_store()
@@ -0,0 +1,159 @@
+"""
+Cache of rasterized tiles of vector documents.
+
+Tiles are addressed by document, scale and position on the tile grid at that
+scale. Each cached tile remembers how many shapes of its document it shows.
+Since shapes are only appended, and so drawn on top of everything before
+them, a tile is brought up to date by drawing just the newer shapes that
+overlap it, and tiles that no new shape touches are reused as they are.
+The shapes overlapping a tile are found through the document's spatial
+index.
+"""
+
+import math
+import threading
+import weakref
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any
+
+import numpy as np
+
+from .config import MAX_UPLOAD_PIXELS, RASTER_CACHE_BYTES, RASTER_TILE_SIZE
+from .core.types import ImageArray
+from .core.vector import raster
+from .core.vector.spatial import ShapeIndex
+from .vector_store import vector_store
+
+
+@dataclass
+class _Tile:
+    image: ImageArray
+    drawn: int  # number of root children drawn
+
+
+class TileCache:
+    """LRU cache of rendered tiles, bounded by total size."""
+
+    def __init__(
+        self,
+        tile_size: int = RASTER_TILE_SIZE,
+        max_bytes: int = RASTER_CACHE_BYTES,
+        max_pixels: int = MAX_UPLOAD_PIXELS,
+    ):
+        self.tile_size = tile_size
+        self.max_bytes = max_bytes
+        self.max_pixels = max_pixels
+        # The index each document's tiles were rendered from; documents
+        # parsed again after eviction from the store get new tiles.
+        self._indexes: dict[str, weakref.ref[ShapeIndex]] = {}
+        self._tiles: OrderedDict[tuple[str, float, int, int], _Tile] = OrderedDict()
+        self._lock = threading.Lock()
+        self._bytes = 0
+        self._counts = {"hits": 0, "unchanged": 0, "updated": 0, "rendered": 0}
+
+    def _sync(self, svg_id: str) -> tuple[ShapeIndex, int]:
+        index = vector_store.index(svg_id)
+        with self._lock:
+            known = self._indexes.get(svg_id)
+            if known is None or known() is not index:
+                self._indexes[svg_id] = weakref.ref(index)
+                self._discard_tiles(svg_id)
+        return index, len(index)
+
+    def tile(self, svg_id: str, scale: float, tx: int, ty: int) -> ImageArray:
+        """
+        Returns tile ``(tx, ty)`` of the document at ``scale``; read-only.
+
+        Raises:
+            KeyError: If there is no such document.
+            IndexError: If the tile lies outside the document.
+        """
+        index, count = self._sync(svg_id)
+        width, height = (math.ceil(v * scale) for v in index.size)
+        size = self.tile_size
+        x0, y0 = tx * size, ty * size
+        if tx < 0 or ty < 0 or x0 >= width or y0 >= height:
+            raise IndexError("Tile outside the document")
+        region = (x0, y0, min(x0 + size, width), min(y0 + size, height))
+        # The region in canvas pixels, with a margin for anti-aliasing
+        bounds = tuple(v / scale for v in raster.scaled_box(region, 1))
+
+        key = (svg_id, round(scale, 6), tx, ty)
+        with self._lock:
+            cached = self._tiles.get(key)
+            if cached is not None:
+                self._tiles.move_to_end(key)
+        if cached is not None and cached.drawn >= count:
+            self._count("hits")
+            return cached.image
+
+        if cached is None:
+            outlines = index.outlines_of(index.query(bounds, 0, count))
+            image = raster.render(outlines, region, scale)
+            self._count("rendered")
+        else:
+            new = index.query(bounds, cached.drawn, count)
+            if not new:
+                image = cached.image
+                self._count("unchanged")
+            else:
+                outlines = index.outlines_of(new)
+                image = raster.render(outlines, region, scale, out=cached.image.copy())
+                self._count("updated")
+        image.flags.writeable = False
+        self._put(key, _Tile(image, count))
+        return image
+
+    def render(self, svg_id: str, scale: float = 1.0) -> ImageArray:
+        """
+        Renders a whole document from its tiles.
+
+        Raises:
+            KeyError: If there is no such document.
+            ValueError: If the image would be larger than ``max_pixels``.
+        """
+        index, _ = self._sync(svg_id)
+        width, height = (math.ceil(v * scale) for v in index.size)
+        if width * height > self.max_pixels or width < 1 or height < 1:
+            raise ValueError(f"Cannot render {width}x{height} pixels")
+        out = np.empty((height, width, 3), dtype=np.uint8)
+        size = self.tile_size
+        for ty in range(math.ceil(height / size)):
+            for tx in range(math.ceil(width / size)):
+                tile = self.tile(svg_id, scale, tx, ty)
+                h, w = tile.shape[:2]
+                out[ty * size : ty * size + h, tx * size : tx * size + w] = tile
+        return out
+
+    def _put(self, key: tuple[str, float, int, int], tile: _Tile) -> None:
+        with self._lock:
+            previous = self._tiles.pop(key, None)
+            if previous is not None:
+                self._bytes -= previous.image.nbytes
+            self._tiles[key] = tile
+            self._bytes += tile.image.nbytes
+            while self._bytes > self.max_bytes:
+                _, oldest = self._tiles.popitem(last=False)
+                self._bytes -= oldest.image.nbytes
+
+    def _discard_tiles(self, svg_id: str) -> None:
+        for key in [k for k in self._tiles if k[0] == svg_id]:
+            self._bytes -= self._tiles.pop(key).image.nbytes
+
+    def _count(self, name: str) -> None:
+        with self._lock:
+            self._counts[name] += 1
+
+    def stats(self) -> dict[str, Any]:
+        with self._lock:
+            return {
+                "tiles": len(self._tiles),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "tile_size": self.tile_size,
+                **self._counts,
+            }
+
+
+tile_cache = TileCache()
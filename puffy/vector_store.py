@@ -0,0 +1,352 @@
+"""
+In-memory store of parsed SVG documents for the vector editor.
+
+Documents are parsed once and edited in place, so adding a shape is an
+append to the element tree, and to the document's spatial index, instead of
+a parse and rewrite of the whole file.
+
+On disk a document is a snapshot, the SVG file itself, and an append-only
+journal next to it with one JSON line per top-level element added since.
+Each line records the position of its element among the root's children,
+so replaying a journal over a snapshot that already holds some of its
+elements skips them, and a line torn by a crash ends the replay. A
+background thread appends the journal lines of all edits made in the last
+``flush_interval`` seconds with a single ``fsync`` per document, so an edit
+costs disk writes in proportion to the change, not to the document. Once a
+journal outgrows both ``journal_bytes`` and the snapshot it is folded into
+a new snapshot, which replaces the old one atomically.
+
+The full SVG is only serialized when it is asked for, for downloads or new
+snapshots, and is kept until the next edit. Past ``max_elements`` the least
+recently used documents are flushed and dropped; they are parsed again on
+their next use.
+"""
+
+import json
+import os
+import threading
+import time
+import xml.etree.ElementTree as ET
+from collections import OrderedDict
+from collections.abc import Iterator
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any
+
+from .config import (
+    UPLOAD_DIR,
+    VECTOR_FLUSH_INTERVAL_MS,
+    VECTOR_JOURNAL_BYTES,
+    VECTOR_MAX_ELEMENTS,
+)
+from .core.vector.editor import VectorEditor
+from .core.vector.geometry import canvas_size, canvas_transform
+from .core.vector.spatial import ShapeIndex
+
+
+@dataclass
+class SvgDocument:
+    editor: VectorEditor
+    elements: int
+    index: ShapeIndex
+    snapshot_bytes: int = 0
+    journal_bytes: int = 0
+    version: int = 0
+    saved_version: int = 0
+    # Journal lines of edits not yet written
+    pending: list[bytes] = field(default_factory=list)
+    # The serialized document and the version it is of
+    svg: tuple[int, bytes] | None = None
+    lock: threading.Lock = field(default_factory=threading.Lock)
+    # Held while writing to disk, so that journal lines stay in order
+    write_lock: threading.Lock = field(default_factory=threading.Lock)
+
+    @property
+    def dirty(self) -> bool:
+        return self.version != self.saved_version
+
+
+def _open(editor: VectorEditor, snapshot_bytes: int, journal_bytes: int) -> SvgDocument:
+    root = editor.root
+    index = ShapeIndex(canvas_size(root), canvas_transform(root))
+    index.extend(root)
+    return SvgDocument(editor, editor.elements, index, snapshot_bytes, journal_bytes)
+
+
+def journal_path(path: Path) -> Path:
+    return path.with_name(f"{path.name}.journal")
+
+
+def _record(position: int, element: ET.Element) -> bytes:
+    line = json.dumps({"at": position, "xml": ET.tostring(element, "unicode")})
+    return line.encode() + b"\n"
+
+
+def _replay(editor: VectorEditor, journal: Path) -> int:
+    """
+    Appends journaled elements missing from a snapshot to its editor.
+
+    A torn or corrupt tail is cut off the journal, so that new lines are not
+    appended after it.
+
+    Returns:
+        The length of the valid part of the journal.
+    """
+    try:
+        data = journal.read_bytes()
+    except FileNotFoundError:
+        return 0
+    root = editor.root
+    valid = 0
+    for line in data.splitlines(keepends=True):
+        try:
+            if not line.endswith(b"\n"):
+                raise ValueError("Incomplete journal line")
+            record = json.loads(line)
+            position, element = record["at"], ET.fromstring(record["xml"])
+        except (ValueError, KeyError, TypeError, ET.ParseError):
+            break
+        if position > len(root):
+            break  # a gap; nothing after it can be applied
+        if position == len(root):
+            root.append(element)
+            editor.elements += sum(1 for _ in element.iter())
+        valid += len(line)
+    if valid < len(data):
+        with open(journal, "r+b") as f:
+            f.truncate(valid)
+    return valid
+
+
+def _fsync_directory(directory: Path) -> None:
+    """Makes a rename in ``directory`` durable, where the platform allows it."""
+    if not hasattr(os, "O_DIRECTORY"):
+        return
+    fd = os.open(directory, os.O_RDONLY | os.O_DIRECTORY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def _write_snapshot(path: Path, data: bytes) -> None:
+    """Replaces a document's snapshot atomically and durably."""
+    tmp = path.with_name(f".{path.name}.tmp")
+    with open(tmp, "wb") as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+    _fsync_directory(path.parent)
+
+
+class VectorStore:
+    """Parsed SVG documents keyed by svg id, persisted as snapshots and journals."""
+
+    def __init__(
+        self,
+        directory: Path = UPLOAD_DIR,
+        max_elements: int = VECTOR_MAX_ELEMENTS,
+        flush_interval: float = VECTOR_FLUSH_INTERVAL_MS / 1000,
+        journal_bytes: int = VECTOR_JOURNAL_BYTES,
+    ):
+        self.directory = directory
+        self.max_elements = max_elements
+        self.flush_interval = flush_interval
+        self.journal_bytes = journal_bytes
+        self._documents: OrderedDict[str, SvgDocument] = OrderedDict()
+        self._elements = 0
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._flusher: threading.Thread | None = None
+        self._loads = 0
+        self._syncs = 0
+        self._snapshots = 0
+        self._evictions = 0
+
+    def path(self, svg_id: str) -> Path:
+        return self.directory / svg_id
+
+    def create(self, svg_id: str, width: int, height: int, units: str = "px") -> None:
+        """Creates a canvas and writes its first snapshot right away."""
+        path = self.path(svg_id)
+        editor = VectorEditor.create_canvas(
+            path, width=width, height=height, units=units, save=False
+        )
+        data = editor.to_bytes()
+        _write_snapshot(path, data)
+        journal_path(path).unlink(missing_ok=True)
+        self._add(svg_id, _open(editor, len(data), 0))
+
+    def _add(self, svg_id: str, document: SvgDocument) -> SvgDocument:
+        evicted = []
+        with self._lock:
+            existing = self._documents.get(svg_id)
+            if existing is not None:
+                # Another request parsed the same file concurrently.
+                self._documents.move_to_end(svg_id)
+                return existing
+            self._documents[svg_id] = document
+            self._elements += document.elements
+            while self._elements > self.max_elements and len(self._documents) > 1:
+                _, oldest = self._documents.popitem(last=False)
+                self._elements -= oldest.elements
+                self._evictions += 1
+                evicted.append(oldest)
+        for oldest in evicted:
+            self._write(oldest)
+        return document
+
+    def _document(self, svg_id: str) -> SvgDocument:
+        with self._lock:
+            document = self._documents.get(svg_id)
+            if document is not None:
+                self._documents.move_to_end(svg_id)
+                return document
+            self._loads += 1
+        path = self.path(svg_id)
+        if not path.exists():
+            raise KeyError(svg_id)
+        editor = VectorEditor(path)
+        journal_bytes = _replay(editor, journal_path(path))
+        return self._add(svg_id, _open(editor, path.stat().st_size, journal_bytes))
+
+    @contextmanager
+    def edit(self, svg_id: str) -> Iterator[VectorEditor]:
+        """
+        Yields the document's editor for changes; they are saved in the background.
+
+        Changes may only append elements to the root, or to elements appended
+        in the same edit: only the new top-level elements are journaled. An
+        edit that raises, or whose elements cannot be indexed, is undone.
+
+        Raises:
+            KeyError: If there is no such document.
+        """
+        document = self._document(svg_id)
+        with document.lock:
+            editor = document.editor
+            start = len(document.index)
+            try:
+                yield editor
+                new = editor.root[start:]
+                document.index.extend(new)
+            except BaseException:
+                # Otherwise the journal would skip the elements and every
+                # later line would follow a gap.
+                del editor.root[start:]
+                editor.elements = document.elements
+                raise
+            added = editor.elements - document.elements
+            document.elements += added
+            document.version += 1
+            document.pending += [
+                _record(i, element) for i, element in enumerate(new, start)
+            ]
+        with self._lock:
+            evicted = self._documents.get(svg_id) is not document
+            if not evicted:
+                self._elements += added
+        if evicted:
+            self._write(document)
+        else:
+            self._schedule_flush()
+
+    def index(self, svg_id: str) -> ShapeIndex:
+        """
+        Returns the spatial index of a document's shapes.
+
+        Raises:
+            KeyError: If there is no such document.
+        """
+        return self._document(svg_id).index
+
+    def get_bytes(self, svg_id: str) -> bytes:
+        """Serializes the current state of a document."""
+        document = self._document(svg_id)
+        with document.lock:
+            return self._serialize(document)
+
+    @staticmethod
+    def _serialize(document: SvgDocument) -> bytes:
+        # Called with the document's lock held
+        if document.svg is None or document.svg[0] != document.version:
+            document.svg = (document.version, document.editor.to_bytes())
+        return document.svg[1]
+
+    def _schedule_flush(self) -> None:
+        with self._lock:
+            if self._flusher is None:
+                self._flusher = threading.Thread(
+                    target=self._flush_loop, name="puffy-vector-flush", daemon=True
+                )
+                self._flusher.start()
+        self._wake.set()
+
+    def _flush_loop(self) -> None:
+        while True:
+            self._wake.wait()
+            self._wake.clear()
+            self.flush()
+            # Edits arriving in the meantime are batched into the next write.
+            time.sleep(self.flush_interval)
+
+    def flush(self, svg_id: str | None = None) -> int:
+        """Writes dirty documents, or just ``svg_id``; returns the number written."""
+        with self._lock:
+            if svg_id is None:
+                documents = list(self._documents.values())
+            else:
+                documents = [d for d in [self._documents.get(svg_id)] if d is not None]
+        return sum(self._write(document) for document in documents)
+
+    def _write(self, document: SvgDocument) -> bool:
+        """Appends pending journal lines, or writes a new snapshot instead."""
+        with document.write_lock:
+            with document.lock:
+                if not document.dirty:
+                    return False
+                records = b"".join(document.pending)
+                document.pending = []
+                version = document.version
+                size = document.journal_bytes + len(records)
+                compact = size > max(self.journal_bytes, document.snapshot_bytes)
+                data = self._serialize(document) if compact else b""
+            path = document.editor.filepath
+            if compact:
+                # The snapshot holds every pending line, so the journal can
+                # be emptied; lines left by a crash in between are skipped.
+                _write_snapshot(path, data)
+                with open(journal_path(path), "wb") as f:
+                    os.fsync(f.fileno())
+                document.snapshot_bytes, document.journal_bytes = len(data), 0
+            else:
+                with open(journal_path(path), "ab") as f:
+                    f.write(records)
+                    f.flush()
+                    os.fsync(f.fileno())
+                document.journal_bytes = size
+            document.saved_version = version
+        with self._lock:
+            self._syncs += 1
+            self._snapshots += compact
+        return True
+
+    def stats(self) -> dict[str, Any]:
+        with self._lock:
+            documents = list(self._documents.values())
+            return {
+                "documents": len(documents),
+                "elements": self._elements,
+                "max_elements": self.max_elements,
+                "dirty": sum(1 for d in documents if d.dirty),
+                "journal_bytes": sum(d.journal_bytes for d in documents),
+                "loads": self._loads,
+                "syncs": self._syncs,
+                "snapshots": self._snapshots,
+                "evictions": self._evictions,
+            }
+
+
+vector_store = VectorStore()
@@ -0,0 +1,25 @@
+from benchmarks import baseline, suite
+
+
+def test_suite_times_every_case():
+    results = suite.run(sizes=[(32, 24)], repeat=1)
+
+    assert "transform.resize[32x24,float32]" in results
+    assert "adjustments.apply_curve[32x24,float32]" not in results
+    assert "io.load_image.npy[32x24,uint8]" in results
+    assert all(seconds >= 0 for seconds in results.values())
+
+
+def test_compare_flags_regressions(tmp_path):
+    path = tmp_path / "baseline.json"
+    baseline.save(
+        {"ops": {"blur": 0.010}, "http": {"GET /": {"throughput": 100.0, "errors": 0}}},
+        path,
+    )
+    saved = baseline.load(path)
+    assert saved == {"ops/blur": 0.010, "http/GET //throughput": 100.0}
+
+    results = {"ops": {"blur": 0.011}, "http": {"GET /": {"throughput": 50.0}}}
+    changes, regressions = baseline.compare(saved, results, tolerance=0.2)
+    assert len(changes) == 2
+    assert [c.metric for c in regressions] == ["http/GET //throughput"]
@@ -0,0 +1,42 @@
+import numpy as np
+
+from puffy.cache import ImageCache
+
+
+def test_hit_and_miss_counters():
+    cache = ImageCache(max_bytes=10_000)
+    image = np.zeros((10, 10, 3), dtype=np.uint8)
+
+    assert cache.get("a.png") is None
+    cache.put("a.png", image)
+    assert cache.get("a.png") is image
+
+    stats = cache.stats()
+    assert stats["hits"] == 1
+    assert stats["misses"] == 1
+    assert stats["bytes"] == image.nbytes
+
+
+def test_evicts_least_recently_used():
+    cache = ImageCache(max_bytes=2 * 300)
+    for name in ("a", "b"):
+        cache.put(name, np.zeros((10, 10, 3), dtype=np.uint8))
+    cache.get("a")
+    cache.put("c", np.zeros((10, 10, 3), dtype=np.uint8))
+
+    assert "a" in cache
+    assert "b" not in cache
+    assert "c" in cache
+    assert cache.stats()["evictions"] == 1
+
+
+def test_cached_images_are_read_only():
+    cache = ImageCache()
+    parent = np.zeros((10, 10, 3), dtype=np.uint8)
+    cache.put("crop", parent[2:5, 2:5])
+
+    cached = cache.get("crop")
+    assert cached is not None
+    assert cached.base is None
+    assert not cached.flags.writeable
+    assert parent.flags.writeable
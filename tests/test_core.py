@@ -1,7 +1,32 @@
+import tracemalloc
+
+import cv2
 import numpy as np
+import pytest
 
-from puffy.core.adjustments import adjust_brightness_contrast, adjust_color_balance
+from puffy.core import blur as blur_module
+from puffy.core import noise, parse_recipe, run_batch
+from puffy.core.adjustments import (
+    adjust_brightness_contrast,
+    adjust_color_balance,
+    adjust_gamma,
+    adjust_levels,
+)
+from puffy.core.buffers import ScratchPool
+from puffy.core.editor import ImageEditor
 from puffy.core.effects import add_noise, blur
+from puffy.core.io import (
+    decode_image,
+    encode_image,
+    negotiate_format,
+    open_raw,
+    open_tiff,
+    sniff_image,
+)
+from puffy.core.lut import apply_lut, compile_lut
+from puffy.core.pipeline import Pipeline, Step
+from puffy.core.pyramid import build_pyramid, scale_step, select_level
+from puffy.core.tiling import process_file_tiled, run_tiled
 from puffy.core.transform import resize
 
 
@@ -63,3 +88,420 @@ def test_blur():
     # Apply median blur
     blurred_image = blur(image, "median", 5)
     assert blurred_image.shape == (100, 100, 3)
+
+
+def test_deferred_editor_matches_immediate_mode():
+    rng = np.random.default_rng(0)
+    image = rng.integers(0, 256, (120, 160, 3), dtype=np.uint8)
+
+    def chain(editor):
+        return (
+            editor.flip()
+            .blur("gaussian", 7)
+            .adjust_brightness_contrast(10, 1.3)
+            .adjust_color_balance(5, -20, 30)
+            .crop(3, 50, 40, 30)
+        )
+
+    immediate = chain(ImageEditor(_image=image)).image
+    deferred = chain(ImageEditor(_image=image).defer()).image
+    assert np.array_equal(immediate, deferred)
+
+
+def test_deferred_editor_keeps_seeded_noise_ahead_of_crops():
+    image = np.random.default_rng(0).integers(0, 256, (120, 160, 3), dtype=np.uint8)
+
+    def chain(editor):
+        return (
+            editor.blur("gaussian", 5)
+            .add_noise("gaussian", 0.2, seed=7)
+            .adjust_gamma(1.2)
+            .crop(30, 20, 50, 40)
+        )
+
+    immediate = chain(ImageEditor(_image=image)).image
+    deferred = chain(ImageEditor(_image=image).defer()).image
+    assert np.array_equal(immediate, deferred)
+
+
+def test_pipeline_fuses_operations():
+    pipeline = Pipeline((160, 120))
+    pipeline.record("rotate", angle=90)
+    pipeline.record("flip", horizontal=True, vertical=False)
+    pipeline.record("resize", width=80, height=60)
+    pipeline.record("adjust_brightness_contrast", brightness=10, contrast=1.2)
+    pipeline.record("adjust_color_balance", red=5, green=0, blue=0)
+    pipeline.record("blur", blur_type="gaussian", kernel_size=5)
+    pipeline.record("crop", x=10, y=10, width=20, height=20)
+
+    # the crop moves ahead of the blur and point ops and joins the affine run
+    assert [stage.kind for stage in pipeline.plan()] == [
+        "affine",
+        "lut",
+        "blur:separable",
+        "crop",
+    ]
+
+
+def test_run_batch(tmp_path):
+    sources = []
+    for i in range(3):
+        path = tmp_path / f"{i}.png"
+        cv2.imwrite(str(path), np.full((40, 60, 3), 100, dtype=np.uint8))
+        sources.append(path)
+    sources.append(tmp_path / "missing.png")
+
+    recipe = parse_recipe(
+        [
+            {"op": "resize", "width": 30, "height": 20},
+            {"op": "adjust_brightness_contrast", "args": {"brightness": 10}},
+            {"op": "blur", "kernel_size": 3},
+        ]
+    )
+    results = sorted(
+        run_batch(recipe, sources, tmp_path, max_workers=2), key=lambda r: r.index
+    )
+
+    assert [r.ok for r in results] == [True, True, True, False]
+    assert cv2.imread(str(results[0].output)).shape == (20, 30, 3)
+
+
+def test_parse_recipe_rejects_unknown_steps():
+    with pytest.raises(ValueError):
+        parse_recipe([{"op": "save", "path": "/etc/passwd"}])
+    with pytest.raises(ValueError):
+        parse_recipe([{"op": "blur", "radius": 3}])
+
+
+@pytest.mark.parametrize(
+    "step",
+    [
+        {"op": "crop", "x": "a", "y": 0, "width": 10, "height": 10},
+        {"op": "blur", "kernel_size": "x"},
+        {"op": "blur", "kernel_size": 2.5},
+        {"op": "flip", "horizontal": 1},
+        {"op": "rotate", "angle": 10, "center": [1]},
+        {"op": "adjust_gamma", "gamma": 1.0, "roi": 5},
+    ],
+)
+def test_parse_recipe_rejects_wrong_types(step):
+    with pytest.raises(ValueError):
+        parse_recipe([step])
+
+
+def test_parse_recipe_converts_values():
+    recipe = parse_recipe(
+        [
+            {"op": "blur", "kernel_size": 5.0, "roi": [0, 0, 10, 10]},
+            {"op": "rotate", "angle": 90, "center": [4, 5]},
+        ]
+    )
+    assert recipe[0].kwargs == {"kernel_size": 5, "roi": (0, 0, 10, 10)}
+    assert type(recipe[0].kwargs["kernel_size"]) is int
+    assert recipe[1].kwargs == {"angle": 90.0, "center": (4, 5)}
+
+
+def test_run_batch_reports_type_errors_per_item(tmp_path):
+    source = tmp_path / "a.png"
+    cv2.imwrite(str(source), np.zeros((8, 8, 3), np.uint8))
+    recipe = [Step("blur", {"kernel_size": "x"})]
+    (result,) = run_batch(recipe, [source], tmp_path)
+    assert not result.ok
+
+
+def test_run_tiled_matches_whole_image():
+    rng = np.random.default_rng(0)
+    image = rng.integers(0, 256, (70, 90, 3), dtype=np.uint8)
+    recipe = [
+        Step("blur", {"blur_type": "gaussian", "kernel_size": 7}),
+        Step("adjust_brightness_contrast", {"brightness": 10, "contrast": 1.2}),
+        Step("blur", {"blur_type": "median", "kernel_size": 5}),
+    ]
+
+    expected = blur(
+        adjust_brightness_contrast(blur(image, "gaussian", 7), 10, 1.2), "median", 5
+    )
+    tiled = run_tiled(image, recipe, tile_size=16, max_workers=4)
+    assert np.array_equal(tiled, expected)
+
+
+def test_process_file_tiled_writes_memory_map(tmp_path):
+    image = np.full((40, 50, 3), 100, dtype=np.uint8)
+    np.save(tmp_path / "in.npy", image)
+    recipe = [Step("adjust_color_balance", {"red": 20})]
+
+    process_file_tiled(tmp_path / "in.npy", tmp_path / "out.npy", recipe, tile_size=16)
+    result = open_raw(tmp_path / "out.npy")
+    assert np.array_equal(result, adjust_color_balance(image, 20))
+
+
+def test_process_file_tiled_maps_uncompressed_tiffs(tmp_path):
+    image = np.random.default_rng(0).integers(0, 256, (60, 70, 3), dtype=np.uint8)
+    cv2.imwrite(str(tmp_path / "in.tiff"), image, [cv2.IMWRITE_TIFF_COMPRESSION, 1])
+    source = open_tiff(tmp_path / "in.tiff")
+    assert isinstance(source.base, np.memmap)
+    assert np.array_equal(source, image)
+    cv2.imwrite(str(tmp_path / "packed.tiff"), image)
+    assert open_tiff(tmp_path / "packed.tiff") is None
+
+    recipe = [Step("blur", {"blur_type": "gaussian", "kernel_size": 5})]
+    process_file_tiled(
+        tmp_path / "in.tiff", tmp_path / "out.tiff", recipe, tile_size=16
+    )
+    expected = blur(image, "gaussian", 5)
+    assert np.array_equal(cv2.imread(str(tmp_path / "out.tiff")), expected)
+    assert np.array_equal(open_tiff(tmp_path / "out.tiff"), expected)
+
+
+def test_run_batch_tiles_large_images(tmp_path, monkeypatch):
+    image = np.random.default_rng(0).integers(0, 256, (40, 50, 3), dtype=np.uint8)
+    cv2.imwrite(str(tmp_path / "a.png"), image)
+    calls = []
+    monkeypatch.setattr("puffy.core.batch.TILED_MIN_PIXELS", 40 * 50)
+    monkeypatch.setattr(
+        "puffy.core.tiling.process_file_tiled",
+        lambda *args, **kwargs: (
+            calls.append(args) or process_file_tiled(*args, **kwargs)
+        ),
+    )
+    recipe = parse_recipe([{"op": "adjust_gamma", "gamma": 1.5}])
+    (result,) = run_batch(recipe, [tmp_path / "a.png"], tmp_path)
+    assert result.ok and len(calls) == 1
+    assert np.array_equal(cv2.imread(str(result.output)), adjust_gamma(image, 1.5))
+
+    recipe = parse_recipe([{"op": "crop", "x": 0, "y": 0, "width": 10, "height": 10}])
+    (result,) = run_batch(recipe, [tmp_path / "a.png"], tmp_path)
+    assert result.ok and len(calls) == 1
+
+
+def test_lut_matches_per_pixel_math():
+    rng = np.random.default_rng(0)
+    image = rng.integers(0, 256, (50, 60, 3), dtype=np.uint8)
+
+    table = compile_lut(
+        [
+            ("adjust_brightness_contrast", {"brightness": -20, "contrast": 1.7}),
+            ("adjust_color_balance", {"red": 10, "green": 0, "blue": -40}),
+        ]
+    )
+    b, g, r = np.moveaxis(cv2.convertScaleAbs(image, alpha=1.7, beta=-20), 2, 0)
+    expected = np.stack([b - 40.0, g, r + 10.0], axis=2).clip(0, 255).astype(np.uint8)
+    assert np.array_equal(apply_lut(image, table), expected)
+
+
+def test_lut_is_cached_by_parameters():
+    chain = [
+        ("adjust_gamma", {"gamma": 2.2}),
+        ("apply_curve", {"points": [(0, 0), (255, 200)]}),
+    ]
+    assert compile_lut(chain) is compile_lut(chain)
+    assert not compile_lut(chain).flags.writeable
+
+
+def test_levels_and_gamma():
+    ramp = np.repeat(np.arange(256, dtype=np.uint8), 3).reshape(16, 16, 3)
+    levelled = adjust_levels(ramp, black=50, white=200)
+    assert levelled.min() == 0 and levelled.max() == 255
+    assert adjust_gamma(ramp, 2.0)[8, 0, 0] > ramp[8, 0, 0]
+
+
+def test_scale_step_keeps_preview_consistent():
+    image = np.zeros((800, 1200, 3), dtype=np.uint8)
+    pyramid = build_pyramid(image)
+    preview = select_level(pyramid, 400)
+    assert preview.shape == (200, 300, 3)
+
+    crop = scale_step(
+        Step("crop", {"x": 400, "y": 200, "width": 600, "height": 400}),
+        preview,
+        (1200, 800),
+    )
+    assert crop.kwargs == {"x": 100, "y": 50, "width": 150, "height": 100}
+    blurred = scale_step(Step("blur", {"kernel_size": 21}), preview, (1200, 800))
+    assert blurred.kwargs["kernel_size"] == 5
+
+
+def test_seeded_noise_is_reproducible():
+    image = np.full((20, 20, 3), 128, dtype=np.uint8)
+    assert np.array_equal(
+        add_noise(image, "gaussian", 0.1, seed=7),
+        add_noise(image, "gaussian", 0.1, seed=7),
+    )
+    assert np.array_equal(
+        add_noise(image, "salt_pepper", 0.1, seed=7),
+        add_noise(image, "salt_pepper", 0.1, seed=7),
+    )
+
+
+@pytest.mark.parametrize("ext", [".png", ".jpg", ".gif", ".tiff"])
+def test_sniff_image_reads_dimensions_from_header(ext):
+    data = encode_image(np.zeros((37, 53, 3), dtype=np.uint8), ext)
+    assert sniff_image(data) == (ext, 53, 37)
+    assert sniff_image(data[:6]) is None
+    assert sniff_image(data[:9]) is None
+    with pytest.raises(ValueError):
+        sniff_image(b"BM" + data)
+
+
+def test_encoder_options():
+    image = np.tile(np.arange(64, dtype=np.uint8), (64, 3, 1)).transpose(0, 2, 1)
+    fast = encode_image(image, ".png", png_compression=0)
+    small = encode_image(image, ".png", png_compression=9)
+    assert len(small) < len(fast)
+    assert np.array_equal(decode_image(small), image)
+
+    progressive = encode_image(image, ".jpg", 80, progressive=True)
+    assert b"\xff\xc2" in progressive  # progressive DCT frame header
+    assert decode_image(encode_image(image, ".webp", 80)).shape == image.shape
+
+
+def test_negotiate_format():
+    chrome = "image/avif,image/webp,image/apng,image/*,*/*;q=0.8"
+    assert negotiate_format(chrome, [".webp", ".jpg"]) == ".webp"
+    assert negotiate_format("image/png,image/webp;q=0", [".webp", ".png"]) == ".png"
+    assert negotiate_format(None, [".webp", ".png"]) == ".png"
+
+
+@pytest.mark.parametrize(
+    "noise_type", ["gaussian", "salt_pepper", "poisson", "speckle"]
+)
+def test_noise_is_independent_of_chunk_size(noise_type):
+    image = np.random.default_rng(1).integers(0, 256, (101, 67, 3), dtype=np.uint8)
+    whole = noise.add_noise(image, noise_type, 0.2, seed=3)
+    chunked = noise.add_noise(image, noise_type, 0.2, seed=3, chunk_size=500)
+
+    assert whole.dtype == np.uint8
+    assert np.array_equal(whole, chunked)
+    assert not np.array_equal(whole, image)
+    out = image.copy()
+    assert noise.add_noise(out, noise_type, 0.2, seed=3, out=out) is out
+    assert np.array_equal(out, whole)
+
+
+def test_blur_strategies():
+    image = np.random.default_rng(0).integers(0, 256, (54, 96, 3), dtype=np.uint8)
+    image = cv2.resize(image, (960, 540), interpolation=cv2.INTER_NEAREST)
+
+    assert blur_module.choose_strategy("gaussian", 5) == "separable"
+    assert blur_module.choose_strategy("gaussian", 151) == "box_cascade"
+    assert blur_module.choose_strategy("median", 51) == "histogram"
+
+    exact = cv2.GaussianBlur(image, (151, 151), 0)
+    approx = blur_module.blur(image, "gaussian", 151)
+    assert np.abs(approx.astype(int) - exact).mean() < 0.5
+    assert np.array_equal(
+        blur_module.blur(image, "gaussian", 4), cv2.GaussianBlur(image, (5, 5), 0)
+    )
+    assert blur_module.strategy_counts()["box_cascade"] >= 1
+
+
+@pytest.mark.parametrize(
+    ("blur_type", "kernel_size"), [("gaussian", 7), ("gaussian", 151), ("median", 5)]
+)
+def test_regional_blur_matches_whole_image(blur_type, kernel_size):
+    image = np.random.default_rng(0).integers(0, 256, (200, 240, 3), dtype=np.uint8)
+    whole = blur(image, blur_type, kernel_size)
+
+    roi = (30, 40, 100, 60)
+    region = blur(image, blur_type, kernel_size, roi=roi)
+    inside = np.zeros(image.shape[:2], dtype=bool)
+    inside[40:100, 30:130] = True
+    assert np.array_equal(region[inside], whole[inside])
+    assert np.array_equal(region[~inside], image[~inside])
+
+    mask = np.zeros(image.shape[:2], dtype=np.uint8)
+    mask[150:190, 180:230] = 1
+    mask[10, 5] = 1
+    masked = blur(image, blur_type, kernel_size, mask=mask)
+    assert np.array_equal(masked[mask != 0], whole[mask != 0])
+    assert np.array_equal(masked[mask == 0], image[mask == 0])
+
+
+def test_regional_filters_in_editor():
+    image = np.random.default_rng(1).integers(0, 256, (120, 160, 3), dtype=np.uint8)
+    image.flags.writeable = False
+
+    def chain(editor):
+        return (
+            editor.flip(horizontal=True)
+            .blur("gaussian", 5, roi=(10, 10, 50, 40))
+            .adjust_gamma(1.5, roi=(0, 60, 160, 60))
+            .crop(5, 5, 100, 100)
+        )
+
+    immediate = chain(ImageEditor(_image=image)).image
+    deferred = chain(ImageEditor(_image=image).defer()).image
+    assert np.array_equal(immediate, deferred)
+
+    # The region is written into the editor's own copy, not the source
+    editor = ImageEditor(_image=image).flip(horizontal=True)
+    flipped = editor._image
+    editor.adjust_gamma(2.0, roi=(0, 0, 10, 10))
+    assert editor._image is flipped
+    assert editor.image is flipped
+    assert np.array_equal(flipped[20:], image[20:, ::-1])
+
+    pipeline = Pipeline((160, 120))
+    pipeline.record("adjust_gamma", gamma=1.2)
+    pipeline.record("adjust_gamma", gamma=1.2, roi=(0, 0, 10, 10))
+    pipeline.record("adjust_gamma", gamma=1.2)
+    pipeline.record("crop", x=0, y=0, width=50, height=50)
+    # the crop cannot move ahead of the regional filter, whose roi would change
+    kinds = [stage.kind for stage in pipeline.plan()]
+    assert kinds == ["adjust_gamma", "adjust_gamma", "crop", "adjust_gamma"]
+
+
+def test_inplace_editor_allocates_at_most_two_frames():
+    image = np.random.default_rng(2).integers(0, 256, (1080, 1920, 3), dtype=np.uint8)
+    image.flags.writeable = False
+    ops = [
+        lambda e: e.flip(horizontal=True),
+        lambda e: e.rotate(15),
+        lambda e: e.blur("gaussian", 7),
+        lambda e: e.adjust_gamma(1.4),
+        lambda e: e.adjust_color_balance(10, 0, -10),
+        lambda e: e.adjust_brightness_contrast(5, 1.1),
+        lambda e: e.add_noise("gaussian", 0.05, seed=1),
+        lambda e: e.blur("median", 5),
+        lambda e: e.flip(vertical=True, horizontal=False),
+    ]
+
+    def run(editor):
+        # An op allocated a frame if memory peaked a frame above its start
+        allocations = 0
+        tracemalloc.start()
+        try:
+            for op in ops:
+                before = tracemalloc.get_traced_memory()[0]
+                tracemalloc.reset_peak()
+                op(editor)
+                if tracemalloc.get_traced_memory()[1] - before >= image.nbytes:
+                    allocations += 1
+        finally:
+            tracemalloc.stop()
+        return editor.image, allocations
+
+    expected, copying = run(ImageEditor(_image=image))
+    result, inplace = run(ImageEditor(_image=image, inplace=True))
+    assert np.array_equal(result, expected)
+    assert copying == len(ops)
+    assert inplace <= 2
+
+
+def test_inplace_editor_reuses_scratch_buffers():
+    image = np.random.default_rng(3).integers(0, 256, (60, 80, 3), dtype=np.uint8)
+    copy = image.copy()
+    editor = ImageEditor(_image=copy, inplace=True).adjust_gamma(2.0)
+    assert editor.image is copy  # pixel-wise filters write over the image
+    assert np.array_equal(copy, ImageEditor(_image=image).adjust_gamma(2.0).image)
+
+    clone = editor.clone().blur()
+    assert clone.image is not copy and clone.image.shape == copy.shape
+
+    pool = ScratchPool()
+    first = pool.take((60, 80, 3))
+    pool.give(first)
+    pool.give(image)  # not from the pool; ignored
+    assert pool.take((60, 80, 3)) is first
+    assert pool.take((60, 80, 3)) is not image
+    assert pool.stats() == {"allocated": 2, "reused": 1, "returned": 1, "dropped": 0}
@@ -0,0 +1,152 @@
+import asyncio
+import gc
+import os
+import threading
+import time
+from multiprocessing import resource_tracker
+
+import numpy as np
+import pytest
+
+from puffy import shm
+from puffy.core.editor import ImageEditor
+from puffy.executor import ExecutorBusyError, ImageExecutor, WorkerCrashedError
+from puffy.shm import shared_images
+
+
+@pytest.mark.asyncio
+async def test_run_returns_result():
+    pool = ImageExecutor(max_workers=2, max_queue_depth=0)
+    assert await pool.run(sum, [1, 2, 3]) == 6
+    stats = pool.stats()
+    assert stats["completed"] == 1
+    assert stats["running"] == 0
+    pool.shutdown()
+
+
+@pytest.mark.asyncio
+async def test_rejects_when_queue_is_full():
+    pool = ImageExecutor(max_workers=1, max_queue_depth=1)
+    release = threading.Event()
+    tasks = [asyncio.create_task(pool.run(release.wait)) for _ in range(2)]
+    await asyncio.sleep(0.05)
+
+    with pytest.raises(ExecutorBusyError):
+        await pool.run(release.wait)
+
+    release.set()
+    await asyncio.gather(*tasks)
+    assert pool.stats()["rejected"] == 1
+    pool.shutdown()
+
+
+@pytest.mark.asyncio
+async def test_speedup_under_concurrent_load():
+    pool = ImageExecutor(max_workers=4, max_queue_depth=0)
+    await asyncio.gather(*(pool.run(time.sleep, 0.05) for _ in range(4)))
+    assert pool.stats()["speedup"] > 2
+    pool.shutdown()
+
+
+def _crash(source, result_name):
+    from puffy import shm
+
+    shm.write(result_name, np.zeros((2, 2, 3), np.uint8))
+    os._exit(1)
+
+
+def test_process_backend_passes_images_in_shared_memory():
+    pool = ImageExecutor(max_workers=1, backend="process", processes=1)
+    image = np.random.default_rng(0).integers(0, 256, (64, 48, 3), dtype=np.uint8)
+    try:
+        blurred = pool.compute(image, "blur", {"kernel_size": 5})
+        expected = ImageEditor(_image=image).blur(kernel_size=5).image
+        np.testing.assert_array_equal(blurred, expected)
+        assert shared_images.handle(blurred) is not None
+        assert not blurred.flags.writeable
+
+        # A shared result goes back to a worker without another copy
+        shared = shared_images.stats()["shared"]
+        box = {"x": 8, "y": 4, "width": 16, "height": 8}
+        cropped = pool.compute(blurred, "crop", box)
+        np.testing.assert_array_equal(cropped, blurred[4:12, 8:24])
+        assert shared_images.stats()["shared"] == shared
+
+        with pytest.raises(ValueError):
+            pool.compute(blurred, "crop", {"x": 0, "y": 0, "width": 99, "height": 1})
+
+        segments = shared_images.stats()["segments"]
+        del blurred, cropped
+        gc.collect()
+        assert shared_images.stats()["segments"] == segments - 2
+    finally:
+        pool.shutdown()
+
+
+def test_segments_are_not_left_to_the_resource_tracker(monkeypatch):
+    registered = []
+    monkeypatch.setattr(
+        resource_tracker, "register", lambda name, rtype: registered.append(name)
+    )
+    image = np.zeros((4, 4, 3), np.uint8)
+    shared = shared_images.share(image)
+    name = shm.new_name()
+    shm.write(name, image)
+    adopted = shared_images.adopt(shm.ImageHandle(name, image.shape, image.dtype.str))
+    shared_images.discard(shm.new_name())
+    del shared, adopted
+    gc.collect()
+    assert registered == []
+
+
+def test_process_crash_unlinks_its_result():
+    pool = ImageExecutor(max_workers=1, backend="process", processes=1)
+    image = np.zeros((4, 4, 3), np.uint8)
+    try:
+        discarded = shared_images.stats()["discarded"]
+        with pytest.raises(WorkerCrashedError):
+            pool._in_process(_crash, image)
+        assert shared_images.stats()["discarded"] == discarded + 1
+        assert pool.stats()["process_crashes"] == 1
+
+        # The pool is replaced
+        flipped = pool.compute(image, "flip", {"horizontal": True})
+        assert flipped.shape == image.shape
+    finally:
+        pool.shutdown()
+
+
+@pytest.mark.asyncio
+async def test_single_flight_survives_cancelled_callers():
+    from puffy.inflight import SingleFlight
+
+    flight = SingleFlight()
+    calls = []
+
+    async def work():
+        calls.append(1)
+        await asyncio.sleep(0.05)
+        return len(calls)
+
+    first = asyncio.create_task(flight.run("key", work))
+    second = asyncio.create_task(flight.run("key", work))
+    await asyncio.sleep(0.01)
+    first.cancel()
+    assert await second == 1
+    assert flight.stats() == {"in_flight": 0, "started": 1, "shared": 1}
+
+
+def test_deletes_wait_for_the_last_reader():
+    from puffy.inflight import SourceReaders
+
+    readers = SourceReaders()
+    deleted = []
+    readers.acquire("a")
+    readers.acquire("a")
+    readers.delete("a", lambda: deleted.append("a"))
+    readers.release("a")
+    assert deleted == []
+    readers.release("a")
+    assert deleted == ["a"]
+    readers.delete("b", lambda: deleted.append("b"))
+    assert deleted == ["a", "b"]
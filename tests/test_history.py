@@ -0,0 +1,70 @@
+import numpy as np
+import pytest
+
+from puffy.core.editor import ImageEditor
+from puffy.core.pipeline import Step
+from puffy.history import EditHistory, HistoryStore
+
+
+def _image():
+    rng = np.random.default_rng(0)
+    return rng.integers(0, 256, (40, 60, 3), dtype=np.uint8)
+
+
+def test_rebuild_replays_from_nearest_keyframe():
+    image = _image()
+    history = HistoryStore(keyframe_interval=3)
+    history.start("v0", image)
+    steps = [
+        Step("crop", {"x": 5, "y": 5, "width": 40, "height": 30}),
+        Step("adjust_gamma", {"gamma": 1.5}),
+        Step("flip", {"horizontal": True}),
+        Step("blur", {"kernel_size": 3}),
+    ]
+    editor = ImageEditor(_image=image)
+    expected = []
+    for i, step in enumerate(steps, 1):
+        getattr(editor, step.op)(**step.kwargs)
+        result = editor.image.copy()
+        expected.append(result)
+        history.record(f"v{i - 1}", f"v{i}", (step,), lambda result=result: result)
+
+    assert history.stats()["keyframes"] == 2  # v0 and v3
+    for i, result in enumerate(expected, 1):
+        assert np.array_equal(history.rebuild(f"v{i}"), result)
+    assert history.move("v4", -1) == "v3"
+    assert history.move("v3", 1) == "v4"
+    with pytest.raises(IndexError):
+        history.move("v0", -1)
+
+
+def test_recording_after_undo_discards_redo_branch():
+    history = HistoryStore()
+    history.start("v0", _image())
+    history.record("v0", "v1", (Step("flip"),))
+    history.record("v1", "v2", (Step("flip"),))
+
+    assert history.record("v1", "w2", (Step("blur"),)) == ["v2"]
+    with pytest.raises(IndexError):
+        history.move("w2", 1)
+
+
+def test_memory_stays_bounded_over_many_edits():
+    image = _image()
+    history = EditHistory("v0", image, keyframe_interval=10, max_bytes=3 * image.nbytes)
+    for i in range(1, 300):
+        history.record(f"v{i - 1}", f"v{i}", (Step("flip"),), lambda: image)
+
+    assert history.nbytes <= 3 * image.nbytes
+    assert len(history.versions) <= 30
+    assert history.versions[0].keyframe is not None
+    assert history.versions[-1].image_id == "v299"
+
+
+def test_unseeded_noise_is_kept_as_keyframe():
+    history = EditHistory("v0", _image())
+    noisy = _image()
+    history.record("v0", "v1", (Step("add_noise", {"intensity": 0.2}),), lambda: noisy)
+
+    keyframe, steps = history.replay_plan("v1")
+    assert keyframe is noisy and steps == []
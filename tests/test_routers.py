@@ -46,3 +46,587 @@ async def test_download_image(test_image_path):
         image_id = response.text.split('value="')[1].split('"')[0]
         response = await ac.post("/download", data={"image_id": image_id, "format": "png"})
     assert response.status_code == 200
+
+@pytest.mark.asyncio
+async def test_executor_metrics():
+    async with AsyncClient(transport=ASGITransport(app=app), base_url="http://test") as ac:
+        response = await ac.get("/metrics/executor")
+    assert response.status_code == 200
+    assert "speedup" in response.json()
+
+@pytest.mark.asyncio
+async def test_chained_operations_skip_the_codec(test_image_path, monkeypatch, tmp_path):
+    from puffy.store import MemoryStore
+
+    # Only the memory store keeps versions decoded
+    store = MemoryStore(spill_dir=tmp_path)
+    for module in ("store", "handlers", "dependencies", "routers.batch", "routers.metrics"):
+        monkeypatch.setattr(f"puffy.{module}.store", store)
+
+    async with AsyncClient(transport=ASGITransport(app=app), base_url="http://test") as ac:
+        with open(test_image_path, "rb") as f:
+            response = await ac.post("/upload", files={"file": f})
+        image_id = response.text.split('value="')[1].split('"')[0]
+        encodes = store.stats()["encodes"]
+        for data in ({"kernel_size": 3}, {"kernel_size": 5}):
+            response = await ac.post("/blur", data={**data, "image_id": image_id})
+            image_id = response.text.split('value="')[1].split('"')[0]
+        assert store.stats()["encodes"] == encodes
+
+        response = await ac.get(f"/image/{image_id}")
+        assert response.status_code == 200
+        assert response.headers["content-type"] == "image/png"
+        assert store.stats()["encodes"] == encodes + 1
+
+
+@pytest.mark.asyncio
+async def test_batch_process(test_image_path):
+    import io
+    import json
+    import zipfile
+
+    archive = io.BytesIO()
+    with zipfile.ZipFile(archive, "w") as zf:
+        zf.write(test_image_path, "a.png")
+        zf.write(test_image_path, "b.png")
+    recipe = json.dumps([{"op": "resize", "width": 20, "height": 10}, {"op": "blur"}])
+
+    async with AsyncClient(
+        transport=ASGITransport(app=app), base_url="http://test"
+    ) as ac:
+        response = await ac.post(
+            "/batch",
+            data={"recipe": recipe},
+            files={"archive": ("images.zip", archive.getvalue(), "application/zip")},
+        )
+    assert response.status_code == 200
+    lines = [json.loads(line) for line in response.text.splitlines()]
+    assert [line["error"] for line in lines[:-1]] == [None, None]
+    assert lines[-1]["summary"]["succeeded"] == 2
+
+@pytest.mark.asyncio
+async def test_batch_rejects_wrong_typed_recipes(test_image_path):
+    import json
+
+    async with AsyncClient(
+        transport=ASGITransport(app=app), base_url="http://test"
+    ) as ac:
+        with open(test_image_path, "rb") as f:
+            response = await ac.post("/upload", files={"file": f})
+        image_id = response.text.split('value="')[1].split('"')[0]
+        for step in (
+            {"op": "crop", "x": "a", "y": 0, "width": 10, "height": 10},
+            {"op": "blur", "kernel_size": "x"},
+        ):
+            response = await ac.post(
+                "/batch", data={"recipe": json.dumps([step]), "image_ids": [image_id]}
+            )
+            assert response.status_code == 400
+
+
+@pytest.mark.asyncio
+async def test_batch_archive_limits(monkeypatch):
+    import io
+    import json
+    import zipfile
+
+    def archive(files):
+        data = io.BytesIO()
+        with zipfile.ZipFile(data, "w", zipfile.ZIP_DEFLATED) as zf:
+            for name, content in files.items():
+                zf.writestr(name, content)
+        return {"archive": ("images.zip", data.getvalue(), "application/zip")}
+
+    monkeypatch.setattr("puffy.routers.batch.MAX_UPLOAD_BYTES", 1 << 20)
+    monkeypatch.setattr("puffy.routers.batch.BATCH_MAX_BYTES", 3 << 20)
+    monkeypatch.setattr("puffy.routers.batch.BATCH_MAX_FILES", 5)
+    recipe = {"recipe": json.dumps([{"op": "blur"}])}
+    bombs = [
+        {"bomb.png": bytes(2 << 20)},
+        {f"{i}.png": bytes(900 << 10) for i in range(4)},
+        {f"{i}.txt": b"" for i in range(6)},
+    ]
+    async with AsyncClient(
+        transport=ASGITransport(app=app), base_url="http://test"
+    ) as ac:
+        for files in bombs:
+            response = await ac.post("/batch", data=recipe, files=archive(files))
+            assert response.status_code == 413
+
+
+@pytest.mark.asyncio
+async def test_preview_edits_and_commit(monkeypatch):
+    import cv2
+    import numpy as np
+
+    from puffy.previews import PreviewStore, preview_store
+
+    image = np.zeros((400, 600, 3), dtype=np.uint8)
+    image[:, 300:] = 255
+    # Images that fit the screen are previewed at full resolution
+    assert PreviewStore(max_side=600).preview_of("a", image) is image
+    assert PreviewStore(max_side=599).preview_of("a", image).shape == (200, 300, 3)
+    monkeypatch.setattr(preview_store, "max_side", 300)
+    png = cv2.imencode(".png", image)[1].tobytes()
+
+    async with AsyncClient(
+        transport=ASGITransport(app=app), base_url="http://test"
+    ) as ac:
+        response = await ac.post(
+            "/upload", files={"file": ("big.png", png, "image/png")}
+        )
+        image_id = response.text.split('value="')[1].split('"')[0]
+        response = await ac.post(
+            "/crop",
+            data={
+                "x": 100,
+                "y": 50,
+                "width": 400,
+                "height": 300,
+                "image_id": image_id,
+                "preview": "true",
+            },
+        )
+        image_id = response.text.split('value="')[1].split('"')[0]
+        region = {"roi_x": 50, "roi_y": 50, "roi_width": 200, "roi_height": 100}
+        response = await ac.post(
+            "/blur", data={"roi_x": 50, "image_id": image_id, "preview": "true"}
+        )
+        assert response.status_code == 422
+        response = await ac.post(
+            "/blur",
+            data={"kernel_size": 9, **region, "image_id": image_id, "preview": "true"},
+        )
+        pending_id = response.text.split('value="')[1].split('"')[0]
+
+        response = await ac.get(f"/preview/{pending_id}")
+        preview = cv2.imdecode(
+            np.frombuffer(response.content, np.uint8), cv2.IMREAD_COLOR
+        )
+        assert preview.shape == (150, 200, 3)
+
+        response = await ac.post("/commit", data={"image_id": pending_id})
+        committed_id = response.text.split('value="')[1].split('"')[0]
+        response = await ac.post(
+            "/download", data={"image_id": committed_id, "format": "png"}
+        )
+        full = cv2.imdecode(np.frombuffer(response.content, np.uint8), cv2.IMREAD_COLOR)
+        assert full.shape == (300, 400, 3)
+
+
+@pytest.mark.asyncio
+async def test_evicted_preview_versions_are_replayed(monkeypatch):
+    import cv2
+    import numpy as np
+
+    from puffy.previews import PreviewStore
+
+    store = PreviewStore(max_bytes=200 * 300 * 3, max_side=300)
+    monkeypatch.setattr("puffy.previews.preview_store", store)
+    monkeypatch.setattr("puffy.handlers.preview_store", store)
+    monkeypatch.setattr("puffy.dependencies.preview_store", store)
+    image = np.random.default_rng(0).integers(0, 256, (400, 600, 3), dtype=np.uint8)
+    png = cv2.imencode(".png", image)[1].tobytes()
+    crop = {"x": 100, "y": 50, "width": 400, "height": 300, "preview": "true"}
+
+    async with AsyncClient(
+        transport=ASGITransport(app=app), base_url="http://test"
+    ) as ac:
+        pending_ids = []
+        for _ in range(3):
+            response = await ac.post(
+                "/upload", files={"file": ("a.png", png, "image/png")}
+            )
+            image_id = response.text.split('value="')[1].split('"')[0]
+            response = await ac.post("/crop", data={**crop, "image_id": image_id})
+            pending_ids.append(response.text.split('value="')[1].split('"')[0])
+        assert store.get(pending_ids[0]) is None
+        assert store.stats()["bytes"] <= store.max_bytes
+
+        response = await ac.post(
+            "/blur",
+            data={"kernel_size": 3, "image_id": pending_ids[0], "preview": "true"},
+        )
+        assert response.status_code == 200
+        response = await ac.post("/commit", data={"image_id": pending_ids[1]})
+        assert response.status_code == 200
+        response = await ac.post(
+            "/download", data={"image_id": pending_ids[0], "format": "png"}
+        )
+    assert response.status_code == 200
+    full = cv2.imdecode(np.frombuffer(response.content, np.uint8), cv2.IMREAD_COLOR)
+    assert np.array_equal(full, image[50:350, 100:500])
+
+@pytest.mark.asyncio
+async def test_repeated_operation_hits_result_cache(test_image_path):
+    from puffy.result_cache import result_cache
+    from puffy.store import store
+
+    async with AsyncClient(
+        transport=ASGITransport(app=app), base_url="http://test"
+    ) as ac:
+        image_ids = []
+        for _ in range(2):
+            with open(test_image_path, "rb") as f:
+                response = await ac.post("/upload", files={"file": f})
+            image_ids.append(response.text.split('value="')[1].split('"')[0])
+
+        entries = result_cache.stats()["entries"]
+        await ac.post("/rotate", data={"angle": 33, "image_id": image_ids[0]})
+        hits = result_cache.stats()["hits"]
+        response = await ac.post(
+            "/rotate", data={"angle": 33.0, "image_id": image_ids[1]}
+        )
+        assert response.status_code == 200
+        assert result_cache.stats()["hits"] == hits + 1
+        if not store.caches_files:
+            # In-memory results are kept by reference, not written to disk
+            assert result_cache.stats()["entries"] == entries
+
+        # unseeded noise is never served from the cache
+        misses = result_cache.stats()["misses"]
+        image_id = response.text.split('value="')[1].split('"')[0]
+        await ac.post("/add-noise", data={"image_id": image_id})
+        assert result_cache.stats()["misses"] == misses
+
+@pytest.mark.asyncio
+async def test_concurrent_identical_requests_share_one_computation(test_image_path):
+    import asyncio
+
+    from puffy.inflight import single_flight, source_readers
+
+    async with AsyncClient(
+        transport=ASGITransport(app=app), base_url="http://test"
+    ) as ac:
+        with open(test_image_path, "rb") as f:
+            response = await ac.post("/upload", files={"file": f})
+        image_id = response.text.split('value="')[1].split('"')[0]
+
+        shared = single_flight.stats()["shared"]
+        blur = {"blur_type": "gaussian", "kernel_size": 9, "image_id": image_id}
+        resize = {"width": 20, "height": 20, "image_id": image_id}
+        responses = await asyncio.gather(
+            *(ac.post("/blur", data=blur) for _ in range(3)),
+            ac.post("/resize", data=resize),
+        )
+        assert [r.status_code for r in responses] == [200] * 4
+        ids = {r.text.split('value="')[1].split('"')[0] for r in responses[:3]}
+        assert len(ids) == 1
+        assert single_flight.stats()["shared"] == shared + 2
+        # The source was deleted once the resize stopped reading it
+        assert source_readers.stats()["pending_deletes"] == 0
+        response = await ac.post("/blur", data=blur)
+        assert response.status_code == 404
+
+@pytest.mark.asyncio
+async def test_batch_process_stored_images(test_image_path):
+    import json
+
+    async with AsyncClient(
+        transport=ASGITransport(app=app), base_url="http://test"
+    ) as ac:
+        with open(test_image_path, "rb") as f:
+            response = await ac.post("/upload", files={"file": f})
+        image_id = response.text.split('value="')[1].split('"')[0]
+        recipe = json.dumps([{"op": "flip"}, {"op": "adjust_gamma", "gamma": 2.0}])
+        response = await ac.post(
+            "/batch", data={"recipe": recipe, "image_ids": [image_id]}
+        )
+        lines = [json.loads(line) for line in response.text.splitlines()]
+        assert lines[0]["source"] == image_id
+        response = await ac.get(f"/image/{lines[0]['image_id']}")
+    assert response.status_code == 200
+
+
+@pytest.mark.asyncio
+async def test_undo_and_redo(test_image_path):
+    import cv2
+    import numpy as np
+
+    async with AsyncClient(
+        transport=ASGITransport(app=app), base_url="http://test"
+    ) as ac:
+        with open(test_image_path, "rb") as f:
+            response = await ac.post("/upload", files={"file": f})
+        original_id = response.text.split('value="')[1].split('"')[0]
+        response = await ac.post(
+            "/resize", data={"width": 50, "height": 40, "image_id": original_id}
+        )
+        resized_id = response.text.split('value="')[1].split('"')[0]
+        response = await ac.post(
+            "/flip",
+            data={"direction": "vertical", "image_id": resized_id, "preview": "true"},
+        )
+        flipped_id = response.text.split('value="')[1].split('"')[0]
+
+        response = await ac.post("/undo", data={"image_id": flipped_id})
+        assert response.text.split('value="')[1].split('"')[0] == resized_id
+        response = await ac.post("/undo", data={"image_id": resized_id})
+        assert response.text.split('value="')[1].split('"')[0] == original_id
+        response = await ac.post("/redo", data={"image_id": original_id})
+        assert response.text.split('value="')[1].split('"')[0] == resized_id
+
+        # The resized version was deleted by the undo and is replayed on demand
+        response = await ac.get(f"/image/{resized_id}")
+        image = cv2.imdecode(
+            np.frombuffer(response.content, np.uint8), cv2.IMREAD_COLOR
+        )
+    assert image.shape == (40, 50, 3)
+
+@pytest.mark.asyncio
+async def test_read_upload_rejects_oversized_images(test_image_path):
+    import io
+
+    from starlette.datastructures import UploadFile
+
+    from puffy.handlers import read_upload
+
+    data = test_image_path.read_bytes()
+    assert bytes(await read_upload(UploadFile(io.BytesIO(data)))) == data
+    with pytest.raises(ValueError, match="pixels"):
+        await read_upload(UploadFile(io.BytesIO(data)), max_pixels=100)
+    with pytest.raises(ValueError, match="bytes"):
+        await read_upload(UploadFile(io.BytesIO(data), size=len(data)), max_bytes=100)
+
+@pytest.mark.asyncio
+async def test_upload_rejects_non_images():
+    async with AsyncClient(
+        transport=ASGITransport(app=app), base_url="http://test"
+    ) as ac:
+        response = await ac.post(
+            "/upload", files={"file": ("fake.png", b"not an image at all")}
+        )
+    assert "Not a PNG, JPEG, GIF or TIFF image" in response.text
+
+
+@pytest.mark.asyncio
+async def test_download_is_cached_with_etag_and_range(test_image_path):
+    async with AsyncClient(
+        transport=ASGITransport(app=app), base_url="http://test"
+    ) as ac:
+        with open(test_image_path, "rb") as f:
+            response = await ac.post("/upload", files={"file": f})
+        image_id = response.text.split('value="')[1].split('"')[0]
+        url = f"/download/{image_id}?format=webp&quality=80"
+        full = await ac.get(url)
+        assert full.headers["content-type"] == "image/webp"
+        etag = full.headers["etag"]
+
+        response = await ac.get(url, headers={"If-None-Match": etag})
+        assert response.status_code == 304
+        response = await ac.get(url, headers={"Range": "bytes=10-19"})
+        assert response.status_code == 206
+        assert response.content == full.content[10:20]
+        assert response.headers["content-range"] == f"bytes 10-19/{len(full.content)}"
+        response = await ac.get(url, headers={"Range": f"bytes={len(full.content)}-"})
+        assert response.status_code == 416
+
+        response = await ac.get(
+            f"/preview/{image_id}", headers={"Accept": "image/webp,*/*"}
+        )
+        assert response.headers["content-type"] == "image/webp"
+        response = await ac.get(f"/preview/{image_id}", headers={"Accept": "image/png"})
+        assert response.headers["content-type"] == "image/png"
+
+
+@pytest.mark.asyncio
+async def test_server_timing_and_prometheus_metrics(test_image_path):
+    async with AsyncClient(
+        transport=ASGITransport(app=app), base_url="http://test"
+    ) as ac:
+        with open(test_image_path, "rb") as f:
+            response = await ac.post("/upload", files={"file": f})
+        image_id = response.text.split('value="')[1].split('"')[0]
+        # unseeded noise is never served from the result cache
+        response = await ac.post("/add-noise", data={"image_id": image_id})
+        stages = [
+            entry.split(";")[0]
+            for entry in response.headers["server-timing"].split(", ")
+        ]
+        for stage in ("handler", "queue", "compute", "store", "template", "total"):
+            assert stage in stages
+
+        response = await ac.get("/metrics")
+    assert 'puffy_operation_seconds_count{operation="add_noise"}' in response.text
+    assert (
+        'puffy_request_seconds_bucket{method="POST",route="/add-noise",le="+Inf"}'
+        in response.text
+    )
+
+
+def test_profiler_dumps_slow_requests(tmp_path):
+    import time
+
+    from puffy.instrumentation import SlowRequestProfiler
+
+    profiler = SlowRequestProfiler(threshold=0.05, interval=0.001, directory=tmp_path)
+    profiler.enable()
+    try:
+        start = time.perf_counter()
+        deadline = start + 0.1
+        while time.perf_counter() < deadline:
+            sum(range(1000))
+        path = profiler.finish("GET /slow", start, time.perf_counter() - start)
+        assert profiler.finish("GET /fast", start, 0.01) is None
+    finally:
+        profiler.disable()
+
+    lines = path.read_text().splitlines()
+    assert any("test_profiler_dumps_slow_requests" in line for line in lines)
+    assert all(line.rsplit(" ", 1)[1].isdigit() for line in lines)
+
+
+@pytest.mark.asyncio
+async def test_vector_shapes():
+    async with AsyncClient(
+        transport=ASGITransport(app=app), base_url="http://test"
+    ) as ac:
+        response = await ac.post("/vector/new", data={"width": 200, "height": 100})
+        svg_id = response.headers["location"].split("svg_id=")[1]
+        shape = {
+            "svg_id": svg_id,
+            "shape": "rect",
+            "x": 1,
+            "y": 2,
+            "width": 3,
+            "height": 4,
+            "fill": "red",
+            "stroke": "black",
+            "stroke_width": 1,
+        }
+        response = await ac.post("/vector/add-shape", data=shape)
+        assert response.json() == {"status": "ok"}
+        wide = {**shape, "stroke_width": 100000}
+        response = await ac.post("/vector/add-shape", data=wide)
+        assert response.status_code == 422
+
+        response = await ac.get(f"/vector/download/{svg_id}")
+    assert response.headers["content-type"] == "image/svg+xml"
+    assert response.text.count("<rect") == 2
+
+
+def test_vector_bulk_shapes_and_websocket():
+    from fastapi.testclient import TestClient
+
+    client = TestClient(app)
+    response = client.post(
+        "/vector/new", data={"width": 200, "height": 100}, follow_redirects=False
+    )
+    svg_id = response.headers["location"].split("svg_id=")[1]
+    rects = [
+        {"shape": "rect", "x": i, "y": i, "width": 2, "height": 2, "fill": "red"}
+        for i in range(50)
+    ]
+
+    with client.websocket_connect(f"/vector/ws/{svg_id}") as viewer:
+        with client.websocket_connect(f"/vector/ws/{svg_id}") as drawer:
+            drawer.send_json([{"shape": "line", "x1": 0, "y1": 0, "x2": 9, "y2": 9}])
+            assert drawer.receive_json()["status"] == "ok"
+            assert viewer.receive_json()["ops"][0]["shape"] == "line"
+
+            drawer.send_json([{"shape": "circle"}])
+            assert drawer.receive_json()["status"] == "error"
+
+        response = client.post(f"/vector/shapes/{svg_id}", json=rects)
+        assert len(response.json()["ids"]) == 50
+        assert len(viewer.receive_json()["ops"]) == 50
+
+    assert client.post(f"/vector/shapes/{svg_id}", json={}).status_code == 400
+    huge = [{"shape": "rect", "x": "1e999", "y": 0, "width": 1, "height": 1}]
+    assert client.post(f"/vector/shapes/{svg_id}", json=huge).status_code == 400
+    nested = {"shape": "rect", "x": 1, "y": 1, "width": 1, "height": 1}
+    for _ in range(40):
+        nested = {"shape": "group", "transform": "scale(1e9)", "children": [nested]}
+    assert client.post(f"/vector/shapes/{svg_id}", json=[nested]).status_code == 400
+    assert client.post("/vector/shapes/missing.svg", json=[]).status_code == 404
+    svg = client.get(f"/vector/download/{svg_id}").text
+    assert svg.count("<rect") == 51 and svg.count("<line") == 1
+
+
+def test_vector_rasterization():
+    from fastapi.testclient import TestClient
+
+    client = TestClient(app)
+    response = client.post(
+        "/vector/new", data={"width": 300, "height": 200}, follow_redirects=False
+    )
+    svg_id = response.headers["location"].split("svg_id=")[1]
+    client.post(
+        f"/vector/shapes/{svg_id}",
+        json=[{"shape": "ellipse", "cx": 150, "cy": 100, "rx": 80, "ry": 40}],
+    )
+
+    response = client.get(f"/vector/render/{svg_id}", params={"scale": 0.5})
+    assert response.headers["content-type"] == "image/png"
+    assert client.get(f"/vector/tiles/{svg_id}/0/0").status_code == 200
+    assert client.get(f"/vector/tiles/{svg_id}/9/0").status_code == 404
+    assert (
+        client.get(f"/vector/render/{svg_id}", params={"scale": 0}).status_code == 422
+    )
+
+    response = client.post("/vector/rasterize", data={"svg_id": svg_id, "scale": 2})
+    image_id = response.text.split('value="')[1].split('"')[0]
+    response = client.get(f"/download/{image_id}")
+    assert response.status_code == 200
+
+
+def test_vector_spatial_queries():
+    from fastapi.testclient import TestClient
+
+    client = TestClient(app)
+    response = client.post(
+        "/vector/new", data={"width": 400, "height": 400}, follow_redirects=False
+    )
+    svg_id = response.headers["location"].split("svg_id=")[1]
+    shapes = [
+        {
+            "shape": "rect",
+            "x": 20 * i,
+            "y": 20 * i,
+            "width": 10,
+            "height": 10,
+            "fill": "red",
+            "id": f"r{i}",
+        }
+        for i in range(20)
+    ]
+    client.post(f"/vector/shapes/{svg_id}", json=shapes)
+
+    hit = client.get(f"/vector/hit-test/{svg_id}", params={"x": 45, "y": 45}).json()
+    assert hit["shape"]["id"] == "r2" and hit["shape"]["shape"] == "rect"
+    box = {"x0": -5, "y0": -5, "x1": 65, "y1": 65}
+    assert client.get(f"/vector/select/{svg_id}", params=box).json()["ids"] == [
+        "r0",
+        "r1",
+        "r2",
+        "r3",
+    ]
+    assert client.get(
+        f"/vector/select/{svg_id}", params={**box, "mode": "contain"}
+    ).json()["ids"] == ["r0", "r1", "r2"]
+
+    response = client.get(
+        f"/vector/viewport/{svg_id}",
+        params={"x": 100, "y": 100, "width": 50, "height": 50},
+    )
+    # the background and r5..r7
+    assert response.headers["x-shape-count"] == "4"
+    assert response.text.count("<rect") == 4
+
+
+def test_shutdown_flushes_vector_edits(monkeypatch):
+    from fastapi.testclient import TestClient
+
+    from puffy.vector_store import journal_path, vector_store
+
+    # No background flushes: only the shutdown writes the edit
+    monkeypatch.setattr(vector_store, "_schedule_flush", lambda: None)
+    with TestClient(app) as client:
+        response = client.post(
+            "/vector/new", data={"width": 20, "height": 10}, follow_redirects=False
+        )
+        svg_id = response.headers["location"].split("svg_id=")[1]
+        rect = {"shape": "rect", "x": 1, "y": 1, "width": 2, "height": 2}
+        client.post(f"/vector/shapes/{svg_id}", json=[rect])
+        assert not journal_path(vector_store.path(svg_id)).exists()
+    assert journal_path(vector_store.path(svg_id)).read_bytes().count(b"\n") == 1
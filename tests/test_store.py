@@ -0,0 +1,50 @@
+import numpy as np
+import pytest
+
+from puffy.core.io import decode_image, encode_image
+from puffy.store import FilesystemStore, MemoryStore
+
+
+@pytest.fixture(params=["memory", "filesystem"])
+def image_store(request, tmp_path):
+    if request.param == "memory":
+        return MemoryStore(max_bytes=1_000_000, spill_dir=tmp_path)
+    return FilesystemStore(directory=tmp_path)
+
+
+def test_round_trip(image_store):
+    image = np.full((20, 30, 3), 7, dtype=np.uint8)
+    image_store.put("a.png", image)
+
+    assert "a.png" in image_store
+    assert np.array_equal(image_store.get("a.png"), image)
+    assert np.array_equal(decode_image(image_store.get_bytes("a.png")), image)
+    assert image_store.digest("a.png") == image_store.digest("a.png")
+
+    image_store.delete("a.png")
+    assert "a.png" not in image_store
+    with pytest.raises(KeyError):
+        image_store.get("a.png")
+
+
+def test_put_bytes_and_file(image_store, tmp_path):
+    image = np.full((10, 10, 3), 200, dtype=np.uint8)
+    image_store.put_bytes("b.png", encode_image(image, ".png"))
+    path = tmp_path / f"copy{image_store.file_suffix('b.png')}"
+    image_store.write_file("b.png", path)
+    image_store.put_file("c.png", path)
+
+    assert np.array_equal(image_store.get("c.png"), image)
+
+
+def test_memory_store_spills_and_restores(tmp_path):
+    image_store = MemoryStore(max_bytes=2 * 300, spill_dir=tmp_path)
+    for i in range(3):
+        image_store.put(f"{i}.png", np.full((10, 10, 3), i, dtype=np.uint8))
+
+    stats = image_store.stats()
+    assert stats["spills"] == 1
+    assert stats["bytes"] <= 600
+    assert image_store.get("0.png")[0, 0, 0] == 0
+    assert image_store.stats()["restores"] == 1
+    assert image_store.stats()["encodes"] == 0
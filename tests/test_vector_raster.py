@@ -0,0 +1,129 @@
+import numpy as np
+import pytest
+
+from puffy.core.vector import raster
+from puffy.core.vector.geometry import iter_outlines, parse_path, parse_transform
+from puffy.core.vector.shapes import apply_shape_ops, parse_shape_ops
+from puffy.tile_cache import TileCache
+from puffy.vector_store import VectorStore
+
+
+@pytest.fixture
+def vector_store(tmp_path, monkeypatch):
+    store = VectorStore(directory=tmp_path, flush_interval=60)
+    monkeypatch.setattr("puffy.tile_cache.vector_store", store)
+    store.create("a.svg", 100, 60)
+    return store
+
+
+def _add(store, *shapes):
+    with store.edit("a.svg") as editor:
+        apply_shape_ops(editor, parse_shape_ops(list(shapes)))
+
+
+def test_parse_color():
+    assert raster.parse_color("red") == (0, 0, 255)
+    assert raster.parse_color("#0f0") == (0, 255, 0)
+    assert raster.parse_color("rgb(1, 2, 3)") == (3, 2, 1)
+    assert raster.parse_color("none") is None
+
+
+def test_parse_path_and_transform():
+    (square,) = parse_path("M0 0 h10 v10 H0 z")
+    assert square.tolist() == [[0, 0], [10, 0], [10, 10], [0, 10], [0, 0]]
+    assert len(parse_path("M0 0 C 0 10 10 10 10 0")[0]) > 4
+    matrix = parse_transform("translate(5 1) scale(2)")
+    assert (matrix @ [1, 1, 1])[:2].tolist() == [7, 3]
+
+
+def test_render_rect_and_scale(vector_store):
+    _add(
+        vector_store,
+        {
+            "shape": "rect",
+            "x": 10,
+            "y": 10,
+            "width": 20,
+            "height": 10,
+            "fill": "blue",
+            "stroke": "none",
+        },
+    )
+    cache = TileCache(tile_size=32)
+
+    image = cache.render("a.svg")
+    assert image.shape == (60, 100, 3)
+    assert image[15, 20].tolist() == [255, 0, 0]
+    assert image[5, 5].tolist() == [255, 255, 255]
+
+    double = cache.render("a.svg", scale=2)
+    assert double.shape == (120, 200, 3)
+    assert double[30, 40].tolist() == [255, 0, 0]
+    # anti-aliased diagonal strokes produce intermediate values
+    _add(vector_store, {"shape": "line", "x1": 0, "y1": 0, "x2": 99, "y2": 40})
+    line = cache.render("a.svg")
+    assert len(np.unique(line[..., 1])) > 3
+
+
+def test_tiles_are_updated_incrementally(vector_store):
+    cache = TileCache(tile_size=32)
+    _add(
+        vector_store,
+        {"shape": "ellipse", "cx": 50, "cy": 30, "rx": 20, "ry": 10, "fill": "red"},
+    )
+    cache.render("a.svg")
+    rendered = cache.stats()["rendered"]
+
+    _add(
+        vector_store,
+        {
+            "shape": "group",
+            "transform": "translate(2 2)",
+            "children": [
+                {
+                    "shape": "path",
+                    "d": "M0 0 L 20 20",
+                    "stroke": "green",
+                    "stroke_width": 3,
+                },
+            ],
+        },
+    )
+    incremental = cache.render("a.svg")
+    stats = cache.stats()
+    assert stats["rendered"] == rendered
+    assert 0 < stats["updated"] < stats["tiles"]
+    assert stats["unchanged"] == stats["tiles"] - stats["updated"]
+
+    assert np.array_equal(incremental, TileCache(tile_size=32).render("a.svg"))
+    # OpenCV clips lines to each tile, which can move anti-aliased edges by a
+    # few levels compared to a single-tile rendering.
+    whole = TileCache(tile_size=1000).render("a.svg")
+    assert np.abs(incremental.astype(int) - whole).max() <= 16
+
+
+def test_render_limits(vector_store):
+    cache = TileCache(max_pixels=1000)
+    with pytest.raises(ValueError):
+        cache.render("a.svg")
+    with pytest.raises(IndexError):
+        cache.tile("a.svg", 1.0, 5, 0)
+    with pytest.raises(KeyError):
+        cache.render("missing.svg")
+
+
+def test_strokes_wider_than_opencv_allows_are_clamped(vector_store):
+    # Documents loaded from disk are not checked like shape operations
+    with vector_store.edit("a.svg") as editor:
+        editor.add_line(0, 0, 99, 40, stroke="red", stroke_width=100000)
+    cache = TileCache(tile_size=32)
+    image = cache.render("a.svg")
+    assert image[5, 90].tolist() == [0, 0, 255]
+    assert cache.tile("a.svg", 1.0, 0, 0).shape[:2] == (32, 32)
+
+
+def test_outlines_of_unknown_elements_are_skipped(vector_store):
+    with vector_store.edit("a.svg") as editor:
+        editor.root.append(editor.root.makeelement("text", {}))
+    outlines = list(iter_outlines(list(editor.root), (100, 60)))
+    assert len(outlines) == 1  # the background
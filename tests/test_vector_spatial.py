@@ -0,0 +1,90 @@
+import xml.etree.ElementTree as ET
+
+import numpy as np
+
+from puffy.core.vector.spatial import ShapeIndex, element_ids
+
+
+def _rect(x, y, w, h, i, fill="red", stroke="none"):
+    return ET.Element(
+        "rect",
+        {
+            "x": str(x),
+            "y": str(y),
+            "width": str(w),
+            "height": str(h),
+            "fill": fill,
+            "stroke": stroke,
+            "id": f"s{i}",
+        },
+    )
+
+
+def test_query_matches_a_linear_scan():
+    rng = np.random.default_rng(0)
+    boxes = rng.uniform(0, 1000, (2000, 2))
+    sizes = rng.uniform(1, 80, (2000, 2))
+    index = ShapeIndex((1000, 1000), np.eye(3), cell_size=32)
+    index.extend(
+        _rect(*b, *s, i) for i, (b, s) in enumerate(zip(boxes, sizes, strict=True))
+    )
+    index.extend([_rect(0, 0, 1000, 1000, "background")])
+
+    for x, y in rng.uniform(0, 1000, (20, 2)):
+        query = (x, y, x + 100, y + 50)
+        expected = [
+            i
+            for i, b in enumerate(index.boxes)
+            if b[0] <= query[2]
+            and query[0] <= b[2]
+            and b[1] <= query[3]
+            and query[1] <= b[3]
+        ]
+        assert index.query(query) == expected
+        assert index.query(query, start=1000, stop=1500) == [
+            i for i in expected if 1000 <= i < 1500
+        ]
+    assert index.query((-10, -10, 2000, 2000))[-1] == 2000
+
+
+def test_hit_test_finds_the_topmost_painted_shape():
+    index = ShapeIndex((100, 100), np.eye(3))
+    index.extend(
+        [
+            _rect(0, 0, 100, 100, 0, fill="white"),
+            _rect(10, 10, 50, 50, 1),
+            _rect(30, 30, 50, 50, 2, fill="none", stroke="black"),
+            ET.Element(
+                "line",
+                {
+                    "x1": "0",
+                    "y1": "90",
+                    "x2": "90",
+                    "y2": "90",
+                    "stroke": "blue",
+                    "stroke-width": "4",
+                    "id": "s3",
+                },
+            ),
+        ]
+    )
+
+    assert index.hit_test(40, 40) == 1  # inside the unfilled square
+    assert index.hit_test(30, 40) == 2  # on its outline
+    assert index.hit_test(50, 91.5) == 3
+    assert index.hit_test(50, 95) == 0
+    assert index.hit_test(50, 95, tolerance=4) == 3
+    assert index.hit_test(150, 150) is None
+
+
+def test_contained_and_ids():
+    index = ShapeIndex((100, 100), np.eye(3))
+    index.extend([_rect(10, 10, 10, 10, 0), _rect(15, 15, 30, 30, 1)])
+    g = ET.Element("g", {"transform": "translate(50 50)", "id": "group"})
+    g.append(_rect(0, 0, 5, 5, 2))
+    index.extend([g, ET.Element("text")])
+
+    assert element_ids(index, index.contained((0, 0, 25, 25))) == ["s0"]
+    assert element_ids(index, index.query((0, 0, 25, 25))) == ["s0", "s1"]
+    assert element_ids(index, index.query((52, 52, 53, 53))) == ["group"]
+    assert len(index) == 4 and index.boxes[3] is None
@@ -0,0 +1,183 @@
+import xml.etree.ElementTree as ET
+
+import pytest
+
+from puffy.vector_store import VectorStore
+
+SVG = "{http://www.w3.org/2000/svg}"
+
+
+def _rects(path):
+    return ET.parse(path).getroot().findall(f"{SVG}rect")
+
+
+def _shapes(data):
+    root = ET.fromstring(data)
+    return [(child.tag.rpartition("}")[2], child.attrib) for child in root]
+
+
+def test_edits_are_journaled(tmp_path):
+    store = VectorStore(directory=tmp_path, flush_interval=60)
+    store.create("a.svg", 100, 50)
+    assert len(_rects(tmp_path / "a.svg")) == 1  # the background
+
+    for i in range(10):
+        with store.edit("a.svg") as editor:
+            editor.add_rect(i, i, 5, 5, "red", "black", 1)
+
+    assert store.get_bytes("a.svg").count(b"<rect") == 11
+    assert store.flush() == 1
+    assert store.flush() == 0
+    # The snapshot is untouched; the new rects are in the journal
+    assert len(_rects(tmp_path / "a.svg")) == 1
+    assert len((tmp_path / "a.svg.journal").read_bytes().splitlines()) == 10
+    assert store.stats()["elements"] == 12
+    assert store.stats()["syncs"] == 1
+
+    reopened = VectorStore(directory=tmp_path)
+    assert _shapes(reopened.get_bytes("a.svg")) == _shapes(store.get_bytes("a.svg"))
+
+
+def test_journal_replay_survives_torn_writes(tmp_path):
+    store = VectorStore(directory=tmp_path, flush_interval=60)
+    store.create("a.svg", 100, 50)
+    for i in range(3):
+        with store.edit("a.svg") as editor:
+            editor.add_rect(i, i, 5, 5, element_id=f"r{i}")
+    store.flush()
+    journal = tmp_path / "a.svg.journal"
+    lines = journal.read_bytes().splitlines(keepends=True)
+    journal.write_bytes(b"".join(lines) + lines[-1][:20])
+
+    reopened = VectorStore(directory=tmp_path, flush_interval=60)
+    assert reopened.get_bytes("a.svg").count(b"<rect") == 4
+    assert journal.read_bytes() == b"".join(lines)  # the torn line is cut off
+    with reopened.edit("a.svg") as editor:
+        editor.add_rect(9, 9, 1, 1, element_id="r9")
+    reopened.flush()
+    again = VectorStore(directory=tmp_path)
+    assert again.get_bytes("a.svg").count(b"<rect") == 5
+
+
+def test_failed_edits_are_undone(tmp_path):
+    store = VectorStore(directory=tmp_path, flush_interval=60)
+    store.create("a.svg", 100, 50)
+    with pytest.raises(OverflowError):
+        with store.edit("a.svg") as editor:
+            editor.add_rect("1e999", 0, 5, 5, element_id="bad")
+    with pytest.raises(RuntimeError):
+        with store.edit("a.svg") as editor:
+            editor.add_rect(0, 0, 5, 5, element_id="aborted")
+            raise RuntimeError
+    assert len(store.index("a.svg")) == 1
+    for i in range(3):
+        with store.edit("a.svg") as editor:
+            editor.add_rect(i, i, 5, 5, element_id=f"r{i}")
+    store.flush()
+    assert store.stats()["elements"] == 5
+
+    reopened = VectorStore(directory=tmp_path)
+    ids = [attrib.get("id") for _, attrib in _shapes(reopened.get_bytes("a.svg"))]
+    assert ids[1:] == ["r0", "r1", "r2"]
+    assert len((tmp_path / "a.svg.journal").read_bytes().splitlines()) == 3
+
+
+def test_large_journals_are_folded_into_snapshots(tmp_path):
+    store = VectorStore(directory=tmp_path, flush_interval=60, journal_bytes=0)
+    store.create("a.svg", 100, 50)
+    # Lines already in the snapshot are skipped, e.g. after a crash that
+    # left the journal behind.
+    with store.edit("a.svg") as editor:
+        editor.add_rect(1, 1, 5, 5)
+    store.flush()
+    journal = (tmp_path / "a.svg.journal").read_bytes()
+    for i in range(20):
+        with store.edit("a.svg") as editor:
+            editor.add_rect(i, i, 5, 5)
+        store.flush()
+    assert store.stats()["snapshots"] >= 1
+    assert len(_rects(tmp_path / "a.svg")) > 2
+    (tmp_path / "a.svg.journal").write_bytes(
+        journal + (tmp_path / "a.svg.journal").read_bytes()
+    )
+
+    reopened = VectorStore(directory=tmp_path)
+    assert _shapes(reopened.get_bytes("a.svg")) == _shapes(store.get_bytes("a.svg"))
+    assert store.get_bytes("a.svg").count(b"<rect") == 22
+
+
+def test_documents_are_reloaded_after_eviction(tmp_path):
+    store = VectorStore(directory=tmp_path, max_elements=5, flush_interval=60)
+    store.create("a.svg", 10, 10)
+    with store.edit("a.svg") as editor:
+        editor.add_rect(1, 1, 2, 2, "red", "black", 1)
+    store.create("b.svg", 10, 10)
+    store.create("c.svg", 10, 10)
+
+    # a.svg was evicted and its pending edit journaled
+    assert store.stats()["evictions"] == 1
+    assert store.stats()["dirty"] == 0
+    assert store.get_bytes("a.svg").count(b"<rect") == 2
+    assert store.stats()["loads"] == 1
+
+
+def test_unknown_document(tmp_path):
+    store = VectorStore(directory=tmp_path)
+    with pytest.raises(KeyError):
+        with store.edit("missing.svg"):
+            pass
+
+
+def test_shape_ops_append_nested_groups(tmp_path):
+    from puffy.core.vector.shapes import apply_shape_ops, parse_shape_ops
+
+    ops = parse_shape_ops(
+        [
+            {"shape": "ellipse", "cx": 5, "cy": 5, "rx": 2, "ry": 3, "id": "e"},
+            {
+                "shape": "group",
+                "transform": "translate(1 2)",
+                "children": [
+                    {"shape": "line", "x1": 0, "y1": 0, "x2": 4, "y2": 4},
+                    {"shape": "path", "d": "M0 0 L3 3", "stroke_width": 2},
+                ],
+            },
+        ]
+    )
+    assert ops[0]["id"] == "e" and ops[1]["children"][0]["id"]
+
+    store = VectorStore(directory=tmp_path, flush_interval=60)
+    store.create("a.svg", 10, 10)
+    with store.edit("a.svg") as editor:
+        apply_shape_ops(editor, ops)
+    root = ET.fromstring(store.get_bytes("a.svg"))
+    assert [child.tag for child in root] == [
+        f"{SVG}{tag}" for tag in ("rect", "ellipse", "g")
+    ]
+    assert [child.tag for child in root[2]] == [f"{SVG}line", f"{SVG}path"]
+    assert store.stats()["elements"] == 6
+
+
+@pytest.mark.parametrize(
+    "data",
+    [
+        {"shape": "rect"},
+        [{"shape": "circle"}],
+        [{"shape": "rect", "x": 1}],
+        [{"shape": "line", "x1": 0, "y1": 0, "x2": 1, "y2": 1, "fill": "red"}],
+        [{"shape": "path", "d": "M0 0", "children": []}],
+        [{"shape": "path", "d": "M0 0", "parent": None}],
+        [{"shape": "rect", "x": "1e999", "y": 0, "width": 1, "height": 1}],
+        [{"shape": "rect", "x": float("nan"), "y": 0, "width": 1, "height": 1}],
+        [{"shape": "ellipse", "cx": 0, "cy": 0, "rx": "inf", "ry": 1}],
+        [{"shape": "path", "d": "M0 0 L1e999 0"}],
+        [{"shape": "group", "transform": "scale(1e300)"}],
+        [{"shape": "line", "x1": 0, "y1": 0, "x2": 1, "y2": 1, "stroke_width": 1e5}],
+        [{"shape": "line", "x1": 0, "y1": 0, "x2": 1, "y2": 1, "stroke_width": -1}],
+    ],
+)
+def test_invalid_shape_ops(data):
+    from puffy.core.vector.shapes import parse_shape_ops
+
+    with pytest.raises(ValueError):
+        parse_shape_ops(data)